@@ -7,28 +7,71 @@ An easy and Pythonic command-line interface parser.
  * Copyright (c) 2015-2016 TylerTemp, tylertempdev@gmail.com
 """
 
-from docpie.pie import Docpie
-from docpie.error import DocpieException, DocpieExit, DocpieError, \
-                         UnknownOptionExit, ExceptNoArgumentExit, \
-                         ExpectArgumentExit, \
-                         ExpectArgumentHitDoubleDashesExit, \
-                         AmbiguousPrefixExit
-from logging import getLogger
+import sys
 import warnings
 
 __all__ = ['docpie', 'Docpie',
            'DocpieException', 'DocpieExit', 'DocpieError',
            'UnknownOptionExit', 'ExceptNoArgumentExit',
            'ExpectArgumentExit', 'ExpectArgumentHitDoubleDashesExit',
-           'AmbiguousPrefixExit',
+           'AmbiguousPrefixExit', 'UnknownCommandExit', 'ErrorRecord',
            'logger']
 
-# it's not a good idea but it can avoid loop importing
-__version__ = Docpie._version
+# also `Docpie._version`
+__version__ = '0.4.4'
 
 __timestamp__ = 1684215839.7577085  # last sumbit
 
-logger = getLogger('docpie')
+# name: module. They are imported on the first access, so `import docpie`
+# itself costs nearly nothing, e.g. for a program loading the parsed doc
+# from a cache
+_lazy_attrs = {
+    'Docpie': 'docpie.pie',
+    'DocpieException': 'docpie.error',
+    'DocpieExit': 'docpie.error',
+    'DocpieError': 'docpie.error',
+    'UnknownOptionExit': 'docpie.error',
+    'ExceptNoArgumentExit': 'docpie.error',
+    'ExpectArgumentExit': 'docpie.error',
+    'ExpectArgumentHitDoubleDashesExit': 'docpie.error',
+    'AmbiguousPrefixExit': 'docpie.error',
+    'UnknownCommandExit': 'docpie.error',
+    'ErrorRecord': 'docpie.error',
+}
+
+
+def _load(name):
+    if name == 'logger':
+        from logging import getLogger
+        value = getLogger('docpie')
+    else:
+        module = __import__(_lazy_attrs[name], fromlist=[name])
+        value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name == 'logger' or name in _lazy_attrs:
+            return _load(name)
+        # the submodules, e.g. `docpie.pie`, which `import docpie` imported
+        # before
+        if not name.startswith('__'):
+            from importlib import import_module
+            from importlib.util import find_spec
+            if find_spec('%s.%s' % (__name__, name)) is not None:
+                return import_module('%s.%s' % (__name__, name))
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()).union(_lazy_attrs, ['logger']))
+else:
+    # no module `__getattr__` (PEP 562)
+    for _name in list(_lazy_attrs) + ['logger']:
+        _load(_name)
+    del _name
 
 
 def docpie(doc, argv=None, help=True, version=None,
@@ -36,7 +79,9 @@ def docpie(doc, argv=None, help=True, version=None,
            helpstyle='python',
            auto2dashes=True, name=None, case_sensitive=False,
            optionsfirst=False, appearedonly=False, namedoptions=False,
-           extra=None):
+           extra=None, cache=None, lazy=False, maxexpansion=None,
+           tokencache=1024, errorrecord=False,
+           stats=False):
     """
     Parse `argv` based on command-line interface described in `doc`.
 
@@ -84,6 +129,31 @@ def docpie(doc, argv=None, help=True, version=None,
         customize pre-handled options. See
         http://docpie.comes.today/document/advanced-apis/
         for more infomation.
+    cache: str, True or docpie.cache.DocpieCache (default: None)
+        a directory to cache the parsed `doc`. Next time the same `doc` with
+        the same config will be loaded from the cache instead of being parsed
+        again. True means the default directory (`$DOCPIE_CACHE_DIR`, or
+        `docpie` under `$XDG_CACHE_HOME` / `~/.cache`)
+    lazy: bool (default: False)
+        parse `doc` only when needed, so the auto handlers (e.g. `--help`,
+        `--version`) can exit without parsing it.
+    maxexpansion: int (default: None)
+        a usage like `(a|b) (c|d)` is expanded into usages `a c`, `a d`,
+        `b c`, `b d` before matching. If a usage expands to more than
+        `maxexpansion` usages, it's kept as it is and the expanded usages
+        are generated one by one when matching. None means always expand.
+    tokencache: int (default: 1024)
+        how many argv tokens' classification (option or not) to cache, the
+        least recently used ones are dropped. None means unbounded, 0 means
+        no caching. The counters are in `Docpie.token_cache.info()`.
+    errorrecord: bool (default: False)
+        when set True, a failed match returns a `docpie.ErrorRecord`
+        (which is false) instead of raising `DocpieExit`. The help text is
+        only rendered when its `message` is accessed.
+    stats: bool (default: False)
+        when set True, the time of each phase and the counts of the
+        operations are added up in the `stats` of the returned `Docpie`.
+        See `docpie.stats`.
     Returns
     -------
     args : dict
@@ -126,6 +196,9 @@ def docpie(doc, argv=None, help=True, version=None,
         warnings.warn('`case_sensitive` is deprecated, `docpie` is always '
                       'case insensitive')
 
+    from docpie.pie import Docpie
+    from docpie.error import ErrorRecord
+
     # kwargs = locals()
     # argv = kwargs.pop('argv')
     pie = Docpie(doc, help, version,
@@ -133,8 +206,11 @@ def docpie(doc, argv=None, help=True, version=None,
                  helpstyle,
                  auto2dashes, name, case_sensitive,
                  optionsfirst, appearedonly, namedoptions,
-                 extra)
-    pie.docpie(argv)
+                 extra, cache, lazy, maxexpansion, tokencache,
+                 errorrecord, stats)
+    result = pie.docpie(argv)
+    if isinstance(result, ErrorRecord):
+        return result
     return pie
 
 
@@ -0,0 +1,8 @@
+"""
+Benchmarks of docpie. Each module is runnable, e.g.
+
+    python -m docpie.bench.expansion
+
+and `python -m docpie.bench` runs them all as one suite, see
+`docpie.bench.suite`.
+"""
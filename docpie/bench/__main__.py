@@ -0,0 +1,5 @@
+import sys
+
+from docpie.bench.suite import main
+
+sys.exit(main())
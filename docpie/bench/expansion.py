@@ -0,0 +1,74 @@
+"""
+Compare the expanded usages with `BranchedUsage` (`maxexpansion`).
+
+The doc `prog (a0|b0) (a1|b1) ... (aN|bN)` expands to 2**N usages, and is
+matched with `prog b0 b1 ... bN`, the last one of the expansions. With
+`--options` it's `prog (--a0=<v>|--b0) ... (--aN=<v>|--bN)` matched with
+`prog --b0 --b1 ... --bN`.
+
+Usage:
+    python -m docpie.bench.expansion [options]
+
+Options:
+    -n, --max=<n>       The max number of `Either` [default: 12]
+    -r, --repeat=<n>    Take the best of <n> runs [default: 3]
+    -o, --options       Use options instead of commands
+"""
+
+import time
+
+from docpie import Docpie
+
+
+def make_doc(num, options=False):
+    pattern = '(--a%d=<v>|--b%d)' if options else '(a%d|b%d)'
+    return 'Usage: prog %s' % ' '.join(
+        pattern % (x, x) for x in range(num))
+
+
+def make_argv(num, options=False):
+    pattern = '--b%d' if options else 'b%d'
+    return ['prog'] + [pattern % x for x in range(num)]
+
+
+def best_of(repeat, func):
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        cost = time.time() - start
+        if result is None or cost < result:
+            result = cost
+    return result
+
+
+def measure(num, maxexpansion, repeat, options=False):
+    """Return the seconds of parsing the doc and of matching"""
+    doc = make_doc(num, options)
+    argv = make_argv(num, options)
+    parse = best_of(repeat,
+                    lambda: Docpie(doc, maxexpansion=maxexpansion))
+    pie = Docpie(doc, maxexpansion=maxexpansion)
+    match = best_of(repeat, lambda: pie.docpie(argv))
+    return parse, match
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.expansion')
+    args.docpie(argv)
+    max_num = int(args['--max'])
+    repeat = int(args['--repeat'])
+    options = args['--options']
+
+    print('%6s %10s | %10s %10s | %10s %10s' % (
+        'either', 'usages', 'expand', 'match', 'branch', 'match'))
+    for num in range(1, max_num + 1):
+        expanded = measure(num, None, repeat, options)
+        branched = measure(num, 0, repeat, options)
+        print('%6d %10d | %9.2fms %9.2fms | %9.2fms %9.2fms' % (
+            (num, 2 ** num) +
+            tuple(x * 1000 for x in expanded + branched)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare parsing and matching with `docpie.log` disabled and enabled.
+
+The "docpie" logger is set to WARNING and the logging is forced on by
+`log.enable()`, so no message is emitted: the difference is the cost of
+the debug calls themselves.
+
+Usage:
+    python -m docpie.bench.log [options]
+
+Options:
+    -n, --number=<n>    Parse the doc and match each argv <n> times
+                        [default: 500]
+"""
+
+import time
+import logging
+
+from docpie import Docpie, log
+from docpie.bench.match import DOC, ARGV
+
+
+def measure(number):
+    start = time.time()
+    for _ in range(number):
+        Docpie(DOC)
+    parse = time.time() - start
+
+    pie = Docpie(DOC)
+    start = time.time()
+    for _ in range(number):
+        for argv in ARGV:
+            pie.docpie(argv)
+    return parse, time.time() - start
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.log')
+    args.docpie(argv)
+    number = int(args['--number'])
+
+    logger = logging.getLogger('docpie')
+    old_level, old_forced = logger.level, log.forced
+    logger.setLevel(logging.WARNING)
+    try:
+        for name, enabled in (('disabled', False), ('enabled', True)):
+            log.enable(enabled)
+            parse, match = measure(number)
+            print('%-10s parse %8.1fus/doc  match %8.1fus/argv' % (
+                name, parse * 1e6 / number,
+                match * 1e6 / number / len(ARGV)))
+    finally:
+        logger.setLevel(old_level)
+        log.enable(old_forced)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Match the argvs of a git-like doc.
+
+Usage:
+    python -m docpie.bench.match [options]
+
+Options:
+    -n, --number=<n>    Match each argv <n> times [default: 2000]
+"""
+
+import time
+
+from docpie import Docpie
+
+DOC = '''
+Usage:
+    prog clone [-q] [--depth=<n>] <repo> [<dir>]
+    prog add [-nv] [--force] <path>...
+    prog commit [-a] [-m <msg>]
+    prog push [-f] [<remote>] [<branch>]
+    prog [options] <file>...
+
+Options:
+    -q, --quiet
+    -v, --verbose
+    -n, --dry-run
+    -f, --force
+    -a, --all
+    -m <msg>
+    --depth=<n>
+'''
+
+ARGV = (
+    'prog clone -q --depth 1 url dir',
+    'prog add -nv a b c d e f g h',
+    'prog commit -a -m msg',
+    'prog push -f origin master',
+    'prog -qv x y z',
+)
+
+
+def measure(number):
+    pie = Docpie(DOC)
+    start = time.time()
+    for _ in range(number):
+        for argv in ARGV:
+            pie.docpie(argv)
+    return time.time() - start
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.match')
+    args.docpie(argv)
+    number = int(args['--number'])
+    cost = measure(number)
+    print('%8.2fs %8.1fus/argv' % (cost, cost * 1e6 / number / len(ARGV)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure the memory of a parsed `Docpie` with `tracemalloc`, on a large
+synthetic spec where each usage line expands into many usages.
+
+Usage:
+    python -m docpie.bench.memory [options]
+
+Options:
+    -c, --commands=<n>  Number of usage lines [default: 200]
+    -b, --branches=<n>  Number of choices in each `(a|b|...)`, each line
+                        expands into <n>*<n> usages [default: 4]
+"""
+
+import gc
+
+try:
+    import tracemalloc
+except ImportError:
+    # python < 3.4
+    tracemalloc = None
+
+from docpie import Docpie
+from docpie.element import Atom
+
+
+def make_doc(commands, branches):
+    lines = ['Usage:']
+    for index in range(commands):
+        first = '|'.join('a%d' % x for x in range(branches))
+        second = '|'.join('b%d' % x for x in range(branches))
+        lines.append('    prog cmd%d (%s) (%s) [-v] [--out=<file>] '
+                     '[--level=<n>] <src> <dst>...' % (index, first, second))
+    lines.extend([
+        '',
+        'Options:',
+        '    -v, --verbose',
+        '    -o, --out=<file>',
+        '    -l, --level=<n>  [default: 0]',
+    ])
+    return '\n'.join(lines)
+
+
+def count_atoms(pie):
+    total = 0
+    todo = list(pie.usages)
+    while todo:
+        each = todo.pop()
+        if isinstance(each, Atom):
+            total += 1
+            if getattr(each, 'ref', None) is not None:
+                todo.append(each.ref)
+        elif isinstance(each, list):
+            todo.extend(each)
+    return total
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.memory')
+    args.docpie(argv)
+    if tracemalloc is None:
+        print('tracemalloc needs python 3.4+')
+        return
+    doc = make_doc(int(args['--commands']), int(args['--branches']))
+
+    gc.collect()
+    tracemalloc.start()
+    pie = Docpie(doc)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    atoms = count_atoms(pie)
+    print('%d usages, %d atoms' % (len(pie.usages), atoms))
+    print('retained %8.1f KiB (%5.0f bytes/atom)' % (
+        current / 1024.0, float(current) / atoms))
+    print('peak     %8.1f KiB' % (peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Match a long list of arguments, e.g. `xargs prog`.
+
+Usage:
+    python -m docpie.bench.positional [options] [<size>...]
+
+Options:
+    -r, --repeat=<n>    Take the best of <n> runs [default: 3]
+
+The default sizes are 1000, 100000 and 1000000. The time per argument
+should stay about the same as the size grows.
+"""
+
+import time
+
+from docpie import Docpie
+
+DOC = '''
+Usage: prog [-v] [-o <dir>] <file>...
+
+Options:
+    -v, --verbose
+    -o, --output=<dir>
+'''
+
+SIZES = (1000, 100000, 1000000)
+
+
+def measure(size, repeat):
+    pie = Docpie(DOC)
+    argv = ['prog', '-v'] + ['file%d' % x for x in range(size)]
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        args = pie.docpie(argv)
+        cost = time.time() - start
+        assert len(args['<file>']) == size
+        if result is None or cost < result:
+            result = cost
+    return result
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.positional')
+    args.docpie(argv)
+    sizes = [int(x) for x in args['<size>']] or SIZES
+    repeat = int(args['--repeat'])
+
+    print('%10s %12s %12s' % ('size', 'total', 'per arg'))
+    for size in sizes:
+        cost = measure(size, repeat)
+        print('%10d %11.3fs %10.3fus' % (size, cost, cost * 1e6 / size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compare the cold start of a `Docpie`: parsing the doc, loading the JSON of
+`to_dict` with `from_dict`, and loading the binary form of
+`docpie.serialize`. The docs are the bundled examples in `docpie/example`
+and the one of `docpie.compile`.
+
+Usage:
+    python -m docpie.bench.serialize [options]
+
+Options:
+    -n, --number=<n>    Load each doc <n> times [default: 300]
+"""
+
+import json
+import time
+
+from docpie import Docpie
+from docpie import compile as docpie_compile
+from docpie.serialize import dumps, loads
+from docpie.bench.suite import example_doc
+
+DOCS = (
+    ('naval_fate', example_doc('naval_fate')),
+    ('git', example_doc('git/git')),
+    ('git_commit', example_doc('git/git_commit')),
+    ('docpie.compile', docpie_compile.__doc__),
+)
+
+
+def measure(func, number):
+    start = time.time()
+    for _ in range(number):
+        func()
+    return (time.time() - start) * 1e6 / number
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench.serialize')
+    args.docpie(argv)
+    number = int(args['--number'])
+
+    print('%-16s %10s %10s %10s %8s %8s' % (
+        'doc', 'parse', 'json', 'binary', 'json(B)', 'bin(B)'))
+    for name, doc in DOCS:
+        pie = Docpie(doc)
+        json_data = json.dumps(pie.to_dict())
+        binary_data = dumps(pie)
+        print('%-16s %8.1fus %8.1fus %8.1fus %8d %8d' % (
+            name,
+            measure(lambda: Docpie(doc), number),
+            measure(lambda: Docpie.from_dict(json.loads(json_data)), number),
+            measure(lambda: loads(binary_data), number),
+            len(json_data), len(binary_data)))
+
+
+if __name__ == '__main__':
+    main()
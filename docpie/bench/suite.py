@@ -0,0 +1,379 @@
+"""
+Run all the measurements at once and write them as JSON, or compare two
+results to find the regressions.
+
+Each spec is measured for constructing a `Docpie`, matching, `to_dict`,
+`from_dict` and the memory (peak and retained, by `tracemalloc`). The
+specs are the docs of `docpie/example` and some synthetic ones from the
+other benchmarks. The time of `import docpie` is measured in a new
+interpreter each time, and by `-X importtime` (python 3.7+).
+
+Usage:
+    python -m docpie.bench compare [options] <old> <new>
+    python -m docpie.bench importtime [options]
+    python -m docpie.bench [options] [<spec>...]
+
+Options:
+    -n, --number=<n>        Run each measurement <n> times [default: 20]
+    -r, --repeat=<n>        Take the best of <n> runs [default: 3]
+    -o, --output=<file>     Write the JSON into <file> instead of stdout
+    -t, --threshold=<pct>   When comparing, a metric more than <pct>
+                            percent larger than the old one is a
+                            regression [default: 10]
+    -b, --budget=<us>       With `importtime`, the most microseconds
+                            `from docpie import Docpie` may take
+
+Only the specs whose name contains one of <spec> are measured. `compare`
+exits with 1 when there is any regression, and `importtime`, which shows
+where the import time goes, exits with 1 when it's over the budget.
+"""
+
+import ast
+import gc
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # python < 3.4
+    tracemalloc = None
+
+import docpie
+from docpie import Docpie
+from docpie.error import DocpieError
+from docpie.element import Option, Command, Argument, Unit, Either, \
+                           OptionsShortcut, BranchedUsage
+from docpie.bench import expansion, match, memory, positional
+
+__all__ = ['example_doc', 'specs', 'sample_argv', 'parse_importtime', 'run',
+           'compare', 'importtime', 'main']
+
+# all the metrics are "smaller is better"
+METRICS = ('construct_us', 'match_us', 'to_dict_us', 'from_dict_us',
+           'peak_kib', 'retained_kib')
+
+# `help` and `version` would exit when an argv matches `-h`/`--version`
+CONFIG = {'help': False, 'version': None, 'errorrecord': True}
+
+# argvs sampled from the usages of a spec at most
+MAX_ARGV = 8
+
+# measured by `-X importtime`, the last one is checked by `--budget`
+IMPORT_STATEMENTS = ('import docpie', 'from docpie import Docpie')
+
+
+EXAMPLE_FOLDER = os.path.join(os.path.dirname(docpie.__file__), 'example')
+
+
+def example_doc(name):
+    """Return the docstring of the example `name`, e.g. `git/git`, None if
+    it has none. The example is not run"""
+    path = os.path.join(EXAMPLE_FOLDER, *(name + '.py').split('/'))
+    with open(path) as f:
+        return ast.get_docstring(ast.parse(f.read()), clean=False)
+
+
+def specs():
+    """Return [(name, doc, argvs or None)], argvs None means sampling them
+    from the usages. The examples which need extra config are skipped"""
+    result = []
+    folder = EXAMPLE_FOLDER
+    for path in sorted(glob.glob(os.path.join(folder, '*.py')) +
+                       glob.glob(os.path.join(folder, 'git', '*.py'))):
+        name = os.path.relpath(path, folder)[:-len('.py')]
+        name = name.replace(os.sep, '/')
+        doc = example_doc(name)
+        if not doc:
+            continue
+        try:
+            Docpie(doc, **CONFIG)
+        except DocpieError:
+            # e.g. the one with customized section titles
+            continue
+        result.append(('example/' + name, doc, None))
+
+    result.extend((
+        ('synthetic/git', match.DOC, list(match.ARGV)),
+        ('synthetic/expansion-8', expansion.make_doc(8),
+         [expansion.make_argv(8)]),
+        ('synthetic/positional-1000', positional.DOC,
+         [['prog', '-v'] + ['file%d' % x for x in range(1000)]]),
+        ('synthetic/large', memory.make_doc(20, 4), None),
+    ))
+    return result
+
+
+def _sample(element, result):
+    if isinstance(element, BranchedUsage):
+        _sample(element.usage, result)
+    elif isinstance(element, Option):
+        result.append(sorted(element.names)[0])
+        if element.ref is not None:
+            # the values of an option, `--baud=9600` is a `Command` in ref
+            result.extend('x' for _ in sample_argv(element.ref)[1:])
+    elif isinstance(element, Command):
+        result.append(sorted(element.names)[0])
+    elif isinstance(element, Argument):
+        result.append('x')
+    elif isinstance(element, Either):
+        _sample(element[0], result)
+    elif isinstance(element, Unit):
+        for each in element:
+            _sample(each, result)
+    else:
+        assert isinstance(element, OptionsShortcut), element
+
+
+def sample_argv(usage):
+    """Return an argv which walks through `usage`: the first branch of
+    each `Either`, the optional elements included"""
+    result = ['prog']
+    _sample(usage, result)
+    return result
+
+
+def best_of(repeat, number, func):
+    """Return the best time of calling `func` in seconds"""
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            func()
+        cost = (time.time() - start) / number
+        if result is None or cost < result:
+            result = cost
+    return result
+
+
+def _env():
+    # the docpie measured is this one
+    env = dict(os.environ)
+    path = os.path.dirname(os.path.dirname(os.path.abspath(docpie.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [path] + [x for x in [env.get('PYTHONPATH')] if x])
+    return env
+
+
+def measure_import(repeat):
+    """Return the time of `import docpie` in ms, without the start of the
+    interpreter itself"""
+    env = _env()
+
+    def run_code(code):
+        return lambda: subprocess.check_call([sys.executable, '-c', code],
+                                             env=env)
+
+    base = best_of(repeat, 1, run_code('pass'))
+    cost = best_of(repeat, 1, run_code('import docpie'))
+    return max(cost - base, 0) * 1e3
+
+
+def parse_importtime(text):
+    """Return [(module, self us, cumulative us, depth)] of the output of
+    `-X importtime`"""
+    result = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # the header
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return result
+
+
+def measure_importtime(statement, repeat):
+    """Return (us, modules) of the best of `repeat` runs of `statement` by
+    `-X importtime`: the cumulative time of the docpie modules imported at
+    top level, and the result of `parse_importtime`. None if not
+    supported"""
+    if sys.version_info < (3, 7):
+        return None
+    env = _env()
+    # the modules are cached by `python -m compileall` or the first run
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    best = None
+    for _ in range(repeat + 1):
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', statement],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+        modules = parse_importtime(err.decode('utf-8', 'replace'))
+        total = sum(cumulative for name, _, cumulative, depth in modules
+                    if depth == 0 and name.split('.')[0] == 'docpie')
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def measure_memory(doc):
+    """Return (peak, retained) KiB of constructing a `Docpie`, or
+    (None, None) if `tracemalloc` is not available"""
+    if tracemalloc is None or tracemalloc.is_tracing():
+        return None, None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        pie = Docpie(doc, **CONFIG)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del pie
+    return peak / 1024.0, current / 1024.0
+
+
+def measure_spec(doc, argvs, number, repeat):
+    pie = Docpie(doc, **CONFIG)
+    if argvs is None:
+        argvs = [sample_argv(x) for x in pie.usages[:MAX_ARGV]]
+
+    def match():
+        for argv in argvs:
+            pie.docpie(argv)
+
+    data = pie.to_dict()
+    peak, retained = measure_memory(doc)
+    return {
+        'construct_us':
+            best_of(repeat, number, lambda: Docpie(doc, **CONFIG)) * 1e6,
+        'match_us': best_of(repeat, number, match) * 1e6 / len(argvs),
+        'to_dict_us': best_of(repeat, number, pie.to_dict) * 1e6,
+        'from_dict_us':
+            best_of(repeat, number, lambda: Docpie.from_dict(data)) * 1e6,
+        'peak_kib': peak,
+        'retained_kib': retained,
+        'usages': len(pie.usages),
+        'argvs': len(argvs),
+    }
+
+
+def run(number, repeat, names=None, out=None):
+    """Measure the specs whose name contains one of `names` (all if not
+    given), return the result as a dict for JSON"""
+    result = {
+        'docpie': docpie.__version__,
+        'python': '%s %s' % (platform.python_implementation(),
+                             platform.python_version()),
+        'number': number,
+        'repeat': repeat,
+        'import_ms': measure_import(repeat),
+        'importtime_us': {},
+        'specs': {},
+    }
+    for statement in IMPORT_STATEMENTS:
+        measured = measure_importtime(statement, repeat)
+        if measured is not None:
+            result['importtime_us'][statement] = measured[0]
+    for name, doc, argvs in specs():
+        if names and not any(x in name for x in names):
+            continue
+        if out is not None:
+            out.write('%s\n' % name)
+        result['specs'][name] = measure_spec(doc, argvs, number, repeat)
+    return result
+
+
+def _flatten(result):
+    metrics = {'import_ms': result.get('import_ms')}
+    for statement, value in result.get('importtime_us', {}).items():
+        metrics['importtime %s' % statement] = value
+    for name, values in result.get('specs', {}).items():
+        for metric in METRICS:
+            metrics['%s %s' % (name, metric)] = values.get(metric)
+    return metrics
+
+
+def compare(old, new, threshold):
+    """Compare two results of `run`, return
+    [(metric, old, new, percent change, is regression)] of the metrics in
+    both, a regression is larger than `threshold` percent"""
+    old_metrics = _flatten(old)
+    new_metrics = _flatten(new)
+    result = []
+    for metric in sorted(set(old_metrics).intersection(new_metrics)):
+        old_value = old_metrics[metric]
+        new_value = new_metrics[metric]
+        if old_value is None or new_value is None:
+            continue
+        if old_value:
+            change = (new_value - old_value) * 100.0 / old_value
+        else:
+            change = 0.0 if not new_value else float('inf')
+        result.append((metric, old_value, new_value, change,
+                       change > threshold))
+    return result
+
+
+def importtime(repeat, budget=None):
+    """Print where the time of importing goes, return 1 if
+    `from docpie import Docpie` takes more than `budget` us"""
+    total = None
+    for statement in IMPORT_STATEMENTS:
+        measured = measure_importtime(statement, repeat)
+        if measured is None:
+            print('-X importtime needs python 3.7+')
+            return 0
+        total, modules = measured
+        print('%-30s %8dus' % (statement, total))
+        # what the docpie modules import, the slowest first
+        inside = False
+        imported = []
+        for name, self_us, _, depth in modules:
+            if depth == 0:
+                inside = (name.split('.')[0] == 'docpie')
+            if inside:
+                imported.append((self_us, name))
+        for self_us, name in sorted(imported, reverse=True)[:10]:
+            print('    %-26s %8dus' % (name, self_us))
+
+    if budget is not None and total > int(budget):
+        print('over the budget of %sus' % budget)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.bench')
+    args.docpie(argv)
+
+    if args['compare']:
+        with open(args['<old>']) as f:
+            old = json.load(f)
+        with open(args['<new>']) as f:
+            new = json.load(f)
+        threshold = float(args['--threshold'])
+        regressions = 0
+        for metric, old_value, new_value, change, regression in \
+                compare(old, new, threshold):
+            regressions += regression
+            print('%-50s %12.1f %12.1f %+8.1f%%%s' % (
+                metric, old_value, new_value, change,
+                '  REGRESSION' if regression else ''))
+        print('%d regression(s) over %s%%' % (regressions, threshold))
+        return 1 if regressions else 0
+
+    if args['importtime']:
+        return importtime(int(args['--repeat']), args['--budget'])
+
+    result = run(int(args['--number']), int(args['--repeat']),
+                 args['<spec>'], sys.stderr)
+    content = json.dumps(result, indent=2, sort_keys=True)
+    if args['--output']:
+        with open(args['--output'], 'w') as f:
+            f.write(content + '\n')
+    else:
+        print(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+On-disk cache of parsed `Docpie` objects.
+
+A `Docpie` with a `cache` spends its warm starts loading the parsed
+"Usage" and "Options" instances from a small JSON file instead of
+parsing the doc again. The cache key is a hash of the doc, every config
+flag and the docpie version, so changing any of them (or upgrading
+docpie) simply misses and re-parses.
+"""
+
+import os
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+
+__all__ = ['DocpieCache']
+
+logger = logging.getLogger('docpie.cache')
+
+
+def default_cache_dir():
+    """Return `$DOCPIE_CACHE_DIR`, `$XDG_CACHE_HOME/docpie` or
+    `~/.cache/docpie`"""
+    path = os.environ.get('DOCPIE_CACHE_DIR')
+    if path:
+        return path
+    base = (os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'docpie')
+
+
+class DocpieCache(object):
+    """A directory of parsed `Docpie` data.
+
+    `path` is the directory to use (created on first write), `None` means
+    `default_cache_dir()`. `max_size` is the total bytes the directory may
+    take; when exceeded, the least recently used entries are removed.
+
+    Any error when reading or writing the cache is logged and treated as
+    a miss, a broken cache never breaks parsing.
+    """
+
+    suffix = '.json'
+    max_size = 4 * 1024 * 1024
+
+    def __init__(self, path=None, max_size=None):
+        if path is None:
+            path = default_cache_dir()
+        self.path = path
+        if max_size is not None:
+            self.max_size = max_size
+
+    def make_key(self, pie):
+        """Return the cache key of a `Docpie` instance"""
+        source = json.dumps([
+            pie._version,
+            '%s.%s' % (pie.__class__.__module__, pie.__class__.__name__),
+            pie.doc,
+            pie.usage_name,
+            pie.option_name,
+            pie.stdopt,
+            pie.attachopt,
+            pie.attachvalue,
+            pie.auto2dashes,
+            pie.name,
+            pie.case_sensitive,
+            pie.options_first,
+            pie.appeared_only,
+            pie.namedoptions,
+            pie.maxexpansion,
+        ])
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def get(self, key, version):
+        """Return the data stored for `key`, `None` if missing or invalid.
+
+        Entries written by another docpie version are invalid."""
+        filename = self._file(key)
+        try:
+            with open(filename, 'r') as f:
+                content = json.load(f)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.warning('failed to read cache %s: %s', filename, e)
+            return None
+        except ValueError as e:
+            logger.warning('broken cache %s: %s', filename, e)
+            self.discard(key)
+            return None
+
+        if (not isinstance(content, dict) or
+                content.get('__version__') != version or
+                content.get('__key__') != key or
+                'data' not in content):
+            logger.debug('invalid cache %s', filename)
+            self.discard(key)
+            return None
+
+        try:
+            # mark as recently used
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+        return content['data']
+
+    def set(self, key, version, data):
+        """Store `data` for `key`. The file is replaced atomically so a
+        reader never sees a partial entry."""
+        content = json.dumps({'__version__': version,
+                              '__key__': key,
+                              'data': data})
+        try:
+            self._ensure_dir()
+            fd, tmp = tempfile.mkstemp(
+                prefix='.%s.' % key, suffix='.tmp', dir=self.path)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(content)
+                self._replace(tmp, self._file(key))
+            except BaseException:
+                self._remove(tmp)
+                raise
+        except (IOError, OSError) as e:
+            logger.warning('failed to write cache %s: %s', self.path, e)
+            return False
+
+        self.evict()
+        return True
+
+    def discard(self, key):
+        """Remove the entry of `key` if it exists"""
+        self._remove(self._file(key))
+
+    def entries(self):
+        """Return a list of `(mtime, size, filename)` of all entries,
+        oldest first"""
+        result = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return result
+
+        for name in names:
+            if not name.endswith(self.suffix) or name.startswith('.'):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, filename))
+        result.sort()
+        return result
+
+    def evict(self):
+        """Remove the least recently used entries until the total size is
+        no more than `max_size`"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_size:
+                break
+            logger.debug('evict cache %s', filename)
+            self._remove(filename)
+            total -= size
+
+    def clear(self):
+        """Remove all the entries"""
+        for _, _, filename in self.entries():
+            self._remove(filename)
+
+    def _ensure_dir(self):
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(self.path):
+                raise
+
+    @staticmethod
+    def _replace(src, dst):
+        replace = getattr(os, 'replace', None)
+        if replace is not None:
+            return replace(src, dst)
+        # Python 2: `rename` is atomic on POSIX, but won't overwrite on
+        # Windows
+        try:
+            os.rename(src, dst)
+        except OSError:
+            DocpieCache._remove(dst)
+            os.rename(src, dst)
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def __repr__(self):
+        return '%s(%r, max_size=%r)' % (
+            self.__class__.__name__, self.path, self.max_size)
@@ -0,0 +1,282 @@
+"""
+Compile the command-line interface of a script into a Python module.
+
+The generated module builds the parsed "Usage" and "Options" instances
+directly, so importing it skips parsing the doc on every start.
+
+Usage:
+    python -m docpie.compile [options] <source>
+
+Options:
+    -o, --output=<file>  Write the module to <file> instead of stdout.
+    --variable=<name>    Use the module-level string <name> of <source>
+                         instead of its docstring.
+    --name=<name>        The `name` config of Docpie.
+    --no-stdopt          Set `stdopt` config to False.
+    --no-attachopt       Set `attachopt` config to False.
+    --no-attachvalue     Set `attachvalue` config to False.
+    --namedoptions       Set `namedoptions` config to True.
+    -h, --help           Print this help and exit.
+
+Then in your script:
+
+    from mytool_docpie import docpie
+    args = docpie()  # or `load(...)` to get the `Docpie` instance
+"""
+
+import ast
+import sys
+import logging
+
+from docpie.pie import Docpie
+from docpie.element import Option, Command, Argument, Required, Optional, \
+                           Either, BranchedUsage
+
+__all__ = ['compile_docpie', 'compile_file', 'read_doc', 'build']
+
+logger = logging.getLogger('docpie.compile')
+
+# the config that changes the parsed result
+PARSE_CONFIG = ('stdopt', 'attachopt', 'attachvalue', 'name',
+                'case_sensitive', 'namedoptions', 'maxexpansion')
+
+TEMPLATE = '''\
+# -*- coding: utf-8 -*-
+"""Compiled by `python -m docpie.compile`%(source)s with docpie %(version)s.
+
+Do not edit. Compile again after changing the doc.
+"""
+
+from docpie.compile import build
+from docpie.element import Argument, Command, Option, Optional, Required, \\
+                           Either, BranchedUsage
+
+VERSION = %(version)r
+OPTION_NAME = %(option_name)r
+USAGE_NAME = %(usage_name)r
+CONFIG = %(config)s
+
+DOC = %(doc)r
+
+USAGE_TEXT = %(usage_text)r
+
+OPTION_SECTIONS = %(option_sections)s
+
+OPT_NAMES_REQUIRED_MAX_ARGS = %(max_args)s
+
+
+def options():
+    return %(options)s
+
+
+def usages():
+    return %(usages)s
+
+
+def load(**config):
+    """Return the `Docpie` instance. `config` is the same as
+    `Docpie`'s argument"""
+    return build(globals(), **config)
+
+
+def docpie(argv=None, **config):
+    """Match `argv` like `docpie.docpie`"""
+    pie = load(**config)
+    pie.docpie(argv)
+    return pie
+'''
+
+
+def _source(obj, indent):
+    """Return the Python expression that builds `obj`"""
+    if isinstance(obj, BranchedUsage):
+        return 'BranchedUsage(%s)' % _source(obj.usage, indent)
+
+    if isinstance(obj, Either):
+        sub_indent = indent + '    '
+        return 'Either(\n%s\n%s)' % (
+            '\n'.join('%s%s,' % (sub_indent, _source(x, sub_indent))
+                      for x in obj),
+            indent)
+
+    if isinstance(obj, (Required, Optional)):
+        kwargs = ''
+        if obj.repeat:
+            kwargs = '**{%r: True}' % 'repeat'
+        if not obj and not kwargs:
+            return '%s()' % obj.__class__.__name__
+        sub_indent = indent + '    '
+        lines = ['%s%s,' % (sub_indent, _source(x, sub_indent)) for x in obj]
+        if kwargs:
+            # no comma after `**kwargs`, it's a SyntaxError before py3.5
+            lines.append('%s%s' % (sub_indent, kwargs))
+        return '%s(\n%s\n%s)' % (
+            obj.__class__.__name__, '\n'.join(lines), indent)
+
+    if not isinstance(obj, (Option, Command, Argument)):
+        raise ValueError('%r can not be compiled' % (obj,))
+
+    args = [repr(x) for x in sorted(obj.names)]
+    kwargs = []
+    if obj.default is not None:
+        kwargs.append('%r: %r' % ('default', obj.default))
+    if isinstance(obj, Option) and obj.ref is not None:
+        kwargs.append('%r: %s' % ('ref', _source(obj.ref, indent)))
+    if kwargs:
+        # `name=value` after `*names` does not work on py2.6
+        args.append('**{%s}' % ', '.join(kwargs))
+    return '%s(%s)' % (obj.__class__.__name__, ', '.join(args))
+
+
+def _literal(value):
+    # repr(float('inf')) is `inf`, which is not a valid expression
+    if isinstance(value, float) and value == float('inf'):
+        return "float('inf')"
+    return repr(value)
+
+
+def _dict_source(pairs, indent=''):
+    if not pairs:
+        return '{}'
+    sub_indent = indent + '    '
+    return '{\n%s\n%s}' % (
+        '\n'.join('%s%r: %s,' % (sub_indent, key, value)
+                  for key, value in pairs),
+        indent)
+
+
+def compile_docpie(pie, source=None):
+    """Return the source code of the module that builds `pie`"""
+    config = {
+        'stdopt': pie.stdopt,
+        'attachopt': pie.attachopt,
+        'attachvalue': pie.attachvalue,
+        'auto2dashes': pie.auto2dashes,
+        'case_sensitive': pie.case_sensitive,
+        'namedoptions': pie.namedoptions,
+        'maxexpansion': pie.maxexpansion,
+        'tokencache': pie.tokencache,
+        'errorrecord': pie.error_record,
+        'stats': pie.stats is not None,
+        'appearedonly': pie.appeared_only,
+        'optionsfirst': pie.options_first,
+        'helpstyle': pie.helpstyle,
+        'name': pie.name,
+    }
+
+    options = _dict_source(
+        [(title,
+          '[\n%s\n        ]' % '\n'.join(
+              '            %s,' % _source(x, '            ')
+              for x in each_options))
+         for title, each_options in pie.options.items()],
+        '    ')
+    usages = '[\n%s\n    ]' % '\n'.join(
+        '        %s,' % _source(x, '        ') for x in pie.usages)
+
+    return TEMPLATE % {
+        'source': ' from `%s`' % source if source else '',
+        'version': pie._version,
+        'option_name': pie.option_name,
+        'usage_name': pie.usage_name,
+        'config': _dict_source(
+            [(key, repr(config[key])) for key in sorted(config)]),
+        'doc': pie.doc,
+        'usage_text': pie.usage_text,
+        'option_sections': _dict_source(
+            [(key, repr(value))
+             for key, value in pie.option_sections.items()]),
+        'max_args': _dict_source(
+            [(key, _literal(value)) for key, value in
+             sorted(pie.opt_names_required_max_args.items())]),
+        'options': options,
+        'usages': usages,
+    }
+
+
+def build(namespace, **config):
+    """Return the `Docpie` instance from a compiled module's `namespace`.
+
+    If the module is compiled by another docpie version, or `config`
+    changes how the doc is parsed, the doc is parsed again instead."""
+    cls = config.pop('cls', Docpie)
+    kwargs = dict(namespace['CONFIG'])
+    kwargs.update(config)
+
+    if (namespace['VERSION'] != cls._version or
+            namespace['OPTION_NAME'] != cls.option_name or
+            namespace['USAGE_NAME'] != cls.usage_name or
+            any(kwargs.get(key) != namespace['CONFIG'].get(key)
+                for key in PARSE_CONFIG)):
+        logger.debug('compiled module does not fit, parse the doc instead')
+        return cls(namespace['DOC'], **kwargs)
+
+    help = kwargs.pop('help', True)
+    version = kwargs.pop('version', None)
+    self = cls(None, **kwargs)
+    self.doc = namespace['DOC']
+    self.usage_text = namespace['USAGE_TEXT']
+    self.option_sections = dict(namespace['OPTION_SECTIONS'])
+    self.options = namespace['options']()
+    self.usages = namespace['usages']()
+    self.opt_names_required_max_args = \
+        dict(namespace['OPT_NAMES_REQUIRED_MAX_ARGS'])
+    self.opt_names = []
+    for options in self.options.values():
+        for each_option in options:
+            self.opt_names.append(each_option[0].names)
+
+    # `extra` goes last so it can override the help/version handlers
+    self.set_config(help=help, version=version, extra=dict(self.extra))
+    return self
+
+
+def read_doc(filename, variable=None):
+    """Return the docstring of a Python file without importing it, or the
+    string assigned to the module-level `variable`"""
+    with open(filename, 'rb') as f:
+        tree = ast.parse(f.read(), filename)
+
+    if variable is None:
+        doc = ast.get_docstring(tree, False)
+        if doc is None:
+            raise ValueError('%s has no docstring' % filename)
+        return doc
+
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id == variable:
+                return ast.literal_eval(node.value)
+
+    raise ValueError('%s not found in %s' % (variable, filename))
+
+
+def compile_file(filename, variable=None, **config):
+    """Return the compiled module source of the doc in `filename`"""
+    pie = Docpie(read_doc(filename, variable), **config)
+    return compile_docpie(pie, filename)
+
+
+def main(argv=None):
+    args = Docpie(__doc__, name='python -m docpie.compile').docpie(argv)
+    config = {
+        'stdopt': not args['--no-stdopt'],
+        'attachopt': not args['--no-attachopt'],
+        'attachvalue': not args['--no-attachvalue'],
+        'namedoptions': args['--namedoptions'],
+        'name': args['--name'],
+    }
+    result = compile_file(args['<source>'], args['--variable'], **config)
+
+    output = args['--output']
+    if output is None:
+        sys.stdout.write(result)
+    else:
+        with open(output, 'w') as f:
+            f.write(result)
+
+
+if __name__ == '__main__':
+    main()
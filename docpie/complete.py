@@ -234,9 +234,7 @@ def extract(unit, repeat=False, required=False):
                                   required or isinstance(each, Required)))
         else:
             if isinstance(each, Option) and each.ref:
-                arg_range = list(each.ref.arg_range())
-                min_arg_count = min(arg_range)
-                max_arg_count = max(arg_range)
+                min_arg_count, max_arg_count = each.ref.arg_bounds()
             else:
                 min_arg_count = max_arg_count = 0
 
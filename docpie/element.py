@@ -1,5 +1,9 @@
 import logging
 import re
+import string
+import threading
+from docpie import log, stats
+from docpie.pattern import LazyPattern
 from docpie.error import ExceptNoArgumentExit,\
                          ExpectArgumentExit, ExpectArgumentHitDoubleDashesExit
 try:
@@ -18,9 +22,9 @@ except ImportError:
 
 __all__ = ('Atom', 'Command', 'Argument', 'Option',
            'Unit', 'Required', 'Optional', 'OptionsShortcut', 'Either',
-           'convert_2_dict', 'convert_2_object')
+           'BranchedUsage', 'convert_2_dict', 'convert_2_object')
 
-from docpie.tokens import Argv
+from docpie.tokens import Argv, TokenCache
 
 logger = logging.getLogger('docpie.element')
 
@@ -32,35 +36,89 @@ NoneType = type(None)
 
 
 class Atom(object):
+    # a spec expanded into many usages holds a lot of atoms
+    __slots__ = ('names', 'default', 'value')
 
-    flag_or_upper_re = re.compile(r'^(?P<hyphen>-{0,2})'
-                                  r'($|[\da-zA-Z_][\da-zA-Z_\-]*$)')
-    angular_bracket_re = re.compile(r'^<.*?>$')
-    options_re = re.compile(r'\[(?P<title>[^\s\]]*)options\]', re.IGNORECASE)
+    flag_or_upper_re = LazyPattern(r'^(?P<hyphen>-{0,2})'
+                                   r'($|[\da-zA-Z_][\da-zA-Z_\-]*$)')
+    angular_bracket_re = LazyPattern(r'^<.*?>$')
+    options_re = LazyPattern(r'\[(?P<title>[^\s\]]*)options\]',
+                             re.IGNORECASE)
 
     def __init__(self, *names, **kwargs):
-        self.names = set(names)
+        self.names = self.intern_names(names)
         self.default = kwargs.get('default', None)
         self.value = None
 
-    def _cache(get_class):
-        cache_dic = {}
+    # frozenset(names) -> itself, so the copies of an atom share it. It's
+    # bounded like `class_cache`, the names of the docs parsed long ago
+    # are dropped. Atoms are also made when matching, e.g. the expansions
+    # of `BranchedUsage`, which `Docpie.parse` runs in many threads
+    _interned_names = TokenCache(lambda names: names, 4096)
+    _interned_lock = threading.Lock()
 
-        def wrapped(cls, atom):
-            if atom not in cache_dic:
-                result = get_class(cls, atom)
-                cache_dic[atom] = result
-            return cache_dic[atom]
+    @classmethod
+    def intern_names(cls, names):
+        """Return `names` as a frozenset, the same object for the same
+        names while they are in `_interned_names`"""
+        names = frozenset(names)
+        with cls._interned_lock:
+            return cls._interned_names.get(names)
+
+    def add_names(self, *names):
+        """Add alias names"""
+        self.names = self.intern_names(self.names.union(names))
 
-        return wrapped
+    # `[\da-zA-Z_]` of `flag_or_upper_re`
+    word_chars = frozenset(string.ascii_letters + string.digits + '_')
+    word_or_hyphen_chars = word_chars.union('-')
+
+    # set after `Atom` is defined
+    class_cache = None
 
     @classmethod
-    @_cache
-    def get_class(cls, atom):
-        if atom in ('-', '--'):
-            return Command, None
-        elif atom == '-?':
-            return Option, None
+    def get_class(cls, atom, cache=None):
+        """Return `(class, title)` of `atom`. The ones need regex are cached
+        in `cache`, a `TokenCache`, None for `Atom.class_cache`"""
+        result = cls.quick_classify(atom)
+        if result is not None:
+            return result
+        if cache is None:
+            cache = cls.class_cache
+        return cache.get(atom)
+
+    @classmethod
+    def quick_classify(cls, atom):
+        """`classify` the common `-x`, `--flag`, `command`, `ARG` and
+        `file.txt` without regex. Return None if not sure"""
+        first = atom[:1]
+        if first == '-':
+            if atom in ('-', '--'):
+                return Command, None
+            elif atom == '-?':
+                return Option, None
+            body = atom[2:] if atom[1] == '-' else atom[1:]
+            if (body and body[0] in cls.word_chars and
+                    cls.word_or_hyphen_chars.issuperset(body)):
+                return Option, None
+            return None
+
+        if first in ('[', '<'):
+            return None
+
+        if atom.isupper():
+            if (first in cls.word_chars and
+                    cls.word_or_hyphen_chars.issuperset(atom)):
+                return Argument, None
+            # `\d` also matches the non-ASCII digits
+            return None
+        return Command, None
+
+    @classmethod
+    def classify(cls, atom):
+        result = cls.quick_classify(atom)
+        if result is not None:
+            return result
 
         opt = cls.options_re.match(atom)
         if opt is not None:
@@ -79,12 +137,16 @@ class Atom(object):
         elif cls.angular_bracket_re.match(atom):
             return Argument, None
         else:
-            logger.debug('I guess %s is a Command' % atom)
+            if log.enabled:
+                logger.debug('I guess %s is a Command', atom)
             return Command, None
 
     def arg_range(self):
         return [1]
 
+    def arg_bounds(self):
+        return (1, 1)
+
     def fix(self):
         return self
     fix_nest = fix
@@ -103,6 +165,55 @@ class Atom(object):
     def expand(self):
         return [self]
 
+    def iter_expand(self, target=None, absent=None, raising=()):
+        """Generate `(expansion, ok, has)`, see `Unit.iter_expand`"""
+        has = id(self) in raising
+        if target != 'has' or has:
+            yield self, True, has
+
+    def expand_num(self):
+        return 1
+
+    def required_atoms(self):
+        """Return the Commands/Options that must be in argv to match"""
+        return []
+
+    def match_all(self, argv):
+        """Match the run of tokens at the front of argv at once, the same
+        as calling `match(argv, True)` until it fails, but with slices
+        instead of one `pop` per token. Return the number of the tokens.
+
+        Only for Command and Argument, which define `accept`."""
+        # as `Unit._match_oneline` does for the only element of the unit
+        argv.option_only = False
+        accept = self.accept
+        cache = argv.class_cache
+        total = len(argv)
+        index = 0
+        while (index < total and argv[index] != '--' and
+                accept(argv[index], False, cache)):
+            index += 1
+        taken = argv[:index]
+        if index:
+            del argv[:index]
+
+        if argv and argv[0] == '--':
+            argv.check_dash()
+            if argv.auto_dashes and argv.dashes:
+                total = len(argv)
+                index = 1
+                while index < total and accept(argv[index], True, cache):
+                    index += 1
+                if index > 1:
+                    taken.extend(argv[1:index])
+                    del argv[1:index]
+
+        if taken:
+            self.add_values(taken)
+            if log.enabled:
+                logger.debug('%s matched %s/%s', self, self.value, argv)
+        return len(taken)
+
     @classmethod
     def convert_2_dict(cls, obj):
         return {
@@ -131,6 +242,14 @@ class Atom(object):
     def copy(self):
         return self.__class__(*self.names)
 
+    def __reduce__(self):
+        # the matched value is not kept
+        return (self.__class__, tuple(self.names), {'default': self.default})
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
     def __str__(self):
         return '/'.join(self.names)
 
@@ -146,7 +265,9 @@ class Atom(object):
 
 
 class Option(Atom):
-    long_re = re.compile(r'(?P<name>--[0-9a-zA-Z]*)(?P<eq>=?)(?P<value>.*)')
+    __slots__ = ('ref',)
+    long_re = LazyPattern(
+        r'(?P<name>--[0-9a-zA-Z]*)(?P<eq>=?)(?P<value>.*)')
 
     def __init__(self, *names, **kwargs):
         # assert all(x.startswith('-') for x in names)
@@ -161,14 +282,15 @@ class Option(Atom):
         # if appeared_only and value is None:
         #     return {}
         ref = self.ref
-        logger.debug('%s in repeat: %s', self, in_repeat)
+        if log.enabled:
+            logger.debug('%s in repeat: %s', self, in_repeat)
 
         multi = (in_repeat or (value is not True and
                                value is not False and
                                not isinstance(value, StrType)))
 
         if ref is not None:
-            max_value_num = -1 if in_repeat else max(ref.arg_range())
+            max_value_num = -1 if in_repeat else ref.arg_bounds()[1]
             multi = multi or (max_value_num > 1)
         else:
             max_value_num = 0
@@ -188,7 +310,8 @@ class Option(Atom):
 
             for name in names:
                 result[name] = value
-            logger.debug('%s returns its value %s', self, result)
+            if log.enabled:
+                logger.debug('%s returns its value %s', self, result)
             return result
 
         # has value, has ref
@@ -205,7 +328,8 @@ class Option(Atom):
                 value = 0
             value = int(value)
 
-        logger.debug('%s returns its value %s', self, value)
+        if log.enabled:
+            logger.debug('%s returns its value %s', self, value)
         # Not work on py2.6
         # return {name: value for name in names}
         result = {}
@@ -223,8 +347,7 @@ class Option(Atom):
             else:
                 value = 0
         elif self.ref is not None:
-            arg_range = self.ref.arg_range()
-            max_arg_num = max(arg_range)
+            max_arg_num = self.ref.arg_bounds()[1]
             if max_arg_num == 0:
                 value = False
             elif max_arg_num == 1:
@@ -241,14 +364,23 @@ class Option(Atom):
         return result
 
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
 
         if not repeat_match and self.value:
-            logger.debug('%s already has a value', self)
+            if log.enabled:
+                logger.debug('%s already has a value', self)
             return True
 
         current = argv.current()
         if current is None:
-            logger.debug('no argv left')
+            if log.enabled:
+                logger.debug('no argv left')
+            return False
+
+        if not argv.may_have(self.names):
+            if log.enabled:
+                logger.debug('%s not in %s', self, argv)
             return False
 
         # self_value = self.dump_value()
@@ -259,7 +391,8 @@ class Option(Atom):
             argv.break_for_option(self.names)
 
         if find_it is None:
-            logger.debug('not found matching %s in %s', self, argv)
+            if log.enabled:
+                logger.debug('not found matching %s in %s', self, argv)
             argv.load_value(argv_value)
             # saver.rollback(self, argv)
             return False
@@ -277,13 +410,17 @@ class Option(Atom):
                 if (argv.stdopt
                         and argv.attachopt
                         and not find_it.startswith('--')):
-                    logger.debug("%s put -%s pack to argv %s",
-                                 self, attached_value, argv)
+                    if log.enabled:
+                        logger.debug("%s put -%s pack to argv %s",
+                                     self, attached_value, argv)
                     argv.insert(index, '-' + attached_value, _from)
-                    logger.debug('%s matched %s / %s', self, self.value, argv)
+                    if log.enabled:
+                        logger.debug('%s matched %s / %s',
+                                     self, self.value, argv)
                     return True
-                logger.debug("%s doesn't have ref but argv is %s",
-                             self, attached_value)
+                if log.enabled:
+                    logger.debug("%s doesn't have ref but argv is %s",
+                                 self, attached_value)
                 # need restore?
                 # self.load_value(self_value)
                 # argv.load_value(argv_value)
@@ -292,7 +429,8 @@ class Option(Atom):
                     option=self.names,
                     hit=attached_value
                 )
-            logger.debug('%s matched %s / %s', self, self.value, argv)
+            if log.enabled:
+                logger.debug('%s matched %s / %s', self, self.value, argv)
             return True
 
         # option expects a value(e.g. `--flag=<sth>`), but the argv looks like
@@ -301,40 +439,42 @@ class Option(Atom):
         if (attached_value is None and
                 argv.current(index) == '--' and
                 argv.auto_dashes and
-                min(self.ref.arg_range()) > 0):
-            logger.debug(
-                '%s ref must fully match but failed because `--`', self)
+                self.ref.arg_bounds()[0] > 0):
+            if log.enabled:
+                logger.debug(
+                    '%s ref must fully match but failed because `--`', self)
             raise ExpectArgumentHitDoubleDashesExit(
                 ('/'.join(self.names) +
                  ' requires argument(s) but hits "--".'),
                 option=self.names
             )
 
-        to_match_ref_argv = argv.clone()
         if attached_value is None:
             # --force=[<val>] <arg>
             # --force -- value
             if argv.current(index) == '--' and argv.auto_dashes:
-                del to_match_ref_argv[:]
+                to_match_ref_argv = argv.clone([])
             else:
-                to_match_ref_argv[:] = argv[index:]
+                to_match_ref_argv = argv.clone(argv[index:])
                 del argv[index:]
         else:
-            to_match_ref_argv[:] = [attached_value]
+            to_match_ref_argv = argv.clone([attached_value])
 
         to_match_ref_argv.auto_dashes = False
         result = self.ref.match(to_match_ref_argv, repeat_match)
 
         if attached_value is not None and to_match_ref_argv:
-            logger.debug('%s ref must fully match but failed for %s',
-                         self, to_match_ref_argv)
+            if log.enabled:
+                logger.debug('%s ref must fully match but failed for %s',
+                             self, to_match_ref_argv)
             raise ExpectArgumentExit(
                 '%s requires argument(s).' % ('/'.join(self.names)),
                 option=self.names,
                 hit=to_match_ref_argv[0] if to_match_ref_argv else None)
 
         if not result:
-            logger.debug('%s ref match failed %s', self, to_match_ref_argv)
+            if log.enabled:
+                logger.debug('%s ref match failed %s', self, to_match_ref_argv)
 
             raise ExpectArgumentExit(
                 '%s requires argument(s).' % ('/'.join(self.names)),
@@ -348,7 +488,8 @@ class Option(Atom):
         # merge argv
         if attached_value is None:
             argv.extend(to_match_ref_argv)
-        logger.debug('%s matched %s / %s', self, self.value, argv)
+        if log.enabled:
+            logger.debug('%s matched %s / %s', self, self.value, argv)
         return True
 
     def reset(self):
@@ -394,9 +535,16 @@ class Option(Atom):
     def matched(self):
         return self.value in ([], None, -1, 0)
 
+    def required_atoms(self):
+        return [self]
+
     def copy(self):
         return self.__class__(*self.names, **{'ref': self.ref})
 
+    def __reduce__(self):
+        return (self.__class__, tuple(self.names),
+                {'default': self.default, 'ref': self.ref})
+
     @classmethod
     def convert_2_dict(cls, obj):
         ref = obj.ref
@@ -440,6 +588,7 @@ class Option(Atom):
 
 
 class Command(Atom):
+    __slots__ = ()
 
     def __init__(self, *names, **kwargs):
         # assert all(self.type(x) == self.COMMAND for x in names)
@@ -455,18 +604,23 @@ class Command(Atom):
         # self.value = False
 
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
 
         if not repeat_match and self.value:
-            logger.debug('%s already has a value %s', self, self.value)
+            if log.enabled:
+                logger.debug('%s already has a value %s', self, self.value)
             return True
 
         current = argv.current()
         if current is None:
-            logger.debug('argv ran out before matching %s', self)
+            if log.enabled:
+                logger.debug('argv ran out before matching %s', self)
             return False
 
         if argv.option_only:
-            logger.debug('option only, %s skipped.', self)
+            if log.enabled:
+                logger.debug('option only, %s skipped.', self)
             return False
 
         skip = 0
@@ -476,11 +630,14 @@ class Command(Atom):
                 current = argv.current(1)
                 skip = 1
             else:
-                logger.debug('%s matching %s failed', self, current)
+                if log.enabled:
+                    logger.debug('%s matching %s failed', self, current)
                 return False
 
-        if current not in self.names or Atom.get_class(current)[0] is Option:
-            logger.debug('%s matching %s failed', self, current)
+        if (current not in self.names or
+                Atom.get_class(current, argv.class_cache)[0] is Option):
+            if log.enabled:
+                logger.debug('%s matching %s failed', self, current)
             return False
 
         if repeat_match:
@@ -490,9 +647,17 @@ class Command(Atom):
 
         # saver.save(self, argv)
         argv.next(skip)
-        logger.debug('%s matched %s/%s', self, self.value, argv)
+        if log.enabled:
+            logger.debug('%s matched %s/%s', self, self.value, argv)
         return True
 
+    def accept(self, token, forced, cache=None):
+        return (token in self.names and
+                Atom.get_class(token, cache)[0] is not Option)
+
+    def add_values(self, tokens):
+        self.value = (self.value or 0) + len(tokens)
+
     def merge_value(self, values):
         if len(values) == 1:
             return values[0]
@@ -529,8 +694,12 @@ class Command(Atom):
     def matched(self):
         return self.value
 
+    def required_atoms(self):
+        return [self]
+
 
 class Argument(Atom):
+    __slots__ = ()
 
     def __init__(self, *names, **kwargs):
         super(Argument, self).__init__(*names, **kwargs)
@@ -549,18 +718,23 @@ class Argument(Atom):
         return value
 
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
 
         if not repeat_match and (self.value is not None and self.value != []):
-            logger.debug('%s already has a value %s', self, self.value)
+            if log.enabled:
+                logger.debug('%s already has a value %s', self, self.value)
             return True
 
         if argv.option_only:
-            logger.debug('option only, %s skipped.', self)
+            if log.enabled:
+                logger.debug('option only, %s skipped.', self)
             return False
 
         current = argv.current()
         if current is None:
-            logger.debug('argv ran out when matching %s', self)
+            if log.enabled:
+                logger.debug('argv ran out when matching %s', self)
             return False
 
         if current == '--':
@@ -569,8 +743,9 @@ class Argument(Atom):
                 current = argv.current(1)
                 # nothing left
                 if current is None:
-                    logger.debug('argv %s ran out when matching %s',
-                                 argv, self)
+                    if log.enabled:
+                        logger.debug('argv %s ran out when matching %s',
+                                     argv, self)
                     return False
                 # force to be command/arg
                 if repeat_match:
@@ -584,22 +759,26 @@ class Argument(Atom):
 
                 # saver.save(self, argv)
                 argv.next(1)
-                logger.debug('%s matched %s/%s', self, self.value, argv)
+                if log.enabled:
+                    logger.debug('%s matched %s/%s', self, self.value, argv)
                 return True
             else:
-                logger.debug('%s matching %s failed', self, current)
+                if log.enabled:
+                    logger.debug('%s matching %s failed', self, current)
                 return False
 
         # check if it's `--flag=sth`
 
         if current.startswith('--') and '=' in current:
             opt, value = current.split('=', 1)
-            if Atom.get_class(opt)[0] is Option:
-                logger.debug('%s matching %s failed', self, current)
+            if Atom.get_class(opt, argv.class_cache)[0] is Option:
+                if log.enabled:
+                    logger.debug('%s matching %s failed', self, current)
                 return False
 
-        if Atom.get_class(current)[0] is Option:
-            logger.debug('%s matching %s failed', self, current)
+        if Atom.get_class(current, argv.class_cache)[0] is Option:
+            if log.enabled:
+                logger.debug('%s matching %s failed', self, current)
             return False
 
         if repeat_match:
@@ -613,16 +792,36 @@ class Argument(Atom):
 
         # saver.save(self, argv)
         argv.next()
-        logger.debug('%s matched %s/%s', self, self.value, argv)
+        if log.enabled:
+            logger.debug('%s matched %s/%s', self, self.value, argv)
         return True
 
+    def accept(self, token, forced, cache=None):
+        # after `--`, anything is an argument
+        if forced:
+            return True
+        # check if it's `--flag=sth`
+        if token.startswith('--') and '=' in token:
+            if Atom.get_class(token.split('=', 1)[0], cache)[0] is Option:
+                return False
+        return Atom.get_class(token, cache)[0] is not Option
+
+    def add_values(self, tokens):
+        value = self.value
+        if value is None:
+            self.value = list(tokens)
+        elif isinstance(value, list):
+            value.extend(tokens)
+        else:
+            self.value = [value] + tokens
+
     def get_value(self, appeared_only, in_repeat):
         value = self.value
-        if in_repeat:
-            if value is None:
-                value = []
-            elif not isinstance(value, list):
-                value = [value]
+        if isinstance(value, list):
+            # a copy, or the next matching changes the returned result
+            value = list(value)
+        elif in_repeat:
+            value = [] if value is None else [value]
         # Not work on py2.6
         # return {name: value for name in self.names}
         result = {}
@@ -669,12 +868,16 @@ class Argument(Atom):
 
 
 class Unit(list):
+    __slots__ = ('repeat', '_arg_bounds')
 
     def __init__(self, *atoms, **kwargs):
         super(Unit, self).__init__(atoms)
         self.repeat = kwargs.get('repeat', False)
+        self._arg_bounds = None
 
     def reset(self):
+        if stats.active:
+            stats.count('resets')
         for each in self:
             each.reset()
 
@@ -687,8 +890,9 @@ class Unit(list):
             for key in repeated_keys:
                 old_value = result[key]
                 new_value = this_result[key]
-                logger.debug('%s - old: %s, new: %s',
-                             key, old_value, new_value)
+                if log.enabled:
+                    logger.debug('%s - old: %s, new: %s',
+                                 key, old_value, new_value)
                 if (key.startswith('-') and
                         any(
                             isinstance(
@@ -714,10 +918,12 @@ class Unit(list):
                             final_value.extend(each_value)
                         else:
                             final_value.append(each_value)
-                logger.debug('merge %s value as %s', key, final_value)
+                if log.enabled:
+                    logger.debug('merge %s value as %s', key, final_value)
                 this_result[key] = final_value
             result.update(this_result)
-        logger.debug('%s return value %s', self, result)
+        if log.enabled:
+            logger.debug('%s return value %s', self, result)
         return result
 
     def arg_range(self):
@@ -735,7 +941,25 @@ class Unit(list):
 
         return list(this_range)
 
+    def arg_bounds(self):
+        """Return (min, max) of `arg_range()`, cached until `fix`"""
+        bounds = self._arg_bounds
+        if bounds is None:
+            bounds = self._arg_bounds = self._get_arg_bounds()
+        return bounds
+
+    def _get_arg_bounds(self):
+        least = most = 0
+        for each in self:
+            each_least, each_most = each.arg_bounds()
+            least += each_least
+            most += each_most
+        if self.repeat and self:
+            most = float('inf')
+        return (least, most)
+
     def fix(self):
+        self._arg_bounds = None
         if not self:
             return None
         if len(self) == 1:
@@ -778,6 +1002,7 @@ class Unit(list):
 
     def fix_nest(self):
         assert len(self) == 1, '%s need not fix nest' % self
+        self._arg_bounds = None
         inside = self[0]
         if isinstance(inside, Unit):
             if len(inside) == 0:  # [()], ([]), (()), [[]]
@@ -846,7 +1071,8 @@ class Unit(list):
             old_status = new_status
             for index, each in enumerate(self):
                 if not argv:
-                    logger.debug('argv run out when matching %s', each)
+                    if log.enabled:
+                        logger.debug('argv run out when matching %s', each)
                     break
 
                 # saver.save(each, argv)
@@ -858,8 +1084,9 @@ class Unit(list):
                     if not old_matching_status:
                         if isinstance(each, (Argument, Command)):
                             last_opt_or_arg = index
-                            logger.debug('set last matched %s in %s at %s',
-                                         each, self, index)
+                            if log.enabled:
+                                logger.debug('set last matched %s in %s at %s',
+                                             each, self, index)
                         # jump to the first, avoid
                         # `Usage: cmd --flag <arg>`
                         # matching `cmd --flag sth` fails.
@@ -868,17 +1095,34 @@ class Unit(list):
                         #     break
             new_status = argv.status()
 
-        logger.debug('out of loop matching %s, argv %s', self, argv)
+        if log.enabled:
+            logger.debug('out of loop matching %s, argv %s', self, argv)
         return matched_status
 
     # TODO: balance the value for `<a>... <b>`
     def match_repeat(self, argv):
+        if len(self) == 1 and isinstance(self[0], (Command, Argument)):
+            # `<file>...`, consume all the run at once
+            atom = self[0]
+            if not argv or not isinstance(self, Optional):
+                return atom.match_all(argv)
+            # as the loop below, `[<file>]...` matches once even if
+            # nothing is taken, which merges the value into a list
+            old_value = atom.dump_value()
+            count = atom.match_all(argv)
+            if not count:
+                atom.reset()
+                atom.load_value(
+                    atom.merge_value([old_value, atom.dump_value()]))
+            return count
+
         # saver.save(self, argv)
         old_status = None
         new_status = argv.status()
         full_match_count = 0
         history_values = [self.dump_value()]
-        logger.debug('matching %s repeatedly, start: %s', self, argv)
+        if log.enabled:
+            logger.debug('matching %s repeatedly, start: %s', self, argv)
         while old_status != new_status and argv:
             self.reset()
             # saver.save(self, argv)
@@ -891,13 +1135,16 @@ class Unit(list):
             history_values.append(self.dump_value())
             new_status = argv.status()
 
-        logger.debug('matching %s %s time(s)', self, full_match_count)
+        if log.enabled:
+            logger.debug('matching %s %s time(s)', self, full_match_count)
         if full_match_count:
             if len(history_values) == 1:
                 merged_value = history_values[0]
             else:
                 merged_value = self.merge_value(history_values)
-            logger.debug('restore merged value %s for %s', merged_value, self)
+            if log.enabled:
+                logger.debug('restore merged value %s for %s',
+                             merged_value, self)
             self.load_value(merged_value)
         else:
             assert len(history_values) == 1
@@ -911,20 +1158,26 @@ class Unit(list):
         # <arg>... <arg2> cmd
         # <arg>... (cmd <arg2>) <arg3>
         # see: https://github.com/TylerTemp/docpie/blob/master/CHANGELOG.md#026
-        logger.debug("try balance %s", self)
+        if stats.active:
+            stats.count('balances')
+        if log.enabled:
+            logger.debug("try balance %s", self)
 
         ele_num = len(self)
         for index_1, element in enumerate(self, 1):
             if index_1 == ele_num:    # the last one
-                logger.debug("already last one: %s", self)
+                if log.enabled:
+                    logger.debug("already last one: %s", self)
                 return False
 
             if isinstance(element, OptionsShortcut):
-                logger.debug("skip OptionsShortcut: %s", self)
+                if log.enabled:
+                    logger.debug("skip OptionsShortcut: %s", self)
                 continue
 
             if not element.matched():
-                logger.debug('%r not matched at all', element)
+                if log.enabled:
+                    logger.debug('%r not matched at all', element)
                 if isinstance(element, Required):
                     return False
                 continue
@@ -1014,7 +1267,8 @@ class Unit(list):
         supported_times = min_value_num - 1
         required_times, rest = divmod(required_num, supported_unit)
         if rest or required_times > supported_times:
-            logger.debug('Not suit to balance: %s -> %s', from_, to)
+            if log.enabled:
+                logger.debug('Not suit to balance: %s -> %s', from_, to)
             return False
         backup = self.backup_before_balance(from_, to)
         collected_value = []
@@ -1026,11 +1280,13 @@ class Unit(list):
 
         argv = Argv(collected_value, True, True, True, True)
         if not all(x.match(argv, False) for x in to):
-            logger.debug('balance %s match failed', self)
+            if log.enabled:
+                logger.debug('balance %s match failed', self)
             self.restore_for_balance(backup)
             return False
 
-        logger.debug('balance %s succeed', self)
+        if log.enabled:
+            logger.debug('balance %s succeed', self)
         return True
 
     def balance_optional_value(self, from_, to):
@@ -1056,7 +1312,9 @@ class Unit(list):
             for ele in from_[::-1]:
                 val = ele.value
                 if len(val) == 1:
-                    logger.debug('balance failed, at least leave one value')
+                    if log.enabled:
+                        logger.debug(
+                            'balance failed, at least leave one value')
                     self.restore_for_balance(backup)
                     return False
                 collected_value.insert(0, val.pop(-1))
@@ -1064,13 +1322,16 @@ class Unit(list):
                 if not lack:
                     break
 
-        logger.debug('collected value %s', collected_value)
+        if log.enabled:
+            logger.debug('collected value %s', collected_value)
         argv = Argv(collected_value, True, True, True, True)
         if not all(x.match(argv, False) for x in to):
-            logger.debug('balance match failed')
+            if log.enabled:
+                logger.debug('balance match failed')
             self.restore_for_balance(backup)
             return False
-        logger.debug('balance succeed')
+        if log.enabled:
+            logger.debug('balance succeed')
         return True
 
     def backup_before_balance(self, from_, to):
@@ -1091,9 +1352,13 @@ class Unit(list):
         return result
 
     def dump_value(self):
+        if stats.active:
+            stats.count('dumps')
         return [x.dump_value() for x in self]
 
     def load_value(self, value):
+        if stats.active:
+            stats.count('loads')
         for each, v in zip(self, value):
             each.load_value(v)
 
@@ -1139,7 +1404,8 @@ class Unit(list):
     def expand(self):
         cls = self.__class__
         repeat = self.repeat
-        logger.debug('expand %r', self)
+        if log.enabled:
+            logger.debug('expand %r', self)
         if len(self) == 1 and isinstance(self[0], Either):
             coll = []
             expanded = []
@@ -1217,16 +1483,120 @@ class Unit(list):
             # new = cls(*expanded, repeat=repeat)
             new = cls(*(e.copy() for e in expanded), repeat=repeat)
             result.append(new)
-        logger.debug('done expand %r -> %r', self, result)
+        if log.enabled:
+            logger.debug('done expand %r -> %r', self, result)
+        return result
+
+    def iter_expand(self, target=None, absent=None, raising=()):
+        """Generate the same result as `expand`, one by one, as
+        `(expansion, ok, has)`.
+
+        `absent(atom)` tells if a required Command/Option can't be in argv.
+        `ok` is False if a branch of `Either` taken requires one of them,
+        so the expansion can't match. `has` is True if the expansion has
+        one of the options whose ids are in `raising`.
+
+        `target` picks the ones to generate: None for all, "ok", "has",
+        or "either" for the ones either ok or has. The branches that can't
+        give one are skipped without generating them"""
+        cls = self.__class__
+        if not isinstance(self, Required):
+            # nothing inside is required
+            absent = None
+        elif absent is not None and _has_repeat(self):
+            # `required_atoms` of the expanded one can lose the commands
+            # beside a repeated unit, so they don't tell it can't match
+            absent = None
+        if len(self) == 1 and isinstance(self[0], Either):
+            either = self[0]
+            for index, each in enumerate(either):
+                ok = absent is None or not any(
+                    absent(x) for x in each.required_atoms())
+                branch_target = target
+                if not ok and target is not None:
+                    if target == 'ok' or not _can_have(each, raising):
+                        continue
+                    branch_target = 'has'
+                either.matched_branch = index
+                fixed_each = cls(each, repeat=self.repeat).fix()
+                for expanded, each_ok, has in fixed_each.iter_expand(
+                        branch_target, absent, raising):
+                    yield expanded, ok and each_ok, has
+            return
+
+        if target is None:
+            can_ok = can_have = None
+        else:
+            # if the elements from `index` on can give an ok one, or one
+            # that has an option in `raising`
+            can_ok = [True] * (len(self) + 1)
+            can_have = [False] * (len(self) + 1)
+            for index in range(len(self) - 1, -1, -1):
+                can_ok[index] = (can_ok[index + 1] and
+                                 _can_ok(self[index], absent))
+                can_have[index] = (can_have[index + 1] or
+                                   _can_have(self[index], raising))
+        for expanded, ok, has in self._iter_product(
+                0, target, absent, raising, True, False, can_ok, can_have):
+            yield (cls(*(e.copy() for e in expanded),
+                       **{'repeat': self.repeat}),
+                   ok, has)
+
+    def _iter_product(self, index, target, absent, raising, ok, has,
+                      can_ok, can_have):
+        # `product(*(x.expand() for x in self[index:]))`, but lazily.
+        # `ok` and `has` are the ones of the elements before `index`
+        if index == len(self):
+            if _feasible(target, ok, has, True, False):
+                yield (), ok, has
+            return
+        if target is None:
+            head_target = None
+        else:
+            head_target = _head_target(target, ok, has, can_ok[index + 1],
+                                       can_have[index + 1])
+            if head_target is False:
+                return
+        for head, head_ok, head_has in self[index].iter_expand(
+                head_target, absent, raising):
+            for rest, rest_ok, rest_has in self._iter_product(
+                    index + 1, target, absent, raising, ok and head_ok,
+                    has or head_has, can_ok, can_have):
+                yield (head,) + rest, rest_ok, rest_has
+
+    def expand_num(self):
+        """Return `len(self.expand())` without expanding"""
+        if len(self) == 1 and isinstance(self[0], Either):
+            return self[0].expand_num()
+        result = 1
+        for each in self:
+            result *= each.expand_num()
         return result
 
     def matched(self):
         return all(x.matched() for x in self)
 
+    def required_atoms(self):
+        # `balance_value_for_ellipsis_args` can match `<a>... <b> cmd`
+        # without the atoms beside the repeated unit
+        if any(isinstance(x, Unit) and x.repeat for x in self[:-1]):
+            return []
+        result = []
+        for each in self:
+            result.extend(each.required_atoms())
+        return result
+
     def copy(self):
         return self.__class__(*(x.copy() for x in self),
                               **{'repeat': self.repeat})
 
+    def __reduce__(self):
+        return (self.__class__, tuple(self), {'repeat': self.repeat})
+
+    def __setstate__(self, state):
+        self.repeat = state['repeat']
+        self._arg_bounds = None
+
     @classmethod
     def convert_2_dict(cls, obj):
         return {
@@ -1266,16 +1636,22 @@ class Unit(list):
 
 
 class Required(Unit):
+    __slots__ = ()
 
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
 
         if not (repeat_match or self.repeat):
-            logger.debug('try to match %s once, %s', self, argv)
+            if log.enabled:
+                logger.debug('try to match %s once, %s', self, argv)
             result = self.match_oneline(argv)
-            logger.debug('%s matching status: %s', self, result)
+            if log.enabled:
+                logger.debug('%s matching status: %s', self, result)
             return result
 
-        logger.debug('try to match %s repeatedly', self)
+        if log.enabled:
+            logger.debug('try to match %s repeatedly', self)
         return self.match_repeat(argv)
 
     def match_oneline(self, argv):
@@ -1286,14 +1662,19 @@ class Required(Unit):
         matched_status = self._match_oneline(argv)
 
         if all(matched_status):
-            logger.debug('%s matched', self)
+            if log.enabled:
+                logger.debug('%s matched', self)
             return True
-        logger.debug('%s matching failed %s / %s', self, matched_status, argv)
+        if log.enabled:
+            logger.debug('%s matching failed %s / %s',
+                         self, matched_status, argv)
         if self.balance_value_for_ellipsis_args():
-            logger.debug('%s balance value succeed', self)
+            if log.enabled:
+                logger.debug('%s balance value succeed', self)
             return True
         else:
-            logger.debug('%s balance value failed', self)
+            if log.enabled:
+                logger.debug('%s balance value failed', self)
 
         self.load_value(self_value)
         argv.load_value(argv_value)
@@ -1312,6 +1693,10 @@ class Required(Unit):
 
 
 class Optional(Unit):
+    __slots__ = ()
+
+    def required_atoms(self):
+        return []
 
     def arg_range(self):
         this_range = super(Optional, self).arg_range()
@@ -1319,15 +1704,21 @@ class Optional(Unit):
             this_range.append(0)
         return this_range
 
+    def _get_arg_bounds(self):
+        return (0, super(Optional, self)._get_arg_bounds()[1])
+
     def match_oneline(self, argv):
         # saver.save(self, argv)
         self._match_oneline(argv)
         return True
 
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
         repeat = repeat_match or self.repeat
-        logger.debug('matching %s with %s%s',
-                     self, argv, ', repeatedly' if repeat else '')
+        if log.enabled:
+            logger.debug('matching %s with %s%s',
+                         self, argv, ', repeatedly' if repeat else '')
         func = (self.match_repeat if repeat else self.match_oneline)
 
         func(argv)
@@ -1366,9 +1757,18 @@ class OptionsShortcut(object):
         ins.set_hide(self._hide)
         return ins
 
+    def __reduce__(self):
+        # `options` are the same objects as in `Docpie.options`, pickled
+        # only once when pickled together
+        return (self.__class__, (self.name, self.options),
+                {'_hide': set(self._hide)})
+
     def matched(self):
         return True
 
+    def required_atoms(self):
+        return []
+
     def set_hide(self, names):
         self._hide.update(names)
 
@@ -1379,22 +1779,33 @@ class OptionsShortcut(object):
         return self._hide.intersection(name)
 
     def arg_range(self):
-        logger.debug('fixme: Unexpected call')
+        if log.enabled:
+            logger.debug('fixme: Unexpected call')
         return [0]
 
+    def arg_bounds(self):
+        return (0, 0)
+
     def match(self, argv, repeat_match):
+        if stats.active:
+            stats.count('matches')
         options = self.options
 
         hide = self._hide
-        logger.debug('[options]/%s/%s try matching %s', options, hide, argv)
+        if log.enabled:
+            logger.debug('[options]/%s/%s try matching %s',
+                         options, hide, argv)
         for each in filter(
                 lambda x: not hide.intersection(x[0].names), options):
 
             if not argv:
-                logger.debug('argv run out before matching [options] %s(-%s)',
-                             options, self._hide)
+                if log.enabled:
+                    logger.debug(
+                        'argv run out before matching [options] %s(-%s)',
+                        options, self._hide)
                 return True
-            logger.debug('[options] try %s matching %s', each, argv)
+            if log.enabled:
+                logger.debug('[options] try %s matching %s', each, argv)
             each.match(argv, repeat_match)
 
         return True
@@ -1455,6 +1866,15 @@ class OptionsShortcut(object):
             real.append(each)
         return [Optional(*real)]
 
+    def iter_expand(self, target=None, absent=None, raising=()):
+        for each in self.expand():
+            has = _can_have(each, raising)
+            if target != 'has' or has:
+                yield each, True, has
+
+    def expand_num(self):
+        return 1
+
     @classmethod
     def convert_2_dict(cls, obj):
         return {
@@ -1464,7 +1884,7 @@ class OptionsShortcut(object):
             'hide': tuple(obj._hide),
         }
 
-    formal_title_re = re.compile('[\\-_]')
+    formal_title_re = LazyPattern('[\\-_]')
 
     @classmethod
     def convert_2_object(cls, dic, options, namedoptions):
@@ -1474,7 +1894,7 @@ class OptionsShortcut(object):
             name = dic['name']
             formal_name = cls.formal_title_re.sub(' ', name.lower()).strip()
             for title, opts in options.items():
-                if (formal_title_re.sub(' ', title.lower()).strip() ==
+                if (cls.formal_title_re.sub(' ', title.lower()).strip() ==
                         formal_name):
                     break
             else:
@@ -1507,8 +1927,10 @@ class Either(list):
         assert(all(isinstance(x, Unit) for x in branch))
         super(Either, self).__init__(branch)
         self.matched_branch = -1
+        self._arg_bounds = None
 
     def fix(self):
+        self._arg_bounds = None
         if not self:
             return None
         result = []
@@ -1541,14 +1963,16 @@ class Either(list):
             if not (len(branch) == 1 and
                     isinstance(branch, first_type) and
                     isinstance(branch[0], Argument)):
-                logger.debug('fix %r not change', self)
+                if log.enabled:
+                    logger.debug('fix %r not change', self)
                 return self
         else:
             first = self[0][0]
             for each in self:
-                first.names.update(each[0].names)
+                first.add_names(*each[0].names)
             result = first_type(first)
-            logger.debug('fix %r -> %r', self, result)
+            if log.enabled:
+                logger.debug('fix %r -> %r', self, result)
             return result
 
     def arg_range(self):
@@ -1557,15 +1981,524 @@ class Either(list):
             result.update(each.arg_range())
         return list(result)
 
+    def arg_bounds(self):
+        """Return (min, max) of `arg_range()`, cached until `fix`"""
+        bounds = self._arg_bounds
+        if bounds is None:
+            all_bounds = [each.arg_bounds() for each in self]
+            bounds = self._arg_bounds = (min(x[0] for x in all_bounds),
+                                         max(x[1] for x in all_bounds))
+        return bounds
+
+    def required_atoms(self):
+        # any branch may match
+        return []
+
+    def expand_num(self):
+        return sum(x.expand_num() for x in self)
+
+    def reset(self):
+        if stats.active:
+            stats.count('resets')
+        self.matched_branch = -1
+        for each in self:
+            each.reset()
+
+    def get_sys_default_value(self, appeared_only, in_repeat):
+        result = {}
+        for each in self:
+            result.update(each.get_sys_default_value(appeared_only, in_repeat))
+        return result
+
+    def copy(self):
+        return self.__class__(*(x.copy() for x in self))
+
+    def __reduce__(self):
+        # the matched branch is not kept
+        return (self.__class__, tuple(self))
+
+    @classmethod
+    def convert_2_dict(cls, obj):
+        return {
+            '__class__': obj.__class__.__name__,
+            'branch': [x.convert_2_dict(x) for x in obj],
+        }
+
+    @classmethod
+    def convert_2_object(cls, dic, options, namedoptions):
+        assert dic['__class__'] == 'Either'
+        return cls(*(convert_2_object(x, options, namedoptions)
+                     for x in dic['branch']))
+
+    def __str__(self):
+        return ' | '.join(map(str, self))
+
     def __repr__(self):
         return 'Either(%s)' % (', '.join(repr(x) for x in self))
 
 
-def convert_2_dict(obj):
-    return obj.convert_2_dict(obj)
+class BranchedUsage(object):
+    """A usage that is not expanded.
+
+    `Unit.expand` turns each `Either` into usages, so
+    `(a|b) (c|d) (e|f)` gives 8 of them. A `BranchedUsage` keeps the
+    `Either` and generates the expansions one by one when matching, in the
+    same order as `expand`, so it matches the same as the expanded
+    usages."""
+    error = None
+    repeat = False
+
+    def __init__(self, usage):
+        self.usage = usage
+        self.matched_usage = None
+        # the `Either.matched_branch` on the way to `matched_usage`
+        self.matched_path = None
+        self._options = None
+        # if it has a Command or an Argument out of the options
+        self._positional = None
+
+    def expansions(self):
+        """Generate the expanded usages"""
+        for each, _ in self._expansions():
+            yield each
+
+    def _expansions(self, target=None, absent=None, raising=()):
+        # `(expansion, has)`, see `Unit.iter_expand`
+        for each, _, has in self.usage.iter_expand(target, absent, raising):
+            each.push_option_ahead()
+            fixed = each.fix()
+            yield (Optional() if fixed is None else fixed), has
+
+    def match(self, argv, repeat_match, part=None):
+        """Match the expansions in order.
+
+        As `Docpie._dispatch` does to the expanded usages, `part` can be
+        "dispatched" for the expansions whose required commands and options
+        may be in argv, "skipped" for the others, or None for all of them.
+        A skipped one can not match, but can raise an error when trying.
+
+        Only the expansions that may match or may raise are generated"""
+        if stats.active:
+            stats.count('matches')
+        absent = self._absent(argv)
+        if part == 'dispatched':
+            expansions = (x for x, _ in self._expansions('ok', absent)
+                          if self._may_match(x, absent))
+        else:
+            raising = self._raising(argv)
+            if part is None:
+                expansions = (
+                    x for x, has in self._expansions(
+                        'either', absent, raising)
+                    if has or self._may_match(x, absent))
+            elif raising:
+                expansions = (
+                    x for x, _ in self._expansions('has', absent, raising)
+                    if not self._may_match(x, absent))
+            else:
+                return False
+
+        for each in expansions:
+            if log.enabled:
+                logger.debug('matching expanded usage %s', each)
+            argv_clone = argv.clone()
+            if (each.match(argv_clone, repeat_match) and
+                    argv_clone.all_consumed()):
+                argv.restore(argv_clone)
+                self.matched_usage = each
+                self.matched_path = _branch_path(self.usage)
+                return True
+            # the copied options share their `ref`
+            each.reset()
+        return False
+
+    @staticmethod
+    def _absent(argv):
+        """Return the function that tells if a required atom can't be in
+        argv, as `Docpie._dispatch` checks"""
+        present = set(argv)
+
+        def absent(atom):
+            if isinstance(atom, Command):
+                return present.isdisjoint(atom.names)
+            return isinstance(atom, Option) and not argv.may_have(atom.names)
+        return absent
+
+    @staticmethod
+    def _may_match(usage, absent):
+        return not any(absent(x) for x in usage.required_atoms())
+
+    def options(self):
+        """Return the options in the usage"""
+        options = self._options
+        if options is None:
+            options = self._options = []
+            positional = False
+            stack = [self.usage]
+            while stack:
+                each = stack.pop()
+                if isinstance(each, Option):
+                    options.append(each)
+                elif isinstance(each, OptionsShortcut):
+                    stack.extend(each.options)
+                elif isinstance(each, list):    # Unit, Either
+                    stack.extend(each)
+                else:
+                    positional = True
+            self._positional = positional
+        return options
+
+    def _raising(self, argv):
+        """Return the set of the ids of the options that may raise an
+        error when matching argv"""
+        options = self.options()
+        positional = self._positional
+        return set(id(x) for x in options
+                   if _may_raise(x, argv, positional))
+
+    def reset(self):
+        if stats.active:
+            stats.count('resets')
+        self.matched_usage = None
+        self.matched_path = None
+        self.usage.reset()
+
+    def matched(self):
+        return self.matched_usage is not None
+
+    def get_value(self, appeared_only, in_repeat):
+        return self.matched_usage.get_value(appeared_only, in_repeat)
+
+    def get_sys_default_value(self, appeared_only, in_repeat):
+        return self.usage.get_sys_default_value(appeared_only, in_repeat)
+
+    def get_rest_default_values(self, appeared_only, in_repeat):
+        """Return the list of default values that the expansions except
+        the matched one give, to be merged in order the same as the
+        expanded usages.
+
+        A key with the same default in every expansion is merged the same
+        however many times, so it's given once. Only the keys that take
+        different defaults need to enumerate the expansions"""
+        _, variants = _default_variants(self.usage, appeared_only, in_repeat)
+        path = self.matched_path
+        # the keys of the matched one
+        matched = set()
+        if path is not None:
+            for each in _path_atoms(self.usage, iter(path)):
+                matched.update(
+                    each.get_sys_default_value(appeared_only, in_repeat))
+
+        same = {}
+        mixed = []
+        for key, (num, values) in variants.items():
+            if num - (key in matched) <= 0:
+                continue
+            if len(values) == 1:
+                value, = values.values()
+                same[key] = list(value) if isinstance(value, list) else value
+            else:
+                mixed.append(key)
+
+        result = [same]
+        if mixed:
+            if log.enabled:
+                logger.debug('%s has different defaults for %s',
+                             self, mixed)
+            for each in self.expansions():
+                if path is not None and _branch_path(self.usage) == path:
+                    # skip the matched one only once
+                    path = None
+                    continue
+                value = each.get_sys_default_value(appeared_only, in_repeat)
+                value = dict((x, value[x]) for x in mixed if x in value)
+                if value:
+                    result.append(value)
+        return result
+
+    def required_atoms(self):
+        return self.usage.required_atoms()
+
+    def expand_num(self):
+        return self.usage.expand_num()
+
+    def __reduce__(self):
+        return (self.__class__, (self.usage,))
+
+    @classmethod
+    def convert_2_dict(cls, obj):
+        return {
+            '__class__': obj.__class__.__name__,
+            'usage': obj.usage.convert_2_dict(obj.usage),
+        }
+
+    @classmethod
+    def convert_2_object(cls, dic, options, namedoptions):
+        assert dic['__class__'] == 'BranchedUsage'
+        return cls(convert_2_object(dic['usage'], options, namedoptions))
+
+    def __eq__(self, other):
+        if not isinstance(other, BranchedUsage):
+            return False
+        return self.usage == other.usage
+
+    def __str__(self):
+        return str(self.usage)
+
+    def __repr__(self):
+        return 'BranchedUsage(%r)' % (self.usage,)
+
+
+def _has_repeat(element):
+    """Return True if a unit inside `element` is repeated"""
+    for each in element:
+        if isinstance(each, Unit) and each.repeat:
+            return True
+        if isinstance(each, list) and _has_repeat(each):    # Unit, Either
+            return True
+    return False
+
+
+def _may_raise(option, argv, positional=True):
+    """Return False if matching `option` can't raise an error on argv.
+    Only an option with argument, or a flag with a value attached, can.
+
+    An option found after a Command or an Argument is matched, which is
+    only possible if `positional`, can't take the argument and raises"""
+    names = option.names
+    if not argv.may_have(names):
+        return False
+    ref = option.ref
+    if not argv.stdopt or (ref is not None and not (
+            argv.attachvalue and isinstance(ref, Required) and
+            not ref.repeat and len(ref) == 1 and
+            isinstance(ref[0], Argument))):
+        return True
+    attachopt = argv.attachopt
+    for index, token in enumerate(argv):
+        if not token.startswith('-') or token in ('-', '--'):
+            continue
+        for name in names:
+            if name.startswith('--'):
+                if not token.startswith(name):
+                    continue
+                rest = token[len(name):]
+                if rest and not rest.startswith('='):
+                    # `Argv.break_for_option` stops at `--name-ext`, and
+                    # `--name` may be found after it's taken away
+                    if ref is not None and positional:
+                        return True
+                    continue
+                attached = rest[1:] if rest else None
+            elif len(name) == 2 and not token.startswith('--'):
+                position = token.find(name[1], 1)
+                if position < 0:
+                    continue
+                # `-abc` may be split into `-a -bc`, then `-b` is found in
+                # a later round
+                if position > 1 and (
+                        ref is not None and positional or not attachopt):
+                    return True
+                attached = token[position + 1:] or None
+            else:
+                return True
+
+            if ref is None:
+                # `-ab` puts `-b` back to argv, which raises if unknown
+                if attached is not None and (
+                        name.startswith('--') or not attachopt or
+                        '-' + attached[0] not in argv.known):
+                    return True
+            elif attached is None:
+                # the following one may be taken by an Argument before
+                following = argv.current(index + 1)
+                if (positional or following is None or
+                        following.startswith('-')):
+                    return True
+            elif not attached or attached.startswith('-'):
+                return True
+    return False
+
+
+def _can_ok(element, absent):
+    """Return True if `element` has an expansion which is ok, see
+    `Unit.iter_expand`"""
+    if (absent is None or not isinstance(element, Required) or
+            _has_repeat(element)):
+        return True
+    if len(element) == 1 and isinstance(element[0], Either):
+        cls = element.__class__
+        for each in element[0]:
+            if any(absent(x) for x in each.required_atoms()):
+                continue
+            if _can_ok(cls(each, repeat=element.repeat).fix(), absent):
+                return True
+        return False
+    return all(_can_ok(x, absent) for x in element)
+
+
+def _can_have(element, raising):
+    """Return True if `element` has an expansion with one of the options
+    whose ids are in `raising`"""
+    if not raising:
+        return False
+    if isinstance(element, Option):
+        return id(element) in raising
+    if isinstance(element, OptionsShortcut):
+        return any(_can_have(x, raising) for x in element.expand())
+    if isinstance(element, list):    # Unit, Either
+        return any(_can_have(x, raising) for x in element)
+    return False
+
+
+def _feasible(target, ok, has, can_ok, can_have):
+    """Return True if the expansion can still be the `target` of
+    `Unit.iter_expand`: it's `ok` and `has` so far, and the rest can give
+    an ok one if `can_ok`, or one that has if `can_have`"""
+    if target is None:
+        return True
+    if target == 'ok':
+        return ok and can_ok
+    if target == 'has':
+        return has or can_have
+    return (ok and can_ok) or has or can_have
+
+
+def _head_target(target, ok, has, can_ok, can_have):
+    """Return the `target` for the next element of a unit, see
+    `_feasible`, or False if no expansion of it can do"""
+    if _feasible(target, False, has, can_ok, can_have):
+        return None
+    by_ok = _feasible(target, ok, has, can_ok, can_have)
+    by_has = _feasible(target, False, True, can_ok, can_have)
+    if by_ok and by_has:
+        return 'either'
+    if by_ok:
+        return 'ok'
+    if by_has:
+        return 'has'
+    return False
+
+
+def _branch_path(element):
+    """Return the `Either.matched_branch` of the branches taken, in order,
+    which tells the expansion that `iter_expand` generated last"""
+    if isinstance(element, Either):
+        index = element.matched_branch
+        return (index,) + _branch_path(element[index])
+    if isinstance(element, Unit):
+        result = ()
+        for each in element:
+            result += _branch_path(each)
+        return result
+    return ()
+
+
+def _path_atoms(element, path):
+    """Generate the atoms and `[options]` of the expansion of `path`, an
+    iterator of `_branch_path`"""
+    if isinstance(element, Either):
+        element = element[next(path)]
+    if isinstance(element, Unit):
+        for each in element:
+            for atom in _path_atoms(each, path):
+                yield atom
+    else:
+        yield element
+
+
+def _merge_default(old, new):
+    # as `Unit.get_sys_default_value`
+    if isinstance(old, int) and isinstance(new, int):
+        return old + new
+    return []
 
 
-formal_title_re = re.compile('[\\-_]')
+def _value_key(value):
+    # `False` and `0` are different defaults
+    if isinstance(value, list):
+        return (list, tuple(value))
+    return (type(value), value)
+
+
+def _default_variants(element, appeared_only, in_repeat):
+    """Return `(num, {key: (count, values)})` without expanding `element`:
+    `num` expansions, of which `count` have the key, and the `values`
+    dict of the defaults of the key in them, see `get_sys_default_value`"""
+    if isinstance(element, Unit):
+        in_repeat = in_repeat or element.repeat
+        if len(element) == 1 and isinstance(element[0], Either):
+            element = element[0]
+        else:
+            return _unit_default_variants(element, appeared_only, in_repeat)
+
+    if isinstance(element, Either):
+        num = 0
+        result = {}
+        for each in element:
+            each_num, variants = _default_variants(
+                each, appeared_only, in_repeat)
+            num += each_num
+            for key, (count, values) in variants.items():
+                old_count, old_values = result.get(key, (0, {}))
+                old_values.update(values)
+                result[key] = (old_count + count, old_values)
+        return num, result
+
+    # Atom, OptionsShortcut
+    result = {}
+    for key, value in element.get_sys_default_value(
+            appeared_only, in_repeat).items():
+        result[key] = (1, {_value_key(value): value})
+    return 1, result
+
+
+def _unit_default_variants(unit, appeared_only, in_repeat):
+    children = [_default_variants(x, appeared_only, in_repeat) for x in unit]
+    num = 1
+    for each_num, _ in children:
+        num *= each_num
+
+    keys = set()
+    for _, variants in children:
+        keys.update(variants)
+
+    result = {}
+    for key in keys:
+        lacking = 1
+        values = {}
+        # if none of the children before gives the key
+        may_lack = True
+        for each_num, variants in children:
+            count, each_values = variants.get(key, (0, {}))
+            lacking *= each_num - count
+            if in_repeat:
+                # the last one wins
+                if count == each_num:
+                    values = {}
+                values.update(each_values)
+            else:
+                merged = {}
+                if count:
+                    for old in values.values():
+                        for new in each_values.values():
+                            value = _merge_default(old, new)
+                            merged[_value_key(value)] = value
+                    if may_lack:
+                        merged.update(each_values)
+                if count < each_num:
+                    merged.update(values)
+                values = merged
+            may_lack = may_lack and count < each_num
+        result[key] = (num - lacking, values)
+    return num, result
+
+
+Atom.class_cache = TokenCache(Atom.classify)
+
+
+def convert_2_dict(obj):
+    return obj.convert_2_dict(obj)
 
 
 def convert_2_object(dic, options, namedoptions):
@@ -1578,7 +2511,9 @@ def convert_2_object(dic, options, namedoptions):
 
         'Optional': Unit.convert_2_object,
         'Required': Unit.convert_2_object,
-        'OptionsShourtcut': OptionsShortcut.convert_2_object,
+        'OptionsShortcut': OptionsShortcut.convert_2_object,
+        'Either': Either.convert_2_object,
+        'BranchedUsage': BranchedUsage.convert_2_object,
     }
 
     if cls_name in name_to_method:
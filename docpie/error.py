@@ -57,5 +57,95 @@ class AmbiguousPrefixExit(DocpieExit):
         self.ambiguous = ambiguous
 
 
+class UnknownCommandExit(DocpieExit):
+    """The subcommand in argv is not registered, see `Docpie.dispatch`"""
+    def __init__(self, message, command=None):
+        super(UnknownCommandExit, self).__init__(message)
+        self.command = command
+
+
 class DocpieError(Exception, DocpieException):
     """Error in construction of usage-message by developer."""
+
+
+class ErrorRecord(object):
+    """A failed match returned by `Docpie.docpie` instead of raising, when
+    the `errorrecord` config is on. It's false in a boolean context.
+
+    `error` is the raised `DocpieExit` without the help text, `option` the
+    option it's about (`UnknownOptionExit.option`, `ArgumentExit.option`
+    or `AmbiguousPrefixExit.prefix`), `token` the offending token and
+    `index` its index in `argv`, both None if unknown.
+
+    The full `DocpieExit` that `docpie` would raise, with the help text,
+    is only rendered when `exception` or `message` is accessed."""
+
+    def __init__(self, error, argv=None, pie=None):
+        self.error = error
+        self.option = getattr(error, 'option', None)
+        if isinstance(error, AmbiguousPrefixExit):
+            self.option = error.prefix
+            self.token = error.prefix
+        elif isinstance(error, UnknownOptionExit):
+            self.token = error.inside or error.option
+        elif isinstance(error, UnknownCommandExit):
+            self.token = error.command
+        else:
+            self.token = getattr(error, 'hit', None)
+        self.index = self._find_index(argv)
+        self._pie = pie
+        self._exception = None
+
+    def _find_index(self, argv):
+        if not argv:
+            return None
+        names = self.option
+        if not isinstance(names, (set, frozenset, list, tuple)):
+            names = (names,)
+        for targets in ((self.token,), names):
+            for target in targets:
+                if not target:
+                    continue
+                for index, each in enumerate(argv):
+                    if index and (each == target or
+                                  each.startswith(target + '=')):
+                        return index
+        return None
+
+    @property
+    def error_class(self):
+        return self.error.__class__
+
+    @property
+    def exception(self):
+        """The `DocpieExit` with the help text, as `docpie` raises"""
+        if self._exception is None:
+            if self._pie is None:
+                return self.error
+            try:
+                self._pie.exception_handler(self.error)
+            except DocpieExit as e:
+                self._exception = e
+        return self._exception
+
+    @property
+    def message(self):
+        """The message with the help text"""
+        return str(self.exception)
+
+    def __getstate__(self):
+        # render now, the `Docpie` is not pickled with it
+        state = dict(self.__dict__)
+        state['_exception'] = self.exception
+        state['_pie'] = None
+        return state
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '%s(%s, option=%r, token=%r, index=%r)' % (
+            self.__class__.__name__, self.error_class.__name__,
+            self.option, self.token, self.index)
@@ -0,0 +1,32 @@
+'''
+The same as git.py, but the subcommands are dispatched in this process,
+and the doc of each one is only parsed when it's called.
+'''
+
+from docpie import Docpie
+import sys
+import os
+
+COMMANDS = 'add branch checkout clone commit push remote'.split()
+
+
+def show(pie, sub):
+    print('global arguments:')
+    print(dict(pie))
+    print('command arguments:')
+    print(dict(sub))
+
+
+if __name__ == '__main__':
+
+    top_dir = os.path.abspath(os.path.dirname(__file__))
+    sys.path.insert(0, top_dir)
+
+    import git
+
+    pie = Docpie(git.__doc__, name='git.py',
+                 version='git version 1.7.4.4', optionsfirst=True)
+    for command in COMMANDS:
+        pie.add_command(command, path='git_%s' % command, handler=show)
+
+    pie.dispatch()
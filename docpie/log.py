@@ -0,0 +1,60 @@
+"""
+The switch of docpie's debug logging.
+
+docpie can log every step of parsing and matching at DEBUG level. Even
+when nothing handles DEBUG, each call still costs a function call and the
+evaluation of its arguments, so all of them are guarded by `enabled` and
+skipped entirely when it's off.
+
+`enabled` follows the "docpie" loggers: it's True if any of them is
+enabled for DEBUG, so the usual `logging` configuration works:
+
+    import logging
+    logging.getLogger('docpie').setLevel(logging.DEBUG)
+
+It's checked by `refresh`, which `Docpie` calls before parsing a doc and
+before matching an argv. `enable()` turns it on regardless of the level,
+`disable()` off, and `enable(None)` follows the loggers again. Setting the
+environment variable `DOCPIE_DEBUG=1` before importing docpie is the same
+as `enable()`.
+"""
+
+import os
+import logging
+
+__all__ = ['enabled', 'enable', 'disable', 'refresh']
+
+# the loggers of the modules guarded by `enabled`
+LOGGERS = ('docpie', 'docpie.element', 'docpie.tokens', 'docpie.parser')
+_loggers = [logging.getLogger(name) for name in LOGGERS]
+
+# True/False if set by `enable`, None to follow the loggers
+forced = True if os.environ.get('DOCPIE_DEBUG') else None
+enabled = bool(forced)
+
+
+def refresh():
+    """Set `enabled` by the level of the loggers, unless it's forced.
+    Return it"""
+    global enabled
+    if forced is not None:
+        enabled = forced
+    else:
+        enabled = any(x.isEnabledFor(logging.DEBUG) for x in _loggers)
+    return enabled
+
+
+def enable(flag=True):
+    """Turn the debug logging on, or off if `flag` is false. None makes it
+    follow the level of the loggers again"""
+    global forced
+    forced = None if flag is None else bool(flag)
+    refresh()
+
+
+def disable():
+    """Turn the debug logging off"""
+    enable(False)
+
+
+refresh()
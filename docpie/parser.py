@@ -1,12 +1,13 @@
 from docpie.element import Atom, Option, Command, Argument
 from docpie.element import Optional, Required, OptionsShortcut
-from docpie.element import Either
+from docpie.element import Either, BranchedUsage
 from docpie.tokens import Token
 from docpie.error import DocpieError
+from docpie.pattern import LazyPattern
+from docpie import log, stats
 
 import logging
 import re
-import textwrap
 import warnings
 
 logger = logging.getLogger('docpie.parser')
@@ -15,7 +16,8 @@ logger = logging.getLogger('docpie.parser')
 class Parser(object):
 
     def parse_pattern(self, token):
-        logger.debug('get token %s', token)
+        if log.enabled:
+            logger.debug('get token %s', token)
         elements = []
         while token:
             atom = token.current()
@@ -27,10 +29,12 @@ class Parser(object):
                 assert atom != '...', 'fix me: unexpected "..." when parsing'
                 elements.extend(self.parse_element(token))
 
-        logger.debug(elements)
+        if log.enabled:
+            logger.debug(elements)
         if '|' in elements:
             elements[:] = [self.parse_pipe(elements)]
-        logger.debug('parsed result %s', elements)
+        if log.enabled:
+            logger.debug('parsed result %s', elements)
         return elements
 
     def parse_bracket(self, token):
@@ -77,7 +81,8 @@ class Parser(object):
                 self.get_short_option_with_arg(current, token)
 
         if flag is not None:
-            logger.debug('parsing flag %s, %s, %s', flag, arg_token, token)
+            if log.enabled:
+                logger.debug('parsing flag %s, %s, %s', flag, arg_token, token)
             if arg_token is not None:
                 ref_lis = self.parse_pattern(arg_token)
                 ref = Required(*ref_lis).fix()
@@ -88,7 +93,7 @@ class Parser(object):
             for opt_2_ins in self.titled_opt_to_ins.values():
                 if flag in opt_2_ins:
                     opt_ins = opt_2_ins[flag][0]
-                    ins.names.update(opt_ins.names)
+                    ins.add_names(*opt_ins.names)
                     # != won't work on pypy
                     if not (ins == opt_ins):
                         raise DocpieError(
@@ -261,8 +266,9 @@ class Parser(object):
 
                         ref_ins = self.parse_pattern(ref_token)
 
-                        logger.debug(ins_in_opt.ref)
-                        logger.debug(ref_ins[0])
+                        if log.enabled:
+                            logger.debug(ins_in_opt.ref)
+                            logger.debug(ref_ins[0])
 
                         if len(ref_ins) != 1:
                             raise DocpieError(
@@ -284,7 +290,8 @@ class Parser(object):
         repeat = token.check_ellipsis_and_drop()
         if repeat:
             ins = Required(ins, repeat=True)
-        logger.debug('%s -> %s', current, ins)
+        if log.enabled:
+            logger.debug('%s -> %s', current, ins)
         return (ins,)
 
     def parse_options_shortcut(self, title, token):
@@ -302,16 +309,18 @@ class Parser(object):
         if self.namedoptions:
             for exists_title, options in title_opt_2_ins.items():
                 if (formal_title == self.formal_title(exists_title)):
-                    logger.debug('find %s for %s', exists_title, title)
+                    if log.enabled:
+                        logger.debug('find %s for %s', exists_title, title)
                     return options
             else:
-                logger.debug('%s options not found in %s',
-                             title, title_opt_2_ins)
+                if log.enabled:
+                    logger.debug('%s options not found in %s',
+                                 title, title_opt_2_ins)
                 raise DocpieError('%s options not found' % title)
 
         return sum(title_opt_2_ins.values(), [])
 
-    formal_title_re = re.compile(r'[\-_]')
+    formal_title_re = LazyPattern(r'[\-_]')
 
     def formal_title(self, title):
         return self.formal_title_re.sub(' ', title.lower()).strip()
@@ -335,13 +344,14 @@ class Parser(object):
 
         return Either(*groups)
 
-    started_empty_lines = re.compile(r'^\s*?\n(?P<rest>.*)')
+    started_empty_lines = LazyPattern(r'^\s*?\n(?P<rest>.*)')
 
     @classmethod
     def drop_started_empty_lines(cls, text):
         # drop the empty lines at start
         # different from lstrip
-        logger.debug(repr(text))
+        if log.enabled:
+            logger.debug(repr(text))
         m = cls.started_empty_lines.match(text)
         if m is None:
             return text
@@ -349,20 +359,20 @@ class Parser(object):
 
 
 class OptionParser(Parser):
-    split_re = re.compile(r'(<.*?>)|\s+')
-    wrap_symbol_re = re.compile(r'([\|\[\]\(\)]|\.\.\.)')
-    line_re = re.compile(r'^(?P<indent> *)'
-                         r'(?P<option>[\d\w=_, <>\-\[\]\.]+?)'
-                         r'(?P<separater>$| $| {2,})'
-                         r'(?P<description>.*?)'
-                         r' *$',
-                         flags=re.IGNORECASE)
+    split_re = LazyPattern(r'(<.*?>)|\s+')
+    wrap_symbol_re = LazyPattern(r'([\|\[\]\(\)]|\.\.\.)')
+    line_re = LazyPattern(r'^(?P<indent> *)'
+                          r'(?P<option>[\d\w=_, <>\-\[\]\.]+?)'
+                          r'(?P<separater>$| $| {2,})'
+                          r'(?P<description>.*?)'
+                          r' *$',
+                          flags=re.IGNORECASE)
 
-    indent_re = re.compile(r'^(?P<indent> *)')
-    to_space_re = re.compile(r',\s?|=')
+    indent_re = LazyPattern(r'^(?P<indent> *)')
+    to_space_re = LazyPattern(r',\s?|=')
 
-    visible_empty_line_re = re.compile(r'^\s*?\n*|\r?\n(:?[\ \t]*\r?\n)+',
-                                       flags=re.DOTALL)
+    visible_empty_line_re = LazyPattern(r'^\s*?\n*|\r?\n(:?[\ \t]*\r?\n)+',
+                                        flags=re.DOTALL)
 
     option_split_re_str = (r'([^\r\n]*{0}[\ \t]*\r?\n?)')
 
@@ -377,8 +387,8 @@ class OptionParser(Parser):
     #                         r' *'
     #                         r'[\.\?\!]? *$',
     #                         flags=re.IGNORECASE)
-    default_re = re.compile(r'\[default: (?P<default>.*?)\] *$',
-                            flags=re.IGNORECASE)
+    default_re = LazyPattern(r'\[default: (?P<default>.*?)\] *$',
+                             flags=re.IGNORECASE)
 
     def __init__(self, option_name, case_sensitive,
                  stdopt, attachopt, attachvalue, namedoptions):
@@ -459,16 +469,19 @@ class OptionParser(Parser):
                 if prefix in raw_content:
                     # TODO: better handling way?
                     if self.namedoptions:
-                        log = logger.warning
+                        logger.warning('duplicated options section %s', prefix)
                     else:
-                        log = logger.debug
-                    log('duplicated options section %s', prefix)
+                        if log.enabled:
+                            logger.debug('duplicated options section %s',
+                                         prefix)
 
                     raw_content[prefix] += '\n%s%s' % (title, section)
                 else:
                     raw_content[prefix] = title + section
 
         if formal_collect:
+            # not needed by a doc loaded from the cache
+            import textwrap
             for each_title, values in formal_collect.items():
                 value = '\n'.join(map(textwrap.dedent, values))
                 formal_collect[each_title] = value
@@ -485,7 +498,8 @@ class OptionParser(Parser):
                 result[title] = []
                 continue
 
-            logger.debug('\n' + text)
+            if log.enabled:
+                logger.debug('\n' + text)
 
             collect = []
             to_list = text.splitlines()
@@ -510,7 +524,8 @@ class OptionParser(Parser):
                 collect[-1]['default'] = self.parse_default(previous_line)
                 # deal this option
                 collect.append(self.parse_line_option_indent(line))
-                logger.debug(collect[-1])
+                if log.enabled:
+                    logger.debug(collect[-1])
                 previous_line = line
             else:
                 collect[-1]['default'] = self.parse_default(previous_line)
@@ -520,7 +535,7 @@ class OptionParser(Parser):
 
         return result
 
-    spaces_re = re.compile(r'(\ \ \s*|\t\s*)')
+    spaces_re = LazyPattern(r'(\ \ \s*|\t\s*)')
 
     @classmethod
     def cut_first_spaces_outside_bracket(cls, string):
@@ -554,19 +569,49 @@ class OptionParser(Parser):
         opt_str, separater, description_str = \
                 cls.cut_first_spaces_outside_bracket(line)
 
-        logger.debug('%(line)s -> %(opt_str)r, '
-                     '%(separater)r, '
-                     '%(description_str)r' % locals())
+        if log.enabled:
+            logger.debug('%s -> %r, %r, %r',
+                         line, opt_str, separater, description_str)
         if description_str.strip():
             indent = len(opt_str.expandtabs()) + len(separater.expandtabs())
-            logger.debug('indent: %s', indent)
+            if log.enabled:
+                logger.debug('indent: %s', indent)
         else:
             indent = 2 + len(cls.indent_re.match(
                                  opt_str.expandtabs()
                             ).groupdict()['indent'])
-            logger.debug('indent: %s', indent)
+            if log.enabled:
+                logger.debug('indent: %s', indent)
         return {'option': opt_str.strip(), 'indent': indent}
 
+    @classmethod
+    def scan_flags(cls, text, stdopt):
+        """A cheap guess of the options without parsing `text`.
+
+        Return [(names, max_args), ...] for each line starts with "-",
+        max_args is 1 if the option seems to take argument, otherwise 0"""
+        result = []
+        for line in text.splitlines():
+            if not line.lstrip().startswith('-'):
+                continue
+            opt_str = cls.cut_first_spaces_outside_bracket(line)[0]
+            names = set()
+            max_args = 0
+            for each in opt_str.replace(',', ' ').replace('=', ' ').split():
+                if each in ('-', '--', '...'):
+                    continue
+                if not each.startswith('-'):
+                    max_args = 1
+                    continue
+                if stdopt and not each.startswith('--') and len(each) > 2:
+                    each, value = each[:2], each[2:]
+                    if value != '...':
+                        max_args = 1
+                names.add(each)
+            if names:
+                result.append((names, max_args))
+        return result
+
     @classmethod
     def parse_default(cls, line):
         m = cls.default_re.search(line)
@@ -578,10 +623,12 @@ class OptionParser(Parser):
         """{title: [Option(), ...]}"""
         result = {}
         for title, name_and_default in title_of_name_and_default.items():
-            logger.debug((title, name_and_default))
+            if log.enabled:
+                logger.debug((title, name_and_default))
             result[title] = opts = []
             for opt_str, default in name_and_default:
-                logger.debug('%s:%r' % (opt_str, default))
+                if log.enabled:
+                    logger.debug('%s:%r', opt_str, default)
                 opt, repeat = self.parse_opt_str(opt_str)
                 opt.default = default
                 opt_ins = Optional(opt, repeat=repeat)
@@ -604,7 +651,8 @@ class OptionParser(Parser):
 
         # -sth=<goes> ON -> -sth, <goes>, ON
         opt_lis = self.opt_str_to_list(opt)
-        logger.debug('%r -> %s' % (opt, opt_lis))
+        if log.enabled:
+            logger.debug('%r -> %s', opt, opt_lis)
 
         first = opt_lis.pop(0)
         if not first.startswith('-'):
@@ -638,7 +686,7 @@ class OptionParser(Parser):
         for each in opt_lis:
             if each.startswith('-'):    # alias
                 name, value = self.split_short_by_cfg(each)
-                opt_ins.names.add(name)
+                opt_ins.add_names(name)
                 if value:
                     args_ins.append(Required(Argument(value)))
                 if args:    # trun it into instance
@@ -690,9 +738,10 @@ class OptionParser(Parser):
                                   opt_ins, this_range, current_range))
 
         if len(current_range) > 1:
-            logger.debug('too many possibilities: '
-                         'option %s expect %s arguments',
-                         name, '/'.join(map(str, current_range)))
+            if log.enabled:
+                logger.debug('too many possibilities: '
+                             'option %s expect %s arguments',
+                             name, '/'.join(map(str, current_range)))
 
         # TODO: check if current_ins contain Command(not allowed in fact)
         opt_ins.ref = current_ins
@@ -708,18 +757,18 @@ class OptionParser(Parser):
 
 class UsageParser(Parser):
 
-    angle_bracket_re = re.compile(r'(<.*?>)')
-    wrap_symbol_re = re.compile(
+    angle_bracket_re = LazyPattern(r'(<.*?>)')
+    wrap_symbol_re = LazyPattern(
         r'(\[[^\]\s]*?options\]|\.\.\.|\||\[|\]|\(|\))'
     )
-    split_re = re.compile(r'(\[[^\]\s]*?options\]|\S*<.*?>\S*)|\s+')
+    split_re = LazyPattern(r'(\[[^\]\s]*?options\]|\S*<.*?>\S*)|\s+')
     # will match '-', '--', and
     # flag ::= "-" [ "-" ] chars "=<" chars ">"
     # it will also match '---flag', so use startswith('---') to check
-    std_flag_eq_arg_re = re.compile(r'(?P<flag>^-{1,2}[\da-zA-Z_\-]*)'
-                                    r'='
-                                    r'(?P<arg><.*?>)'
-                                    r'$')
+    std_flag_eq_arg_re = LazyPattern(r'(?P<flag>^-{1,2}[\da-zA-Z_\-]*)'
+                                     r'='
+                                     r'(?P<arg><.*?>)'
+                                     r'$')
 
     usage_re_str = (r'(?:^|\n)'
                     r'(?P<raw>'
@@ -731,7 +780,8 @@ class UsageParser(Parser):
                     r'(?:\n\s*\n|\n\s*$|$)')
 
     def __init__(self, usage_name, case_sensitive,
-                 stdopt, attachopt, attachvalue, namedoptions):
+                 stdopt, attachopt, attachvalue, namedoptions,
+                 maxexpansion=None):
 
         self.usage_name = re.escape(usage_name)
         self.case_sensitive = case_sensitive
@@ -746,16 +796,19 @@ class UsageParser(Parser):
         self.instances = None
         self.all_options = None
         self.namedoptions = namedoptions
+        # keep the usage as `BranchedUsage` if it expands to more usages
+        self.maxexpansion = maxexpansion
         # self._chain = self._parse_text(text, name)
 
-    def parse(self, text, name, options):
+    def parse(self, text, name, options, lines=None):
+        """`lines` is the result of `parse_lines` if it's known"""
         self.options = options
         self.set_option_name_2_instance(options)
         if text is not None:
             self.parse_content(text)
         if self.formal_content is None:
             raise DocpieError('"Usage:" not found')
-        self.parse_2_instance(name)
+        self.parse_2_instance(name, lines)
         self.fix_option_and_empty()
 
     def set_option_name_2_instance(self, options):
@@ -783,7 +836,8 @@ class UsageParser(Parser):
             return
 
         dic = match.groupdict()
-        logger.debug(dic)
+        if log.enabled:
+            logger.debug(dic)
         self.raw_content = dic['raw']
         if dic['sep'] in ('\n', '\r\n'):
             self.formal_content = dic['section']
@@ -794,15 +848,21 @@ class UsageParser(Parser):
         drop_name = match.expand('%s\\g<sep>\\g<section>' % replace)
         self.formal_content = self.drop_started_empty_lines(drop_name).rstrip()
 
-    def parse_2_instance(self, name):
+    def parse_lines(self, name):
+        """Return the list of strings of each usage line"""
+        lines = self.split_line_by_indent(self.formal_content)
+        return [self.parse_line_to_lis(each_line, name) for each_line in lines]
+
+    def parse_2_instance(self, name, lines=None):
+        if lines is None:
+            lines = self.parse_lines(name)
         result = []
-        for each_line in self.split_line_by_indent(self.formal_content):
-            raw_str_lis = self.parse_line_to_lis(each_line, name)
+        for raw_str_lis in lines:
             chain = self.parse_pattern(Token(raw_str_lis))
             result.append(chain)
         self.instances = result
 
-    indent_re = re.compile(r'^ *')
+    indent_re = LazyPattern(r'^ *')
 
     def split_line_by_indent(self, text):
         lines = text.splitlines()
@@ -898,10 +958,21 @@ class UsageParser(Parser):
 
         return opt_ouside, opt_cuts
 
+    @classmethod
+    def expand_options_shortcut(cls, element):
+        # `[options]` always expands to one `Optional`
+        for index, each in enumerate(element):
+            if isinstance(each, OptionsShortcut):
+                element[index] = each.expand()[0]
+            elif isinstance(each, list):
+                cls.expand_options_shortcut(each)
+        return element
+
     def fix_option_and_empty(self):
         result = []
         all_options = []
-        logger.debug(self.titled_opt_to_ins)
+        if log.enabled:
+            logger.debug(self.titled_opt_to_ins)
         for options in self.titled_opt_to_ins.values():
             for each_potion in options.values():
                 all_options.append(each_potion[0])
@@ -915,7 +986,8 @@ class UsageParser(Parser):
             outside_opts, opt_shortcuts = \
                 self.find_optionshortcut_and_outside_option_names(ins)
 
-            logger.debug(outside_opts)
+            if log.enabled:
+                logger.debug(outside_opts)
 
             for opt_cut in opt_shortcuts:
                 for opt_ins in outside_opts:
@@ -923,6 +995,15 @@ class UsageParser(Parser):
 
             all_options.extend(outside_opts)
 
+            if (self.maxexpansion is not None and
+                    ins.expand_num() > self.maxexpansion):
+                if log.enabled:
+                    logger.debug('keep %s unexpanded', ins)
+                result.append(
+                    BranchedUsage(self.expand_options_shortcut(ins)))
+                continue
+
+            started = stats.start()
             for usage in ins.expand():
                 usage.push_option_ahead()
                 # [options] -a
@@ -933,6 +1014,7 @@ class UsageParser(Parser):
                     result.append(Optional())
                 else:
                     result.append(r)
+            stats.stop('expand', started)
 
         self.instances = result
         self.all_options = all_options
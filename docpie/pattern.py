@@ -0,0 +1,39 @@
+"""
+Regular expressions compiled when first used.
+
+The parsers and elements keep their patterns as class attributes. Compiled
+at class definition, they cost the import of docpie even when no doc is
+parsed, e.g. the doc is loaded from a cache, or the program only answers
+`--version`:
+
+    class Parser(object):
+        split_re = LazyPattern(r'(<.*?>)|\\s+')
+
+On the first access the attribute is replaced by the compiled pattern, so
+it's a plain class attribute after that.
+"""
+
+import re
+
+__all__ = ['LazyPattern']
+
+
+class LazyPattern(object):
+    """A class attribute which compiles `pattern` with `flags` on the first
+    access"""
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __get__(self, instance, owner):
+        compiled = re.compile(self.pattern, self.flags)
+        # replace itself in the class that defines it
+        for cls in owner.__mro__:
+            for name, value in vars(cls).items():
+                if value is self:
+                    setattr(cls, name, compiled)
+        return compiled
+
+    def __repr__(self):
+        return 'LazyPattern(%r, %r)' % (self.pattern, self.flags)
@@ -1,12 +1,17 @@
 import sys
+import copy
 import logging
+import threading
+from collections import deque
 
 import warnings
-import textwrap
-from docpie.error import DocpieExit, DocpieError
+from docpie import log, stats, __version__
+from docpie.error import DocpieExit, DocpieError, ErrorRecord, \
+                         UnknownCommandExit, ArgumentExit
 from docpie.parser import UsageParser, OptionParser
-from docpie.element import convert_2_object, convert_2_dict
-from docpie.tokens import Argv
+from docpie.element import convert_2_object, convert_2_dict, \
+                           Atom, Command, Option, BranchedUsage
+from docpie.tokens import Argv, TokenCache
 
 __all__ = ['Docpie']
 
@@ -17,12 +22,43 @@ except NameError:
 
 logger = logging.getLogger('docpie')
 
+# guards the first `Docpie.parse` of each instance
+_context_lock = threading.Lock()
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for each in iterable:
+        chunk.append(each)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# the `Docpie` of a worker process of `Docpie.parse_many`
+_worker = None
+# `ProcessPoolExecutor(initializer=...)` is new in python 3.7
+_pool_initializer = sys.version_info >= (3, 7)
+
+
+def _init_worker(pie):
+    global _worker
+    _worker = pie
+
+
+def _parse_chunk(argvs, pie=None):
+    # `pie` is sent with each chunk when there is no `_init_worker`
+    if pie is None:
+        pie = _worker
+    return list(pie._parse_many(argvs))
+
 
 class Docpie(dict):
 
-    # Docpie version
-    # it's not a good idea, but it can avoid loop importing
-    _version = '0.4.4'
+    # Docpie version, defined in `docpie/__init__.py`
+    _version = __version__
 
     option_name = 'Options:'
     usage_name = 'Usage:'
@@ -41,16 +77,50 @@ class Docpie(dict):
     appeared_only = False
     extra = {}
     namedoptions = False
-
-    opt_names = []
-    opt_names_required_max_args = {}
+    maxexpansion = None
+    tokencache = 1024
+    error_record = False
+    # a `docpie.stats.Stats` if the `stats` config is on
+    stats = None
+    cache = None
+
+    # `lazy` mode: the doc is not parsed until these attributes are needed
+    _pending_init = False
+    _lazy_attrs = ('usage_text', 'option_sections', 'options', 'usages',
+                   'opt_names', 'opt_names_required_max_args')
+    # see `_known_flags`
+    _known_flags_cache = None
+    # see `_dispatch`
+    _dispatch_cache = None
+    # see `parse`
+    _contexts = None
+    # see `_help_text`
+    _help_cache = None
+    # name: `Subcommand`, see `add_command`
+    commands = None
+    # see `_parse`
+    _parsed_stages = None
+    _stages = ('sections', 'lines', 'instances')
+    # the first stage of `_parse` that depends on each config
+    _config_stages = {
+        'case_sensitive': 'sections',
+        'name': 'lines',
+        'stdopt': 'instances',
+        'attachopt': 'instances',
+        'attachvalue': 'instances',
+        'namedoptions': 'instances',
+        'maxexpansion': 'instances',
+    }
+    _help_kinds = ('error', 'doc', 'brief', 'brief_notice')
 
     def __init__(self, doc=None, help=True, version=None,
                  stdopt=True, attachopt=True, attachvalue=True,
                  helpstyle='python',
                  auto2dashes=True, name=None, case_sensitive=False,
                  optionsfirst=False, appearedonly=False, namedoptions=False,
-                 extra=None):
+                 extra=None, cache=None, lazy=False, maxexpansion=None,
+                 tokencache=1024, errorrecord=False,
+                 stats=False):
 
         super(Docpie, self).__init__()
 
@@ -68,48 +138,176 @@ class Docpie(dict):
             stdopt=stdopt, attachopt=attachopt, attachvalue=attachvalue,
             auto2dashes=auto2dashes, name=name, case_sensitive=case_sensitive,
             optionsfirst=optionsfirst, appearedonly=appearedonly,
-            namedoptions=namedoptions)
+            namedoptions=namedoptions, maxexpansion=maxexpansion,
+            tokencache=tokencache, errorrecord=errorrecord, stats=stats)
 
         self.help = help
         self.helpstyle = helpstyle
         self.version = version
         self.extra = extra
 
+        if cache is True or isinstance(cache, StrType):
+            # imported when needed, it brings `json`, `hashlib`, `tempfile`
+            from docpie.cache import DocpieCache
+            cache = DocpieCache(None if cache is True else cache)
+        self.cache = cache
+
         if doc is not None:
             self.doc = doc
-            self._init()
+            if lazy:
+                self._pending_init = True
+                self._scan_flags()
+                self.set_config(help=self.help,
+                                version=self.version,
+                                extra=dict(self.extra))
+            else:
+                self._init()
+
+    def __getattr__(self, name):
+        # only called when the attribute is not found
+        if name in self._lazy_attrs:
+            if self._pending_init:
+                self._init()
+                return getattr(self, name)
+            if name == 'opt_names':
+                return []
+            if name == 'opt_names_required_max_args':
+                return {}
+        raise AttributeError("'%s' object has no attribute '%s'" %
+                             (self.__class__.__name__, name))
+
+    def _scan_flags(self):
+        # used before the doc is parsed in `lazy` mode
+        names = []
+        max_args = {}
+        for each_names, each_max_args in OptionParser.scan_flags(
+                self.doc, self.stdopt):
+            names.append(each_names)
+            for name in each_names:
+                max_args[name] = each_max_args
+        self._scanned_flags = (names, max_args)
+
+    def _flags(self):
+        """Return `(opt_names, opt_names_required_max_args)`, the scanned
+        guess if the doc is not parsed yet"""
+        if self._pending_init:
+            return self._scanned_flags
+        return self.opt_names, self.opt_names_required_max_args
+
+    def _init(self, since='sections'):
+        log.refresh()
+        with self._recording():
+            self._init_parsed(since)
+
+    def _init_parsed(self, since):
+        pending = self._pending_init
+        # cleared first so the attributes read in `_parse` are not lazy
+        self._pending_init = False
+        try:
+            self._load_or_parse(since)
+        except BaseException:
+            # still pending: the next call raises the same error
+            self._pending_init = pending
+            raise
+
+        self.set_config(help=self.help,
+                        version=self.version,
+                        extra=dict(self.extra))
 
-    def _init(self):
+    def _load_or_parse(self, since):
+        cache = self.cache
+        data = None
+        if cache is not None:
+            key = cache.make_key(self)
+            data = cache.get(key, self._version)
+            if data is not None:
+                if log.enabled:
+                    logger.debug('load parsed doc from cache %s', key)
+                try:
+                    self._load_parsed(data)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning('broken cache %s: %r', key, e)
+                    cache.discard(key)
+                    data = None
+
+        if data is None:
+            self._parse(since)
+            if cache is not None:
+                cache.set(key, self._version, self._dump_parsed())
+
+    def _parse(self, since='sections'):
+        """Parse the doc in 3 stages:
+
+        sections: find the usage and options sections, and the options
+            strings with their defaults in them
+        lines: split the usage section into the strings of each line
+        instances: create the options and usages
+
+        The stages before `since` are reused from the last parse of the
+        same doc, see `_config_stages`"""
         uparser = UsageParser(
             self.usage_name, self.case_sensitive,
-            self.stdopt, self.attachopt, self.attachvalue, self.namedoptions)
+            self.stdopt, self.attachopt, self.attachvalue, self.namedoptions,
+            self.maxexpansion)
         oparser = OptionParser(
             self.option_name, self.case_sensitive,
             self.stdopt, self.attachopt, self.attachvalue, self.namedoptions)
 
-        uparser.parse_content(self.doc)
-        self.usage_text = usage_text = uparser.raw_content
-        # avoid usage contains "Options:" word
-        if usage_text is None:
-            assert self.usage_name.lower() not in self.doc.lower()
-            raise DocpieError(
-                'usage title %r not found in doc' % (self.usage_name,)
-            )
-        prefix, _, suffix = self.doc.partition(usage_text)
-
-        oparser.parse(prefix + suffix)
-        self.option_sections = oparser.raw_content
-        self.options = oparser.instances
-
-        uparser.parse(None, self.name, self.options)
+        source = (self.doc, self.usage_name, self.option_name)
+        stages = self._parsed_stages
+        if stages is None or stages[0] != source:
+            since = 'sections'
+
+        if since == 'sections':
+            started = stats.start()
+            uparser.parse_content(self.doc)
+            stats.stop('usage', started)
+            usage_text = uparser.raw_content
+            # avoid usage contains "Options:" word
+            if usage_text is None:
+                assert self.usage_name.lower() not in self.doc.lower()
+                raise DocpieError(
+                    'usage title %r not found in doc' % (self.usage_name,)
+                )
+            prefix, _, suffix = self.doc.partition(usage_text)
+
+            started = stats.start()
+            oparser.parse_content(prefix + suffix)
+            sections = (usage_text, uparser.formal_content,
+                        oparser.raw_content, oparser.parse_names_and_default())
+            stats.stop('option', started)
+            lines = None
+        else:
+            if log.enabled:
+                logger.debug('reuse the parsed stages before %s', since)
+            _, sections, lines = stages
+            if since == 'lines':
+                lines = None
+
+        (self.usage_text, uparser.formal_content,
+         option_sections, names_and_default) = sections
+
+        started = stats.start()
+        if lines is None:
+            lines = uparser.parse_lines(self.name)
+        stats.stop('usage', started)
+        self._parsed_stages = (source, sections, lines)
+
+        started = stats.start()
+        self.option_sections = dict(option_sections)
+        self.options = oparser.parse_to_instance(names_and_default)
+        stats.stop('option', started)
+
+        started = stats.start()
+        uparser.parse(None, self.name, self.options, lines)
+        stats.stop('usage', started)
         self.usages = uparser.instances
 
         self.opt_names_required_max_args = {}
 
         for opt_ins in uparser.all_options:
             if opt_ins.ref:
-                # max_arg = max(opt_ins.arg_range())
-                max_arg = max(opt_ins.ref.arg_range())
+                max_arg = opt_ins.ref.arg_bounds()[1]
             else:
                 max_arg = 0
 
@@ -121,10 +319,6 @@ class Docpie(dict):
             for each_option in options:
                 self.opt_names.append(each_option[0].names)
 
-        self.set_config(help=self.help,
-                        version=self.version,
-                        extra=dict(self.extra))
-
     def docpie(self, argv=None):
         """match the argv for each usages, return dict.
 
@@ -132,21 +326,63 @@ class Docpie(dict):
         if argv is str, it will call argv.split() first.
         this function will check the options in self.extra and handle it first.
         Which means it may not try to match any usages because of the checking.
+
+        if the `errorrecord` config is on, a failed match returns an
+        `ErrorRecord` instead of raising `DocpieExit`.
+
+        if the `stats` config is on, the time and operations are added
+        into `self.stats`.
         """
+        log.refresh()
+        with self._recording():
+            if stats.active:
+                stats.count('calls')
+            if not self.error_record:
+                return self._docpie(argv)
+
+            argv = self._formal_argv(argv)
+            try:
+                return self._docpie(argv)
+            except DocpieExit as e:
+                return ErrorRecord(e, argv, self)
+
+    def _recording(self):
+        """Return the context manager which records into `self.stats`"""
+        if self.stats is None:
+            return stats.no_recording
+        return self.stats.record()
+
+    def _docpie(self, argv):
+        handled = ()
+        if self._pending_init:
+            # auto handlers like `--help` may exit without parsing the doc.
+            # The scanned flags miss the ones only in "Usage:", so a prefix
+            # is not expanded until the doc is parsed
+            token = self._prepare_token(argv, expand_prefix=False)
+            handled = self.check_flag_and_handler(token)
+            self._init()
 
         token = self._prepare_token(argv)
         # check first, raise after
         # so `-hwhatever` can trigger `-h` first
-        self.check_flag_and_handler(token)
+        self.check_flag_and_handler(token, handled)
 
         if token.error is not None:
             # raise DocpieExit('%s\n\n%s' % (token.error, help_msg))
-            self.exception_handler(token.error)
+            self._raise(token.error)
 
+        return self._fill(token)
+
+    def _fill(self, token):
+        """Match `token`, fill the values into self and return a copy"""
+        started = stats.start()
         try:
             result, dashed = self._match(token)
         except DocpieExit as e:
-            self.exception_handler(e)
+            self._raise(e)
+        finally:
+            stats.stop('match', started)
+        started = stats.start()
 
         # if error is not None:
         #     self.exception_handler(error)
@@ -157,48 +393,268 @@ class Docpie(dict):
         if self.appeared_only:
             self._drop_non_appeared()
 
-        logger.debug('get all matched value %s', self)
+        if log.enabled:
+            logger.debug('get all matched value %s', self)
         rest = list(self.usages)  # a copy
-        rest.remove(result)
+        if not isinstance(result, BranchedUsage):
+            # or it also holds the expansions not matched
+            rest.remove(result)
         self._add_rest_value(rest)
-        logger.debug('merged rest values, now %s', self)
+        if log.enabled:
+            logger.debug('merged rest values, now %s', self)
         self._add_option_value()
         self._dashes_value(dashed)
 
+        stats.stop('fill', started)
         return dict(self)  # remove all other reference in this instance
 
+    def parse(self, argv=None):
+        """Reentrant `docpie`: match `argv` and return the result dict
+        without changing this instance, so one instance can be shared and
+        called by many threads at the same time.
+
+        Each call runs on a context: a clone of this instance with its own
+        copy of the usages and options, where the match values are stored.
+        The contexts are kept for reuse, a new one is only made when more
+        calls run at the same time."""
+        contexts = self._context_pool()
+        try:
+            # `list.pop` is atomic
+            context = contexts.pop()
+        except IndexError:
+            context = self._new_context()
+        try:
+            return context.docpie(argv)
+        finally:
+            contexts.append(context)
+
+    def parse_many(self, argvs, workers=None, chunksize=64):
+        """Match each argv of `argvs` like `parse` and yield the results in
+        order. A failed one yields its `DocpieExit` instead of raising it.
+        The handlers in `extra` (e.g. `--help`) are not called.
+
+        `workers` is the number of processes to fan out to, in chunks of
+        `chunksize` argvs. None or 0 matches in this process. It needs
+        `concurrent.futures` (python 3.2+, or the `futures` package on
+        python 2). Before python 3.7 this instance is sent with each chunk
+        instead of once for each process."""
+        if workers:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+            except ImportError:
+                raise ImportError(
+                    '`parse_many` with `workers` needs `concurrent.futures`'
+                    ' (python 3.2+, or the `futures` package)')
+            return self._parse_many_processes(
+                ProcessPoolExecutor, argvs, workers, chunksize)
+        return self._parse_many(argvs)
+
+    def _parse_many(self, argvs):
+        log.refresh()
+        contexts = self._context_pool()
+        try:
+            context = contexts.pop()
+        except IndexError:
+            context = self._new_context()
+        try:
+            for argv in argvs:
+                argv = context._formal_argv(argv)
+                # not around `yield`, the caller's time is not counted
+                with context._recording():
+                    if stats.active:
+                        stats.count('calls')
+                    try:
+                        token = context._prepare_token(argv)
+                        if token.error is not None:
+                            context._raise(token.error)
+                        result = context._fill(token)
+                    except DocpieExit as e:
+                        if context.error_record:
+                            result = ErrorRecord(e, argv, context)
+                        else:
+                            result = e
+                yield result
+        finally:
+            contexts.append(context)
+
+    def _parse_many_processes(self, executor_class, argvs, workers,
+                              chunksize):
+        if _pool_initializer:
+            # pickled once for each worker
+            executor = executor_class(workers, initializer=_init_worker,
+                                      initargs=(self,))
+            extra_args = ()
+        else:
+            # no `initializer`
+            executor = executor_class(workers)
+            extra_args = (self,)
+
+        with executor:
+            pending = deque()
+            for chunk in _chunks(argvs, chunksize):
+                pending.append(
+                    executor.submit(_parse_chunk, chunk, *extra_args))
+                # bound the chunks in memory
+                if len(pending) > workers * 2:
+                    for each in pending.popleft().result():
+                        yield each
+            while pending:
+                for each in pending.popleft().result():
+                    yield each
+
+    def add_command(self, name, doc=None, path=None, handler=None,
+                    **config):
+        """Register the subcommand `name` for `dispatch`, its doc is only
+        parsed when it's dispatched.
+
+        `doc` is the doc string, or `path` the import path of the module
+        with it (`module:attribute` if it's not the `__doc__`). `config`
+        overrides the config the subcommand takes from this one. Return
+        the `Subcommand`, which can add its own subcommands. See
+        `docpie.subcommand`"""
+        from docpie.subcommand import Subcommand
+        command = Subcommand(name, doc, path, handler, config)
+        if self.commands is None:
+            self.commands = {}
+        self.commands[name] = command
+        return command
+
+    def dispatch(self, argv=None, command='<command>', args='<args>'):
+        """Match `argv`, then match the rest of it with the subcommand
+        named by the value of `command`: `[argv[0], <command>] + <args>`,
+        a new list of the values.
+
+        The values of the global options, the ones of this `Docpie`, are
+        shared with the subcommand: `sub` has them unless it has a value
+        of its own for the same key.
+
+        Return `handler(self, sub)` if the subcommand has a handler, or
+        `sub`, the `Docpie` of the subcommand holding its values. Return
+        None if no subcommand is given. A subcommand not registered raises
+        `UnknownCommandExit`. Like `docpie`, the failures are returned as
+        `ErrorRecord` if the `errorrecord` config is on"""
+        return self._dispatch_command(
+            self._formal_argv(argv), command, args, {})
+
+    def _dispatch_command(self, argv, command, args, shared):
+        # `shared` holds the values of the global options of the parents
+        result = self.docpie(argv)
+        if isinstance(result, ErrorRecord):
+            return result
+        self._share_options(shared)
+        name = result.get(command)
+        if name is None:
+            return None
+
+        commands = self.commands or {}
+        if name not in commands:
+            error = UnknownCommandExit('Unknown command: %s.' % name, name)
+            if self.error_record:
+                return ErrorRecord(error, argv, self)
+            self.exception_handler(error)
+
+        subcommand = commands[name]
+        sub = subcommand.compile(self)
+        # a new argv for the subcommand, which splits it again by its own
+        # options. The global options before `<command>` are not in it
+        sub_argv = [argv[0], name]
+        sub_argv.extend(result.get(args) or ())
+        if log.enabled:
+            logger.debug('dispatch %s with %s', name, sub_argv)
+        if sub.commands:
+            return sub._dispatch_command(sub_argv, command, args,
+                                         dict(shared))
+
+        sub_result = sub.docpie(sub_argv)
+        if isinstance(sub_result, ErrorRecord):
+            return sub_result
+        sub._share_options(shared)
+        if subcommand.handler is not None:
+            return subcommand.handler(self, sub)
+        return sub
+
+    def _share_options(self, shared):
+        """Fill the values in `shared` that this one has no value for,
+        then add the values of its options to `shared`"""
+        for key, value in shared.items():
+            if not self.get(key):
+                self[key] = value
+        for key, value in self.items():
+            if key.startswith('-') and key not in ('-', '--'):
+                shared[key] = value
+
+    def _context_pool(self):
+        """Return the list of idle contexts of `parse`"""
+        contexts = self._contexts
+        if contexts is None:
+            with _context_lock:
+                if self._pending_init:
+                    self._init()
+                if self._contexts is None:
+                    self._contexts = []
+                contexts = self._contexts
+        return contexts
+
+    def _new_context(self):
+        context = copy.copy(self)
+        dict.clear(context)
+        context._contexts = None
+        # copied together so the options shared by `usages` and `options`
+        # are still shared
+        context.usages, context.options = copy.deepcopy(
+            (self.usages, self.options))
+        context.token_cache = TokenCache(Atom.classify, self.tokencache)
+        context._dispatch_cache = None
+        # the calls on the contexts add up
+        context.stats = self.stats
+        if log.enabled:
+            logger.debug('new match context of %s', self.usages)
+        return context
+
     def _drop_non_appeared(self):
         for key, _ in filter(lambda k_v: k_v[1] == -1, dict(self).items()):
             self.pop(key)
 
     def _add_rest_value(self, rest):
         for each in rest:
-            default_values = each.get_sys_default_value(
-                self.appeared_only, False)
-            logger.debug('get rest values %s -> %s', each, default_values)
-            common_keys = set(self).intersection(default_values)
-
-            for key in common_keys:
-                default = default_values[key]
-                valued = self[key]
+            if isinstance(each, BranchedUsage):
+                # the same as its expansions except the matched one
+                all_default_values = each.get_rest_default_values(
+                    self.appeared_only, False)
+            else:
+                all_default_values = [each.get_sys_default_value(
+                    self.appeared_only, False)]
+            for default_values in all_default_values:
+                self._add_default_value(each, default_values)
+
+    def _add_default_value(self, usage, default_values):
+        if log.enabled:
+            logger.debug('get rest values %s -> %s', usage, default_values)
+        common_keys = set(self).intersection(default_values)
+
+        for key in common_keys:
+            default = default_values[key]
+            valued = self[key]
+            if log.enabled:
                 logger.debug('%s: default(%s), matched(%s)',
                              key, default, valued)
 
-                if ((default is not True and default is not False) and
-                        isinstance(default, int)):
-                    valued = int(valued)
-                elif isinstance(default, list):
-                    if valued is None:
-                        valued = []
-                    elif isinstance(valued, list):
-                        pass
-                    else:
-                        valued = [valued]
+            if ((default is not True and default is not False) and
+                    isinstance(default, int)):
+                valued = int(valued)
+            elif isinstance(default, list):
+                if valued is None:
+                    valued = []
+                elif isinstance(valued, list):
+                    pass
+                else:
+                    valued = [valued]
 
+            if log.enabled:
                 logger.debug('set %s as %s', key, valued)
-                default_values[key] = valued
+            default_values[key] = valued
 
-            self.update(default_values)
+        self.update(default_values)
 
     def _add_option_value(self):
         # add left option, add default value
@@ -209,12 +665,15 @@ class Docpie(dict):
                 default = option.default
                 this_value = option.value
 
-                logger.debug('%s/%s/%s', option, default, this_value)
+                if log.enabled:
+                    logger.debug('%s/%s/%s', option, default, this_value)
 
                 name_in_value = names.intersection(self)
                 if name_in_value:  # add default if necessary
-                    one_name = name_in_value.pop()
-                    logger.debug('in names, pop %s, self %s', one_name, self)
+                    one_name = next(iter(name_in_value))
+                    if log.enabled:
+                        logger.debug('in names, pop %s, self %s',
+                                     one_name, self)
                     value_in_usage = self[one_name]
                     if not value_in_usage:  # need default
                         if default is None:  # no default, use old matched one
@@ -243,21 +702,21 @@ class Docpie(dict):
                                  isinstance(this_value, (int, list)))):
                             final_value = default.split()
                         else:
-                            if ref is not None and max(ref.arg_range()) > 1:
+                            if ref is not None and ref.arg_bounds()[1] > 1:
                                 final_value = default.split()
                             else:
                                 final_value = default
                     else:
                         if ref is not None:
-                            arg_range = ref.arg_range()
+                            max_arg = ref.arg_bounds()[1]
                             # if min(arg_range) != 0:
                             #     # It requires at least a value
                             #     logger.debug('%s expects value', option)
                             #     raise DocpieExit(DocpieException.usage_str)
-                            if max(arg_range) == 1:
+                            if max_arg == 1:
                                 final_value = None
                             else:
-                                assert max(arg_range) > 1
+                                assert max_arg > 1
                                 final_value = []
                         # ref is None
                         elif this_value is None:
@@ -266,7 +725,8 @@ class Docpie(dict):
                             final_value = \
                                 int(this_value) if each.repeat else this_value
 
-                logger.debug('set %s value %s', names, final_value)
+                if log.enabled:
+                    logger.debug('set %s value %s', names, final_value)
                 final = {}
                 for name in names:
                     final[name] = final_value
@@ -287,52 +747,177 @@ class Docpie(dict):
 
         self['--'] = result
 
-    def _prepare_token(self, argv):
+    @staticmethod
+    def _formal_argv(argv):
         if argv is None:
-            argv = sys.argv
-        elif isinstance(argv, StrType):
-            argv = argv.split()
-
-        # the things in extra may not be announced
-        all_opt_requried_max_args = dict.fromkeys(self.extra, 0)
-        all_opt_requried_max_args.update(self.opt_names_required_max_args)
+            return sys.argv
+        if isinstance(argv, StrType):
+            return argv.split()
+        return argv
+
+    def _prepare_token(self, argv, expand_prefix=True):
+        argv = self._formal_argv(argv)
+        all_opt_requried_max_args, long_names = self._known_flags()
+        if not expand_prefix:
+            long_names = []
         token = Argv(argv[1:], self.auto2dashes or self.options_first,
                      self.stdopt, self.attachopt, self.attachvalue,
-                     all_opt_requried_max_args)
+                     all_opt_requried_max_args, long_names)
+        token.class_cache = self.token_cache
+        started = stats.start()
         none_or_error = token.formal(self.options_first)
-        logger.debug('formal token: %s; error: %s', token, none_or_error)
+        stats.stop('formal', started)
+        if log.enabled:
+            logger.debug('formal token: %s; error: %s', token, none_or_error)
         if none_or_error is not None:
-            return self.exception_handler(none_or_error)
+            return self._raise(none_or_error)
         return token
 
+    def _known_flags(self):
+        """Return the max args of all the known flags, and the sorted long
+        flags for prefix matching. Cached until the flags or `extra`
+        change."""
+        max_args = self._flags()[1]
+        extra = frozenset(self.extra)
+        cached = self._known_flags_cache
+        if (cached is None or cached[0] is not max_args or
+                cached[1] != len(max_args) or cached[2] != extra):
+            # the things in extra may not be announced
+            known = dict.fromkeys(extra, 0)
+            known.update(max_args)
+            long_names = sorted(x for x in known if x.startswith('--'))
+            cached = (max_args, len(max_args), extra, known, long_names)
+            self._known_flags_cache = cached
+        return cached[3], cached[4]
+
     def _match(self, token):
-        for each in self.usages:
-            logger.debug('matching usage %s', each)
+        # clean the values left by the previous call
+        usages = self.usages
+        for each in usages:
+            each.reset()
+
+        positions = self._dispatch(token)
+        # the skipped usages can not match, but can raise an error when
+        # trying. Try them when all failed to give the same error.
+        # A `BranchedUsage` does the same to its expansions
+        dispatched = set(positions)
+        order = []
+        skipped = []
+        for position, each in enumerate(usages):
+            if isinstance(each, BranchedUsage):
+                # its expansions are dispatched one by one
+                order.append((position, 'dispatched'))
+                skipped.append((position, 'skipped'))
+            elif position in dispatched:
+                order.append((position, None))
+            else:
+                skipped.append((position, None))
+        order.extend(skipped)
+
+        full_order = [(x, None) for x in range(len(usages))]
+        try:
+            return self._match_in_order(token, order)
+        except ArgumentExit:
+            if order == full_order:
+                raise
+            if log.enabled:
+                logger.debug('error in the dispatched order, try again')
+
+        # the error is the one of the first usage raising it
+        for each in usages:
+            each.reset()
+        return self._match_in_order(token, full_order)
+
+    def _match_in_order(self, token, order):
+        """Match the usages of `order`, a list of `(position, part)`.
+        `part` is the part of the expansions of a `BranchedUsage` to try,
+        see `BranchedUsage.match`"""
+        usages = self.usages
+        for position, part in order:
+            each = usages[position]
+            if stats.active:
+                stats.count('usages')
+            if log.enabled:
+                logger.debug('matching usage %s', each)
             argv_clone = token.clone()
-            if each.match(argv_clone, False):
-                logger.debug('matched usage %s, checking rest argv %s',
-                             each, argv_clone)
-                if (not argv_clone or
-                        (argv_clone.auto_dashes and
-                         list(argv_clone) == ['--'])):
+            if part is None:
+                result = each.match(argv_clone, False)
+            else:
+                result = each.match(argv_clone, False, part)
+            if result:
+                if log.enabled:
+                    logger.debug('matched usage %s, checking rest argv %s',
+                                 each, argv_clone)
+                if argv_clone.all_consumed():
                     argv_clone.check_dash()
-                    logger.debug('matched usage %s / %s', each, argv_clone)
+                    if log.enabled:
+                        logger.debug('matched usage %s / %s', each, argv_clone)
                     return each, argv_clone.dashes
 
-                logger.debug('matching %s left %s, checking failed',
-                             each, argv_clone)
+                if log.enabled:
+                    logger.debug('matching %s left %s, checking failed',
+                                 each, argv_clone)
 
             each.reset()
-            logger.debug('failed matching usage %s / %s', each, argv_clone)
+            if log.enabled:
+                logger.debug('failed matching usage %s / %s', each, argv_clone)
 
         else:
-            logger.debug('none matched')
+            if log.enabled:
+                logger.debug('none matched')
             raise DocpieExit(None)
 
-    def check_flag_and_handler(self, token):
+    def _dispatch(self, token):
+        """Return the positions of usages that may match `token`, in order.
+
+        A usage is skipped if its required Commands are not in `token`,
+        or its required Options can not be found by `token.may_have`.
+        Usages are indexed by their first required Command."""
+        usages = self.usages
+        cached = self._dispatch_cache
+        if cached is None or cached[0] is not usages:
+            index = {}
+            always = []
+            requires = []
+            for position, usage in enumerate(usages):
+                atoms = usage.required_atoms()
+                commands = [x for x in atoms if isinstance(x, Command)]
+                requires.append(
+                    ([x.names for x in commands],
+                     [x.names for x in atoms if isinstance(x, Option)]))
+                if commands:
+                    for name in commands[0].names:
+                        index.setdefault(name, []).append(position)
+                else:
+                    always.append(position)
+            cached = (usages, index, always, requires)
+            self._dispatch_cache = cached
+
+        _, index, always, requires = cached
+        present = set(token)
+        positions = set(always)
+        for each in present.intersection(index):
+            positions.update(index[each])
+
+        result = []
+        for position in sorted(positions):
+            commands, options = requires[position]
+            if (all(not present.isdisjoint(x) for x in commands) and
+                    all(token.may_have(x) for x in options)):
+                result.append(position)
+            else:
+                if log.enabled:
+                    logger.debug('skip usage %s', usages[position])
+        return result
+
+    def check_flag_and_handler(self, token, handled=()):
+        """Call the handlers in `extra` for the flags in `token`.
+
+        Flags in `handled` are skipped. Return the handled flags."""
         need_arg = [name for name, expect in
-                    self.opt_names_required_max_args.items() if expect != 0]
+                    self._flags()[1].items() if expect != 0]
         options = set()
+        result = []
 
         for ele in token:
             if self.auto2dashes and ele == '--':
@@ -348,7 +933,8 @@ class Docpie(dict):
                     continue
 
                 if auto.startswith('--') and inputted.startswith('--'):
-                    logger.debug('check %s for %s', inputted, auto)
+                    if log.enabled:
+                        logger.debug('check %s for %s', inputted, auto)
                     if '=' in inputted:
                         inputted = inputted.split('=', 1)[0]
                     if inputted == auto:
@@ -356,7 +942,8 @@ class Docpie(dict):
                         break
 
                 elif auto[1] != '-' and inputted[1] != '-':
-                    logger.debug('check %s for %s', inputted, auto)
+                    if log.enabled:
+                        logger.debug('check %s for %s', inputted, auto)
                     if self.stdopt:
                         attachopt = self.attachopt
                         break_upper = False
@@ -364,14 +951,17 @@ class Docpie(dict):
                             if not attachopt and index > 0:
                                 break
 
-                            logger.debug(
-                                'check %s for %s', attached_name, auto
-                            )
+                            if log.enabled:
+                                logger.debug(
+                                    'check %s for %s', attached_name, auto
+                                )
 
                             stacked_name = '-' + attached_name
                             if stacked_name == auto:
                                 found = True
-                                logger.debug('find %s in %s', auto, inputted)
+                                if log.enabled:
+                                    logger.debug('find %s in %s',
+                                                 auto, inputted)
 
                             if stacked_name in need_arg:
                                 break_upper = True
@@ -382,30 +972,26 @@ class Docpie(dict):
                     else:
                         found = (inputted == auto)
 
-            if found:
-                logger.debug('find %s, auto handle it', auto)
+            if found and auto not in handled:
+                if log.enabled:
+                    logger.debug('find %s, auto handle it', auto)
+                result.append(auto)
                 handler(self, auto)
 
-    def exception_handler(self, error):
-        logger.debug('handling %r', error)
+        return result
 
-        if self.option_sections:
-            help_msg = ('%s\n\n%s' %
-                        (self.usage_text.rstrip(),
-                         '\n'.join(self.option_sections.values())))
-        else:
-            help_msg = self.usage_text
+    def _raise(self, error):
+        """Raise `error` with the help text. If `errorrecord` is on, it's
+        raised as it is and `docpie` turns it into an `ErrorRecord`"""
+        if self.error_record:
+            raise error
+        self.exception_handler(error)
 
-        helpstyle = self.helpstyle
-        if helpstyle == 'python':
-            if self.option_sections:  # option section will help dedent
-                formated_help_msg = self.help_style_python(help_msg)
-            else:  # only need to dedent it
-                formated_help_msg = self.help_style_dedent(help_msg)
-        elif helpstyle == 'dedent':
-            formated_help_msg = self.help_style_dedent(help_msg)
-        else:
-            formated_help_msg = help_msg
+    def exception_handler(self, error):
+        if log.enabled:
+            logger.debug('handling %r', error)
+
+        formated_help_msg = self._help_text('error')
 
         args = list(error.args)
         message = args[0]
@@ -418,7 +1004,8 @@ class Docpie(dict):
         error.usage_text = self.usage_text
         error.option_sections = self.option_sections
         error.msg = message
-        logger.debug('re-raise %r', error)
+        if log.enabled:
+            logger.debug('re-raise %r', error)
         raise error
 
     @staticmethod
@@ -467,40 +1054,77 @@ class Docpie(dict):
         otherwith(default), print the full `doc`
         """
         help_type = docpie.help
-        helpstyle = docpie.helpstyle
-        if helpstyle == 'python':
-            doc = Docpie.help_style_python(docpie.doc)
-        elif helpstyle == 'dedent':
-            doc = Docpie.help_style_dedent(docpie.doc)
-        # elif help_style == 'raw':
-        #     doc = Docpie.help_style_raw(docpie.doc)
-        else:
-            doc = docpie.doc
-
+        long_flag = flag.startswith('--')
         if help_type == 'short_brief':
-            if flag.startswith('--'):
-                print(doc)
+            if long_flag:
+                text = docpie._help_text('doc') + '\n'
             else:
-                print(docpie.usage_text.rstrip())
-                option_sections = docpie.option_sections
-                if option_sections:
-                    print('')
-                    print('\n'.join(option_sections.values()))
+                text = docpie._help_text('brief')
         elif help_type == 'short_brief_notice':
-            if flag.startswith('--'):
-                sys.stdout.write(doc)
-            else:
-                print(docpie.usage_text)
-                option_sections = docpie.option_sections
-                if option_sections:
-                    print('')
-                    print('\n'.join(option_sections.values()).rstrip())
-                print('')
-                print('Use `--help` to see the full help messsage.')
+            text = docpie._help_text('doc' if long_flag else 'brief_notice')
         else:
-            sys.stdout.write(doc)
+            text = docpie._help_text('doc')
+        sys.stdout.write(text)
         sys.exit()
 
+    def _help_text(self, kind):
+        """Return the help text of `kind`, rendered once for each
+        `helpstyle`. Forgotten by `set_config`.
+
+        `kind` is 'error' (the "Usage" and "Options" sections in an error
+        message), 'doc' (the full `doc`), 'brief' or 'brief_notice' (what
+        `-h` prints when `help` is 'short_brief' or 'short_brief_notice')
+        """
+        key = '%s/%s' % (kind, self.helpstyle)
+        cache = self._help_cache
+        if cache is None:
+            cache = self._help_cache = {}
+        text = cache.get(key)
+        if text is None:
+            text = cache[key] = self._render_help(kind)
+        return text
+
+    def _render_help(self, kind):
+        helpstyle = self.helpstyle
+        if kind == 'doc':
+            if helpstyle == 'python':
+                return self.help_style_python(self.doc)
+            elif helpstyle == 'dedent':
+                return self.help_style_dedent(self.doc)
+            return self.doc
+
+        usage_text = self.usage_text
+        option_sections = self.option_sections
+        options = '\n'.join(option_sections.values())
+        if kind == 'error':
+            if option_sections:
+                help_msg = '%s\n\n%s' % (usage_text.rstrip(), options)
+            else:
+                help_msg = usage_text
+
+            if helpstyle == 'python':
+                if option_sections:  # option section will help dedent
+                    return self.help_style_python(help_msg)
+                # only need to dedent it
+                return self.help_style_dedent(help_msg)
+            elif helpstyle == 'dedent':
+                return self.help_style_dedent(help_msg)
+            return help_msg
+
+        if kind == 'brief':
+            text = usage_text.rstrip() + '\n'
+            if option_sections:
+                text += '\n%s\n' % options
+            return text
+
+        if kind == 'brief_notice':
+            text = usage_text + '\n'
+            if option_sections:
+                text += '\n%s\n' % options.rstrip()
+            return text + '\nUse `--help` to see the full help messsage.\n'
+
+        raise ValueError('unknown help kind %r' % (kind,))
+
     @staticmethod
     def help_style_python(docstring):
         if not docstring:
@@ -533,6 +1157,7 @@ class Docpie(dict):
 
     @staticmethod
     def help_style_dedent(docstring):
+        import textwrap
         return textwrap.dedent(docstring)
 
     @staticmethod
@@ -555,13 +1180,33 @@ class Docpie(dict):
         because a function is not JSONlizable.
         You can use `set_config(extra={...})` to set it back.
         """
-        config = {
+        result = {
+            '__version__': self._version,
+            '__class__': 'Docpie',
+            '__config__': self._dump_config(),
+        }
+        result.update(self._dump_parsed())
+        result['__text__']['doc'] = self.doc
+        result['__help__'] = dict(
+            ('%s/%s' % (kind, self.helpstyle), self._help_text(kind))
+            for kind in self._help_kinds)
+        return result
+
+    convert_2_dict = convert_to_dict = to_dict
+
+    def _dump_config(self):
+        # the config part of `to_dict`
+        return {
             'stdopt': self.stdopt,
             'attachopt': self.attachopt,
             'attachvalue': self.attachvalue,
             'auto2dashes': self.auto2dashes,
             'case_sensitive': self.case_sensitive,
             'namedoptions': self.namedoptions,
+            'maxexpansion': self.maxexpansion,
+            'tokencache': self.tokencache,
+            'errorrecord': self.error_record,
+            'stats': self.stats is not None,
             'appearedonly': self.appeared_only,
             'optionsfirst': self.options_first,
             'option_name': self.option_name,
@@ -571,33 +1216,6 @@ class Docpie(dict):
             'version': self.version
         }
 
-        text = {
-            'doc': self.doc,
-            'usage_text': self.usage_text,
-            'option_sections': self.option_sections,
-        }
-
-        # option = [convert_2_dict(x) for x in self.options]
-
-        option = {}
-        for title, options in self.options.items():
-            option[title] = [convert_2_dict(x) for x in options]
-
-        usage = [convert_2_dict(x) for x in self.usages]
-
-        return {
-            '__version__': self._version,
-            '__class__': 'Docpie',
-            '__config__': config,
-            '__text__': text,
-            'option': option,
-            'usage': usage,
-            'option_names': [list(x) for x in self.opt_names],
-            'opt_names_required_max_args': self.opt_names_required_max_args
-        }
-
-    convert_2_dict = convert_to_dict = to_dict
-
     @classmethod
     def from_dict(cls, dic):
         """Convert dict generated by `convert_2_dict` into Docpie instance
@@ -616,13 +1234,14 @@ class Docpie(dict):
 
         data_version = int(dic['__version__'].replace('.', ''))
         this_version = int(cls._version.replace('.', ''))
-        logger.debug('this: %s, old: %s', this_version, data_version)
+        if log.enabled:
+            logger.debug('this: %s, old: %s', this_version, data_version)
         if data_version < this_version:
             raise ValueError('Not support old docpie data')
 
         assert dic['__class__'] == 'Docpie'
 
-        config = dic['__config__']
+        config = dict(dic['__config__'])
         help = config.pop('help')
         version = config.pop('version')
         option_name = config.pop('option_name')
@@ -631,48 +1250,133 @@ class Docpie(dict):
         self.option_name = option_name
         self.usage_name = usage_name
 
-        text = dic['__text__']
-        self.doc = text['doc']
-        self.usage_text = text['usage_text']
-        self.option_sections = text['option_sections']
-
-        self.opt_names = [set(x) for x in dic['option_names']]
-        self.opt_names_required_max_args = dic['opt_names_required_max_args']
+        self.doc = dic['__text__']['doc']
+        self._load_parsed(dic)
         self.set_config(help=help, version=version)
-        self.options = o = {}
-        for title, options in dic['option'].items():
-            opt_ins = [convert_2_object(x, {}, self.namedoptions)
-                       for x in options]
-            o[title] = opt_ins
-
-        self.usages = [convert_2_object(x, self.options, self.namedoptions)
-                       for x in dic['usage']]
+        # rendered with the `helpstyle` in the key, so always valid
+        self._help_cache = dict(dic.get('__help__', {}))
 
         return self
 
     convert_2_docpie = convert_to_docpie = from_dict
 
+    def __reduce__(self):
+        # the config, the parsed elements and the rendered help; not the
+        # values of the last matching nor the caches
+        extra = {}
+        for flag, handler in self.extra.items():
+            name = getattr(handler, '__name__', None)
+            if (name in ('help_handler', 'version_handler') and
+                    getattr(self, name) is handler):
+                # re-linked to the one of the class when unpickled
+                handler = name
+            extra[flag] = handler
+
+        state = {
+            'config': self._dump_config(),
+            'helpstyle': self.helpstyle,
+            'cache': self.cache,
+            'extra': extra,
+            'doc': self.doc,
+            # the registered `Subcommand`, see `add_command`
+            'commands': self.commands,
+        }
+        if self.doc is not None:
+            state.update(
+                usage_text=self.usage_text,
+                option_sections=self.option_sections,
+                options=self.options,
+                usages=self.usages,
+                opt_names=self.opt_names,
+                opt_names_required_max_args=self.opt_names_required_max_args,
+                help_cache=self._help_cache)
+        return (self.__class__, (), state)
+
+    def __setstate__(self, state):
+        config = dict(state['config'])
+        help = config.pop('help')
+        version = config.pop('version')
+        self.option_name = config.pop('option_name')
+        self.usage_name = config.pop('usage_name')
+        self.set_config(**config)
+        self.helpstyle = state['helpstyle']
+        self.cache = state['cache']
+        self.doc = state['doc']
+        if self.doc is not None:
+            for name in self._lazy_attrs:
+                setattr(self, name, state[name])
+        self.set_config(help=help, version=version)
+        for flag, handler in state['extra'].items():
+            if isinstance(handler, StrType):
+                handler = getattr(self, handler)
+            self.extra[flag] = handler
+        self._help_cache = state.get('help_cache')
+        self.commands = state.get('commands')
+
+    def _dump_parsed(self):
+        # the parsed part of `to_dict`, also what `cache` stores
+        option = {}
+        for title, options in self.options.items():
+            option[title] = [convert_2_dict(x) for x in options]
+
+        return {
+            '__text__': {
+                'usage_text': self.usage_text,
+                'option_sections': self.option_sections,
+            },
+            'option': option,
+            'usage': [convert_2_dict(x) for x in self.usages],
+            'option_names': [sorted(x) for x in self.opt_names],
+            'opt_names_required_max_args': self.opt_names_required_max_args
+        }
+
+    def _load_parsed(self, dic):
+        text = dic['__text__']
+        usage_text = text['usage_text']
+        option_sections = text['option_sections']
+        opt_names = [set(x) for x in dic['option_names']]
+        opt_names_required_max_args = dic['opt_names_required_max_args']
+
+        options = {}
+        for title, each_options in dic['option'].items():
+            options[title] = [convert_2_object(x, {}, self.namedoptions)
+                              for x in each_options]
+
+        usages = [convert_2_object(x, options, self.namedoptions)
+                  for x in dic['usage']]
+
+        # only assign when all converted, so a broken data won't leave
+        # this instance half loaded
+        self.usage_text = usage_text
+        self.option_sections = option_sections
+        self.opt_names = opt_names
+        self.opt_names_required_max_args = opt_names_required_max_args
+        self.options = options
+        self.usages = usages
+
     def set_config(self, **config):
         """Shadow all the current config."""
-        reinit = False
+        # the contexts of `parse` are clones of the old config
+        self._contexts = None
+        self._help_cache = None
+        # the first stage to parse again, None if not needed
+        since = None
+        for key, stage in self._config_stages.items():
+            if key in config and config[key] != getattr(self, key):
+                if (since is None or
+                        self._stages.index(stage) <
+                        self._stages.index(since)):
+                    since = stage
         if 'stdopt' in config:
-            stdopt = config.pop('stdopt')
-            reinit = (stdopt != self.stdopt)
-            self.stdopt = stdopt
+            self.stdopt = config.pop('stdopt')
         if 'attachopt' in config:
-            attachopt = config.pop('attachopt')
-            reinit = reinit or (attachopt != self.attachopt)
-            self.attachopt = attachopt
+            self.attachopt = config.pop('attachopt')
         if 'attachvalue' in config:
-            attachvalue = config.pop('attachvalue')
-            reinit = reinit or (attachvalue != self.attachvalue)
-            self.attachvalue = attachvalue
+            self.attachvalue = config.pop('attachvalue')
         if 'auto2dashes' in config:
             self.auto2dashes = config.pop('auto2dashes')
         if 'name' in config:
-            name = config.pop('name')
-            reinit = reinit or (name != self.name)
-            self.name = name
+            self.name = config.pop('name')
         if 'help' in config:
             self.help = config.pop('help')
             self._set_or_remove_extra_handler(
@@ -684,17 +1388,24 @@ class Docpie(dict):
                 ('--version', '-v'),
                 self.version_handler)
         if 'case_sensitive' in config:
-            case_sensitive = config.pop('case_sensitive')
-            reinit = reinit or (case_sensitive != self.case_sensitive)
-            self.case_sensitive = case_sensitive
+            self.case_sensitive = config.pop('case_sensitive')
         if 'optionsfirst' in config:
             self.options_first = config.pop('optionsfirst')
         if 'appearedonly' in config:
             self.appeared_only = config.pop('appearedonly')
         if 'namedoptions' in config:
-            namedoptions = config.pop('namedoptions')
-            reinit = reinit or (namedoptions != self.namedoptions)
-            self.namedoptions = namedoptions
+            self.namedoptions = config.pop('namedoptions')
+        if 'maxexpansion' in config:
+            self.maxexpansion = config.pop('maxexpansion')
+        if 'tokencache' in config:
+            # a new one, the counters start from 0
+            self.tokencache = config.pop('tokencache')
+            self.token_cache = TokenCache(Atom.classify, self.tokencache)
+        if 'errorrecord' in config:
+            self.error_record = config.pop('errorrecord')
+        if 'stats' in config:
+            # a new one, the counters start from 0
+            self.stats = stats.Stats() if config.pop('stats') else None
         if 'extra' in config:
             self.extra.update(self._formal_extra(config.pop('extra')))
 
@@ -706,12 +1417,14 @@ class Docpie(dict):
                     '' if len(config) == 1 else 's'
                 ))
 
-        if self.doc is not None and reinit:
-            logger.warning(
-                'You changed the config that requires re-initialized'
-                ' `Docpie` object. Create a new one instead'
-            )
-            self._init()
+        if since is None:
+            pass
+        elif self._pending_init:
+            self._scan_flags()
+        elif self.doc is not None:
+            if log.enabled:
+                logger.debug('config changed, parse again from %s', since)
+            self._init(since)
 
     def _formal_extra(self, extra):
         result = {}
@@ -730,27 +1443,32 @@ class Docpie(dict):
                 alias.add(flag)
                 for each in alias:
                     if set_handler:
-                        logger.debug('set %s hanlder %s', each, handler)
+                        if log.enabled:
+                            logger.debug('set %s hanlder %s', each, handler)
                         self.extra[each] = handler
                     else:
-                        logger.debug('remove %s hanlder', each)
+                        if log.enabled:
+                            logger.debug('remove %s hanlder', each)
                         _hdlr = self.extra.pop(each, None)
-                        logger.debug('%s handler %s removed', each, _hdlr)
+                        if log.enabled:
+                            logger.debug('%s handler %s removed', each, _hdlr)
                 break
         else:
             for flag in find_order:
                 if set_handler:
-                    logger.debug('set %s hanlder', flag)
+                    if log.enabled:
+                        logger.debug('set %s hanlder', flag)
                     self.extra[flag] = handler
                 else:
-                    logger.debug('remove %s hanlder', flag)
+                    if log.enabled:
+                        logger.debug('remove %s hanlder', flag)
                     self.extra.pop(flag, None)
 
     def find_flag_alias(self, flag):
         """Return alias set of a flag; return None if flag is not defined in
         "Options".
         """
-        for each in self.opt_names:
+        for each in self._flags()[0]:
             if flag in each:
                 result = set(each)  # a copy
                 result.remove(flag)
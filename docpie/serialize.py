@@ -0,0 +1,178 @@
+"""
+A compact binary form of a parsed `Docpie`.
+
+`Docpie.to_dict` gives nested dicts for JSON, and `from_dict` walks every
+node again, scans the option titles for each `[options]` and creates
+the options of `Option` refs once more. This module writes the parsed
+elements as a flat table instead: each node is a tuple whose children are
+integer indexes of earlier nodes, so loading is one pass over the table,
+and an element shared by several nodes (e.g. the options of `[options]`)
+is still shared after loading. The whole thing is written by `marshal`.
+
+    data = dumps(pie)
+    pie = loads(data)
+
+The data is for the same docpie version only, and like `marshal`, it's
+not meant to be exchanged between Python versions or loaded from an
+untrusted source.
+"""
+
+import marshal
+
+from docpie.pie import Docpie
+from docpie.element import Option, Command, Argument, Required, Optional, \
+                           OptionsShortcut, Either, BranchedUsage
+
+__all__ = ['dumps', 'loads', 'dump', 'load']
+
+MAGIC = 'docpie-node-table'
+# bump when the layout below changes
+FORMAT = 1
+# the `marshal` format, 2 is understood by all the supported Pythons
+MARSHAL_VERSION = 2
+
+# node kinds
+OPTION, COMMAND, ARGUMENT, REQUIRED, OPTIONAL, SHORTCUT, EITHER, BRANCHED = \
+    range(8)
+
+
+class _Table(object):
+
+    def __init__(self):
+        self.nodes = []
+        self.index = {}
+
+    def add(self, obj):
+        """Add `obj` after its children, return its index"""
+        index = self.index.get(id(obj))
+        if index is not None:
+            return index
+
+        if isinstance(obj, Option):
+            ref = -1 if obj.ref is None else self.add(obj.ref)
+            node = (OPTION, tuple(obj.names), obj.default, ref)
+        elif isinstance(obj, (Command, Argument)):
+            kind = COMMAND if isinstance(obj, Command) else ARGUMENT
+            node = (kind, tuple(obj.names), obj.default)
+        elif isinstance(obj, (Required, Optional)):
+            kind = REQUIRED if isinstance(obj, Required) else OPTIONAL
+            node = (kind, tuple(self.add(x) for x in obj), obj.repeat)
+        elif isinstance(obj, OptionsShortcut):
+            node = (SHORTCUT, obj.name, tuple(obj.get_hide()),
+                    tuple(self.add(x) for x in obj.options))
+        elif isinstance(obj, Either):
+            node = (EITHER, tuple(self.add(x) for x in obj))
+        elif isinstance(obj, BranchedUsage):
+            node = (BRANCHED, self.add(obj.usage))
+        else:
+            raise ValueError('%r can not be serialized' % (obj,))
+
+        # the object is kept by the caller, so `id` stays unique
+        index = self.index[id(obj)] = len(self.nodes)
+        self.nodes.append(node)
+        return index
+
+
+def _build(nodes):
+    objects = []
+    append = objects.append
+    for node in nodes:
+        kind = node[0]
+        if kind == OPTION:
+            ref = None if node[3] == -1 else objects[node[3]]
+            append(Option(*node[1], **{'default': node[2], 'ref': ref}))
+        elif kind == COMMAND:
+            append(Command(*node[1], **{'default': node[2]}))
+        elif kind == ARGUMENT:
+            append(Argument(*node[1], **{'default': node[2]}))
+        elif kind == REQUIRED:
+            append(Required(*[objects[x] for x in node[1]],
+                            **{'repeat': node[2]}))
+        elif kind == OPTIONAL:
+            append(Optional(*[objects[x] for x in node[1]],
+                            **{'repeat': node[2]}))
+        elif kind == SHORTCUT:
+            shortcut = OptionsShortcut(node[1], [objects[x] for x in node[3]])
+            shortcut.set_hide(node[2])
+            append(shortcut)
+        elif kind == EITHER:
+            append(Either(*[objects[x] for x in node[1]]))
+        elif kind == BRANCHED:
+            append(BranchedUsage(objects[node[1]]))
+        else:
+            raise ValueError('unknown node kind %r' % (kind,))
+    return objects
+
+
+def dumps(pie):
+    """Return the binary form of a `Docpie` instance"""
+    # the same config as `to_dict`, and the help texts rendered
+    data = pie.to_dict()
+    table = _Table()
+    options = [(title, [table.add(x) for x in each_options])
+               for title, each_options in pie.options.items()]
+    usages = [table.add(x) for x in pie.usages]
+
+    return marshal.dumps((
+        MAGIC,
+        FORMAT,
+        pie._version,
+        data['__config__'],
+        data['__text__'],
+        data['__help__'],
+        table.nodes,
+        options,
+        usages,
+        [tuple(x) for x in pie.opt_names],
+        dict(pie.opt_names_required_max_args),
+    ), MARSHAL_VERSION)
+
+
+def loads(data, cls=Docpie):
+    """Return the `Docpie` instance from `dumps`. Raise ValueError if the
+    data is broken or written by another docpie version"""
+    try:
+        content = marshal.loads(data)
+    except (EOFError, TypeError) as e:
+        raise ValueError('broken docpie data: %s' % e)
+    if (not isinstance(content, tuple) or len(content) != 11 or
+            content[0] != MAGIC):
+        raise ValueError('not docpie data')
+    (_, format, version, config, text, help,
+     nodes, options, usages, opt_names, max_args) = content
+    if format != FORMAT or version != cls._version:
+        raise ValueError('docpie data of version %s (format %s) can not be '
+                         'loaded by %s (format %s)' %
+                         (version, format, cls._version, FORMAT))
+
+    objects = _build(nodes)
+
+    config = dict(config)
+    help_config = config.pop('help')
+    version_config = config.pop('version')
+    option_name = config.pop('option_name')
+    usage_name = config.pop('usage_name')
+    self = cls(None, **config)
+    self.option_name = option_name
+    self.usage_name = usage_name
+    self.doc = text['doc']
+    self.usage_text = text['usage_text']
+    self.option_sections = dict(text['option_sections'])
+    self.options = dict((title, [objects[x] for x in indexes])
+                        for title, indexes in options)
+    self.usages = [objects[x] for x in usages]
+    self.opt_names = [set(x) for x in opt_names]
+    self.opt_names_required_max_args = max_args
+    self.set_config(help=help_config, version=version_config)
+    self._help_cache = dict(help)
+    return self
+
+
+def dump(pie, file):
+    """Write the binary form of `pie` into a file opened in binary mode"""
+    file.write(dumps(pie))
+
+
+def load(file, cls=Docpie):
+    """Read a `Docpie` instance written by `dump`"""
+    return loads(file.read(), cls)
@@ -0,0 +1,168 @@
+"""
+The time of each phase and the counts of the operations of docpie, to find
+out where the time goes:
+
+    pie = Docpie(doc, stats=True)
+    pie.docpie(argv)
+    print(pie.stats)
+
+`pie.stats` is a `Stats`. `times` is the total seconds of each phase:
+
+    usage     find and parse the "Usage:" section, `expand` included
+    option    parse the "Options:" sections
+    expand    expand the usages
+    formal    split the argv (`Argv.formal`)
+    match     try the usages
+    fill      collect the values of the matched usage and the defaults
+
+and `counts` is the number of each operation:
+
+    calls     `docpie` calls (each argv of `parse_many` included)
+    usages    usages tried
+    matches   `match` calls of the elements
+    clones    argv clones
+    dumps     snapshots of the values (`dump_value`) of units and argv
+    loads     restores of the values (`load_value`) of units and argv
+    resets    resets of units
+    balances  attempts to balance the values of `<arg>...`
+
+The numbers add up until `reset`, also for the contexts of `parse`. The
+worker processes of `parse_many` are not counted.
+
+Like `docpie.log`, the counting in the hot paths is guarded by `active`,
+so it costs one check of a global when no instance records.
+"""
+
+import threading
+
+try:
+    from time import perf_counter as timer
+except ImportError:
+    # python < 3.3
+    from time import time as timer
+
+__all__ = ['Stats']
+
+PHASES = ('usage', 'option', 'expand', 'formal', 'match', 'fill')
+COUNTS = ('calls', 'usages', 'matches', 'clones', 'dumps', 'loads',
+          'resets', 'balances')
+
+# the number of running `record`, nothing is counted when it's 0
+active = 0
+_active_lock = threading.Lock()
+# the `Stats` this thread is recording into
+_local = threading.local()
+
+
+class Stats(object):
+    """The total `times` of each phase in seconds and the `counts` of each
+    operation. `a + b` and `a.update(b)` add them up"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTS, 0)
+
+    def update(self, other):
+        """Add the numbers of `other` into this one"""
+        with self._lock:
+            for phase, value in other.times.items():
+                self.times[phase] = self.times.get(phase, 0.0) + value
+            for name, value in other.counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def __add__(self, other):
+        result = Stats()
+        result.update(self)
+        result.update(other)
+        return result
+
+    def to_dict(self):
+        return {'times': dict(self.times), 'counts': dict(self.counts)}
+
+    def record(self):
+        """Return a context manager, the phases and operations in it are
+        added into this one when it exits"""
+        return _Recording(self)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self.times = state['times']
+        self.counts = state['counts']
+
+    def __str__(self):
+        return '\n'.join(
+            ['%-8s %10.3fms' % (phase, self.times[phase] * 1e3)
+             for phase in PHASES] +
+            ['%-8s %10d' % (name, self.counts[name]) for name in COUNTS])
+
+    def __repr__(self):
+        return 'Stats(%r)' % (self.to_dict(),)
+
+
+class _Recording(object):
+
+    def __init__(self, target):
+        self.target = target
+        self.previous = None
+        # filled by this thread only, so no lock needed until `update`
+        self.stats = Stats()
+
+    def __enter__(self):
+        global active
+        self.previous = getattr(_local, 'stats', None)
+        _local.stats = self.stats
+        with _active_lock:
+            active += 1
+        return self.stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global active
+        with _active_lock:
+            active -= 1
+        _local.stats = self.previous
+        self.target.update(self.stats)
+        return False
+
+
+class _NoRecording(object):
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+# used when the stats are off
+no_recording = _NoRecording()
+
+
+def count(name):
+    """Count one operation `name` if this thread is recording"""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.counts[name] += 1
+
+
+def start():
+    """Return the start time of a phase for `stop`, None if not
+    recording"""
+    if active:
+        return timer()
+    return None
+
+
+def stop(phase, started):
+    """Add the time since `started` to `phase` if this thread is
+    recording"""
+    if started is not None:
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.times[phase] += timer() - started
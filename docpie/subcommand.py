@@ -0,0 +1,104 @@
+"""
+Subcommands dispatched in the same process.
+
+A program with many subcommands registers the doc of each one, as a string
+or the import path of a module, and parses only the one in argv:
+
+    pie = Docpie(__doc__, optionsfirst=True)
+    pie.add_command('add', path='mytool.add')
+    pie.add_command('push', doc=PUSH_DOC, handler=push)
+    remote = pie.add_command('remote', path='mytool.remote:DOC',
+                             optionsfirst=True)
+    remote.add_command('rename', path='mytool.remote_rename')
+
+    sub = pie.dispatch()
+
+`pie` matches the global options and `<command> [<args>...]` as usual
+(`optionsfirst` keeps the options after `<command>` in `<args>`). Then the
+doc of `<command>` is imported and parsed, only once for each command, and
+matches `[argv[0], <command>] + <args>`. The program name in the usages of
+the sub docs is stripped like the parent's, so its usage is like
+`mytool add [options] <file>...`.
+
+The argv of the subcommand is a new list of `<args>`, split again by the
+options of the sub doc, and the sub doc parses its own "Options:"
+sections: a global option is only known by the sub `Docpie` if its doc
+has it too. What's shared is the config of the parent, e.g. `stdopt`,
+`help`, `name`, `cache` and `stats` (the numbers add up into the
+parent's), except `optionsfirst`, `version` and `extra`. The keyword
+arguments of `add_command` override it.
+
+The values of the global options matched by `pie` are shared with the
+sub `Docpie`: it has them too, unless it has a value of its own for the
+same key, e.g. its doc has `-v` and it's given after `<command>`.
+
+`dispatch` returns `handler(pie, sub)` if the command has a handler, or
+the sub `Docpie` (a dict of the values). A command with its own
+subcommands dispatches again, sharing the global options of both. The
+registered commands are kept by `copy` and pickling.
+"""
+
+__all__ = ['Subcommand']
+
+# the config a subcommand takes from its parent, as in `to_dict`
+INHERITED = ('stdopt', 'attachopt', 'attachvalue', 'auto2dashes',
+             'namedoptions', 'maxexpansion', 'tokencache',
+             'errorrecord', 'appearedonly', 'name', 'help')
+
+
+class Subcommand(object):
+    """A registered subcommand, its doc is only parsed when dispatched.
+
+    One of `doc` (the doc string) and `path` is needed. `path` is the
+    import path of a module, whose `__doc__` is used, or
+    `module:attribute` for the doc in an attribute"""
+
+    def __init__(self, name, doc=None, path=None, handler=None, config=None):
+        if (doc is None) == (path is None):
+            raise ValueError('one of `doc` and `path` is needed for %r' %
+                             (name,))
+        self.name = name
+        self.doc = doc
+        self.path = path
+        self.handler = handler
+        self.config = config or {}
+        self.commands = {}
+        # the `Docpie`, when dispatched
+        self.pie = None
+
+    def add_command(self, name, doc=None, path=None, handler=None,
+                    **config):
+        """Register a subcommand of this one, see `Docpie.add_command`"""
+        command = Subcommand(name, doc, path, handler, config)
+        self.commands[name] = command
+        return command
+
+    def load_doc(self):
+        """Return the doc, imported from `path` if not given"""
+        if self.doc is None:
+            module, _, attr = self.path.partition(':')
+            attr = attr or '__doc__'
+            self.doc = getattr(__import__(module, fromlist=[attr]), attr)
+        return self.doc
+
+    def compile(self, parent):
+        """Return the `Docpie` of this subcommand with the config of
+        `parent`, parsed on the first call"""
+        if self.pie is None:
+            from docpie.pie import Docpie
+            parent_config = parent._dump_config()
+            config = dict((key, parent_config[key]) for key in INHERITED)
+            config.update(helpstyle=parent.helpstyle, cache=parent.cache)
+            config.update(self.config)
+            pie = Docpie(self.load_doc(), **config)
+            if 'stats' not in self.config and parent.stats is not None:
+                pie.stats = parent.stats
+            if self.commands:
+                pie.commands = self.commands
+            self.pie = pie
+        return self.pie
+
+    def __repr__(self):
+        return 'Subcommand(%r, %s=%r)' % (
+            self.name, 'doc' if self.path is None else 'path',
+            self.doc if self.path is None else self.path)
@@ -4,15 +4,27 @@ import logging
 import sys
 import platform
 
-from docpie import docpie, Docpie
-from docpie.error import DocpieExit, \
+from docpie import docpie, Docpie, log, stats
+from docpie.cache import DocpieCache
+from docpie.compile import compile_docpie, main as compile_main
+from docpie.tokens import Argv, TokenCache
+from docpie.pattern import LazyPattern
+from docpie.element import BranchedUsage, Option, Command, Argument, \
+    Required, Optional, Either, Atom
+from docpie.error import DocpieExit, ErrorRecord, \
     UnknownOptionExit, \
     ExceptNoArgumentExit, \
     ExpectArgumentExit, \
     ExpectArgumentHitDoubleDashesExit, \
     AmbiguousPrefixExit, \
+    UnknownCommandExit, \
     DocpieError
 import json
+import os
+import threading
+import subprocess
+import shutil
+import tempfile
 
 try:
     from io import StringIO
@@ -22,6 +34,12 @@ except ImportError:
     except ImportError:
         from StringIO import StringIO
 
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # `parse_many` with `workers` is not available
+    ProcessPoolExecutor = None
+
 logger = logging.getLogger('docpie.test.docpie')
 
 
@@ -2644,6 +2662,241 @@ Header
 """
         self.assertEqual(python_style_doc, stdout)
 
+    def test_argv_flags(self):
+        known = {'-a': 0, '-b': 0, '-o': 1, '--output': 1, '--all': 0}
+        argv = Argv(['-abofile', 'x', '--out=y', '--', '-z'],
+                    True, True, True, True, known)
+        argv.formal(False)
+        self.assertEqual(
+            argv.flags,
+            set(['-a', '-b', '-o', '-f', '-i', '-l', '-e', '-z',
+                 '--', '--o', '--ou', '--out', '--outp', '--outpu',
+                 '--output']))
+        self.assertFalse(argv.may_have(['-c', '--all']))
+        self.assertTrue(argv.clone().may_have(['-e', '--each']))
+
+        argv = Argv(['-abc'], True, False, True, True, {'-abc': 0})
+        argv.formal(False)
+        self.assertEqual(argv.flags, set(['-a', '-ab', '-abc']))
+
+        self.assertTrue(Argv(['--all'], True, True, True, True).may_have(
+                        ['-c']))
+
+        doc = """
+        Usage: prog [options] <file>...
+
+        Options:
+            -a, --all
+            -o, --output=<file>
+        """
+        self.eq({'-a': True, '--all': True, '-o': 'f', '--output': 'f',
+                 '<file>': ['x', '-', '-a'], '--': True},
+                doc, 'prog x -aof - -- -a')
+
+    def test_argv_snapshot(self):
+        argv = Argv(['a', '-b', 'c', 'd'], True, True, True, True,
+                    {'-b': 0, '-x': 0})
+        argv.formal(False)
+        snapshot = argv.dump_value()
+        status = argv.status()
+        self.assertEqual(argv.status(), status)
+
+        argv.next()
+        argv.insert(1, '-x')
+        argv.extend(['e', 'f'])
+        del argv[2:4]
+        argv.pop()
+        argv.dashes = True
+        self.assertEqual(argv, ['-b', '-x', 'e'])
+        self.assertNotEqual(argv.status(), status)
+
+        inner = argv.dump_value()
+        inner_status = argv.status()
+        argv[:] = ['z']
+        argv.load_value(inner)
+        self.assertEqual(argv, ['-b', '-x', 'e'])
+        self.assertEqual(argv.status(), inner_status)
+
+        argv.load_value(snapshot)
+        self.assertEqual(argv, ['a', '-b', 'c', 'd'])
+        self.assertEqual(argv.status(), status)
+        self.assertFalse(argv.dashes)
+
+        clone = argv.clone()
+        self.assertEqual(clone.status(), status)
+        clone.next()
+        self.assertNotEqual(clone.status(), argv.status())
+        self.assertEqual(argv.clone(['q']), ['q'])
+
+    def test_long_positional(self):
+        doc = 'Usage: prog [-v] <file>...'
+        files = ['f%d' % x for x in range(100000)]
+        self.eq({'-v': True, '<file>': files, '--': False},
+                doc, ['prog', '-v'] + files)
+        self.eq({'-v': False, '<file>': ['a', '-v', 'b'], '--': True},
+                doc, 'prog a -- -v b')
+        self.eq({'-v': True, '<file>': ['a', 'b'], '--': False},
+                doc, 'prog a -v b')
+
+        doc = 'Usage: prog go... [<x>]'
+        self.eq({'go': 3, '<x>': 'x', '--': False}, doc, 'prog go go go x')
+        self.eq({'go': 2, '<x>': None, '--': True}, doc, 'prog go -- go')
+
+        # the repeated one is matched after the argument that follows it
+        doc = 'Usage: prog add... <a>'
+        self.eq({'add': 1, '<a>': 'n1', '--': False}, doc, 'prog n1 add')
+        doc = 'Usage: prog cmd... <a> [-v]'
+        self.eq({'cmd': 2, '<a>': 'x', '-v': True, '--': False},
+                doc, 'prog x -v cmd cmd')
+
+        # an optional one matches once after `--`, even with nothing left
+        doc = 'Usage: prog [NAME [NAME ...]]'
+        self.eq({'NAME': ['a'], '--': True},
+                doc, 'prog -- a', appearedonly=True)
+        for doc in ('Usage: prog [NAME]...', 'Usage: prog [<f>...]',
+                    'Usage: prog [NAME [NAME ...]]'):
+            name = '<f>' if '<f>' in doc else 'NAME'
+            self.eq({name: [], '--': True}, doc, 'prog --', appearedonly=True)
+            self.eq({name: [], '--': True}, doc, 'prog --')
+
+    def test_log_switch(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('docpie')
+        old_level, old_forced = logger.level, log.forced
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        doc = 'Usage: prog [-v] <file>...'
+        try:
+            log.disable()
+            self.eq({'-v': True, '<file>': ['a'], '--': False},
+                    doc, 'prog -v a')
+            self.assertEqual(records, [])
+
+            log.enable()
+            self.eq({'-v': True, '<file>': ['a'], '--': False},
+                    doc, 'prog -v a')
+            self.assertTrue(records)
+
+            # not forced, it follows the level of the logger
+            log.enable(None)
+            del records[:]
+            self.eq({'-v': True, '<file>': ['a'], '--': False},
+                    doc, 'prog -v a')
+            self.assertTrue(records)
+
+            logger.setLevel(logging.WARNING)
+            del records[:]
+            self.eq({'-v': True, '<file>': ['a'], '--': False},
+                    doc, 'prog -v a')
+            self.assertEqual(records, [])
+            self.assertFalse(log.enabled)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(old_level)
+            log.enable(old_forced)
+
+    def test_repeated_call(self):
+        doc = """
+        Usage:
+            prog [-v] <x>
+            prog b [--prefix=<p>]
+
+        Options:
+            -v, --verbose
+            --prefix=<p>
+            --prepare
+        """
+        pie = Docpie(doc)
+        for _ in range(2):
+            self.assertEqual(pie.docpie('prog -v q'),
+                             {'-v': True, '--verbose': True, '<x>': 'q',
+                              'b': False, '--prefix': None,
+                              '--prepare': False, '--': False})
+            self.assertEqual(pie.docpie('prog b --pref p'),
+                             {'-v': False, '--verbose': False, '<x>': None,
+                              'b': True, '--prefix': 'p',
+                              '--prepare': False, '--': False})
+            self.assertEqual(pie.docpie('prog q'),
+                             {'-v': False, '--verbose': False, '<x>': 'q',
+                              'b': False, '--prefix': None,
+                              '--prepare': False, '--': False})
+
+        with self.assertRaises(AmbiguousPrefixExit) as cm:
+            pie.docpie('prog --pre')
+        self.assertEqual(cm.exception.ambiguous, ['--prefix', '--prepare'])
+
+        called = []
+        pie.set_auto_handler('--verify', lambda p, f: called.append(f))
+        self.assertRaises(AmbiguousPrefixExit, pie.docpie, 'prog --ver q')
+        # handled, then fails because usage does not have it
+        self.assertRaises(DocpieExit, pie.docpie, 'prog --veri q')
+        self.assertEqual(called, ['--verify'])
+
+        # the result does not share its lists with the next call
+        pie = Docpie('Usage: prog add <path>...')
+        result = pie.docpie('prog add a b')
+        pie.docpie('prog add c')
+        self.assertEqual(result['<path>'], ['a', 'b'])
+
+    def test_usage_dispatch(self):
+        doc = """
+        Usage:
+            prog [-v] remote add <name> <url>
+            prog remote [-v]
+            prog (add | rm) <file>...
+            prog --version
+            prog [-v] [<file>]
+        """
+        # the indexes are of the expanded usages, also in `BranchedAPITest`
+        pie = Docpie(doc, maxexpansion=None)
+
+        def argv(text):
+            return pie._prepare_token(text.split())
+
+        # `(add | rm)` is expanded into two usages
+        self.assertEqual(pie._dispatch(argv('prog remote add a b')),
+                         [0, 1, 2, 5])
+        self.assertEqual(pie._dispatch(argv('prog -v remote')), [1, 5])
+        self.assertEqual(pie._dispatch(argv('prog rm x')), [3, 5])
+        self.assertEqual(pie._dispatch(argv('prog --version')), [4, 5])
+        self.assertEqual(pie._dispatch(argv('prog -- add')), [2, 5])
+
+        self.assertTrue(pie.docpie('prog remote add a b')['add'])
+        self.assertTrue(pie.docpie('prog rm a b')['rm'])
+        self.assertEqual(pie.docpie('prog -v x')['<file>'], ['x'])
+        self.assertRaises(DocpieExit, pie.docpie, 'prog remote add a')
+
+    def test_usage_dispatch_balance(self):
+        # `<x>... <x>` can match without `add` and `--out`, by balancing
+        doc = """
+        Usage:
+            prog add <y> <x>... --out=<o> <x>
+            prog [-q -n <n>]...
+        """
+        result = docpie(doc, 'prog ls add b 3')
+        self.assertEqual(result['<y>'], 'ls')
+        self.assertEqual(result['<x>'], ['add', 'b', '3'])
+        self.assertEqual(result['<n>'], [])
+
+    def test_usage_dispatch_error(self):
+        # the error is the one of the first usage, not the first dispatched
+        doc = """
+        Usage:
+            prog --out=<o> -q [-v]
+            prog <f> add
+            prog <y> -n <n>
+
+        Options:
+            --all
+            -n <n>
+            --out=<o>
+        """
+        with self.assertRaises(ExpectArgumentExit) as cm:
+            docpie(doc, 'prog --all --out -n')
+        self.assertEqual(cm.exception.option, set(['--out']))
+
 
 class NewErrorTest(unittest.TestCase):
 
@@ -2889,6 +3142,492 @@ Options:
         self.assertIn('nosuch', exception_msg)
 
 
+class CacheTest(unittest.TestCase):
+
+    doc = """
+    Usage:
+        prog ship new <name>...
+        prog ship <name> move <x> <y> [--speed=<kn>]
+        prog mine (set|remove) <x> <y> [--moored | --drifting]
+        prog (-h | --help)
+
+    Options:
+        -h --help     Show this screen.
+        --speed=<kn>  Speed in knots [default: 10].
+        --moored      Moored (anchored) mine.
+        --drifting    Drifting mine.
+    """
+
+    argvs = (
+        'prog ship new a b',
+        'prog ship a move 1 2 --speed 3',
+        'prog mine remove 1 2 --drift',
+    )
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    class CountPie(Docpie):
+        parsed = 0
+
+        def _parse(self, since='sections'):
+            CacheTest.CountPie.parsed += 1
+            return super(CacheTest.CountPie, self)._parse(since)
+
+    def test_warm_start(self):
+        CountPie = self.CountPie
+        CountPie.parsed = 0
+        cache = DocpieCache(self.path)
+        cold = CountPie(self.doc, cache=cache)
+        self.assertEqual(len(cache.entries()), 1)
+        warm = CountPie(self.doc, cache=self.path)
+        self.assertEqual(CountPie.parsed, 1)
+
+        for argv in self.argvs:
+            self.assertEqual(warm.docpie(argv),
+                             Docpie(self.doc).docpie(argv))
+            self.assertEqual(cold.docpie(argv),
+                             Docpie(self.doc).docpie(argv))
+
+        # config and doc are in key
+        CountPie(self.doc, cache=cache, attachvalue=False)
+        self.assertEqual(CountPie.parsed, 2)
+        CountPie(self.doc + ' ', cache=cache)
+        self.assertEqual(CountPie.parsed, 3)
+        self.assertEqual(len(cache.entries()), 3)
+
+    def test_invalid_entry(self):
+        cache = DocpieCache(self.path)
+        pie = Docpie(self.doc, cache=cache)
+        key = cache.make_key(pie)
+        filename = cache.entries()[0][2]
+
+        with open(filename, 'w') as f:
+            f.write('{"broken')
+        self.assertIsNone(cache.get(key, pie._version))
+        self.assertEqual(cache.entries(), [])
+
+        pie = Docpie(self.doc, cache=cache)
+        with open(filename, 'r') as f:
+            content = json.load(f)
+        content['__version__'] = '0.0.0'
+        with open(filename, 'w') as f:
+            json.dump(content, f)
+        self.assertIsNone(cache.get(key, pie._version))
+
+        pie = Docpie(self.doc, cache=cache)
+        with open(filename, 'r') as f:
+            content = json.load(f)
+        content['data']['usage'] = [{'__class__': 'NoSuch'}]
+        with open(filename, 'w') as f:
+            json.dump(content, f)
+        pie = Docpie(self.doc, cache=cache)
+        self.assertEqual(pie.docpie(self.argvs[0]),
+                         Docpie(self.doc).docpie(self.argvs[0]))
+        self.assertIsNotNone(cache.get(key, pie._version))
+
+    def test_eviction(self):
+        cache = DocpieCache(self.path)
+        Docpie(self.doc, cache=cache)
+        size = cache.entries()[0][1]
+        cache.max_size = size * 2
+
+        for index in range(5):
+            Docpie('%s\n%s' % (self.doc, index), cache=cache)
+            self.assertLessEqual(
+                sum(each[1] for each in cache.entries()), cache.max_size)
+
+        self.assertEqual(len(cache.entries()), 2)
+        self.assertFalse([x for x in os.listdir(self.path)
+                          if x.endswith('.tmp')])
+        cache.clear()
+        self.assertEqual(cache.entries(), [])
+
+
+def compiled_docpie(doc, argv=None, help=True, version=None,
+                    stdopt=True, attachopt=True, attachvalue=True,
+                    helpstyle='python',
+                    auto2dashes=True, name=None, case_sensitive=False,
+                    optionsfirst=False, appearedonly=False, namedoptions=False,
+                    extra=None):
+    """`docpie` that loads the Docpie from its compiled module"""
+    pie = Docpie(doc, stdopt=stdopt, attachopt=attachopt,
+                 attachvalue=attachvalue, name=name,
+                 case_sensitive=case_sensitive, namedoptions=namedoptions)
+    namespace = {}
+    exec(compile(compile_docpie(pie), '<compiled>', 'exec'), namespace)
+    pie = namespace['load'](
+        help=help, version=version, helpstyle=helpstyle,
+        auto2dashes=auto2dashes, optionsfirst=optionsfirst,
+        appearedonly=appearedonly, extra=extra)
+    pie.docpie(argv)
+    return pie
+
+
+class ConfigTest(object):
+    """Run the tests of a `TestCase` with `config` as the default config of
+    both `docpie` and `Docpie`. With `compiled`, `docpie` loads the
+    `Docpie` from its compiled module (`compiled_docpie`), the cases which
+    create a `Docpie` themselves run it as usual"""
+    config = {}
+    compiled = False
+    # the test cases run with each config
+    cases = (BasicTest, RunDefaultTest, APITest, IssueTest)
+
+    def setUp(self):
+        global docpie, Docpie
+        self._globals = (docpie, Docpie)
+        config = self.config
+        base_docpie = compiled_docpie if self.compiled else docpie
+
+        def configured_docpie(*args, **kwargs):
+            for key, value in config.items():
+                kwargs.setdefault(key, value)
+            return base_docpie(*args, **kwargs)
+
+        class ConfiguredDocpie(Docpie):
+
+            def __init__(self, *args, **kwargs):
+                for key, value in config.items():
+                    kwargs.setdefault(key, value)
+                super(ConfiguredDocpie, self).__init__(*args, **kwargs)
+
+        docpie = configured_docpie
+        if config:
+            Docpie = ConfiguredDocpie
+
+    def tearDown(self):
+        global docpie, Docpie
+        docpie, Docpie = self._globals
+
+
+def config_tests(prefix, **attrs):
+    """Create a `ConfigTest` of each of `ConfigTest.cases` with `attrs`,
+    named like `CompiledBasicTest`. Return them"""
+    result = []
+    for case in ConfigTest.cases:
+        name = prefix + case.__name__
+        cls = type(name, (ConfigTest, case), attrs)
+        # found by the test runners
+        globals()[name] = cls
+        result.append(cls)
+    return result
+
+
+compiled_tests = config_tests('Compiled', compiled=True)
+
+
+branched_tests = config_tests('Branched', config={'maxexpansion': 0})
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        called = []
+        cache = TokenCache(lambda x: called.append(x) or x.upper(), 2)
+        self.assertEqual([cache.get(x) for x in 'abab'], list('ABAB'))
+        self.assertEqual(called, ['a', 'b'])
+        # `a` is the least recently used one
+        cache.get('c')
+        self.assertEqual(cache.get('b'), 'B')
+        cache.get('a')
+        self.assertEqual(called, ['a', 'b', 'c', 'a'])
+        self.assertEqual(cache.info(), {'hits': 3, 'misses': 4,
+                                        'evictions': 2, 'size': 2,
+                                        'maxsize': 2})
+
+        cache = TokenCache(lambda x: x, 0)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 0))
+
+        cache = TokenCache(lambda x: x, None)
+        for x in range(2000):
+            cache.get(str(x))
+        self.assertEqual((len(cache), cache.evictions), (2000, 0))
+
+    def test_docpie(self):
+        doc = 'Usage: prog [-v] <x>...'
+        pie = Docpie(doc, tokencache=2)
+        argv = ['prog', '<a>', '<b>', '<c>', 'plain', '<a>']
+        self.assertEqual(pie.docpie(argv)['<x>'], argv[1:])
+        info = pie.token_cache.info()
+        self.assertEqual(info['maxsize'], 2)
+        self.assertEqual(info['size'], 2)
+        # `plain` needs no regex, so it's not cached
+        self.assertNotIn('plain', pie.token_cache._data)
+        self.assertTrue(info['misses'] >= 3)
+        self.assertTrue(info['evictions'] >= 1)
+        # each instance counts its own
+        self.assertEqual(Docpie(doc).token_cache.misses, 0)
+        self.assertEqual(Docpie.from_dict(pie.to_dict()).tokencache, 2)
+
+
+class MaxExpansionTest(unittest.TestCase):
+
+    doc = '''Usage: prog (a|b) (c|d) (e|f) [(g|h)]... [-v] <x>'''
+
+    def test_threshold(self):
+        pie = Docpie(self.doc)
+        self.assertEqual(len(pie.usages), 16)
+
+        pie = Docpie(self.doc, maxexpansion=16)
+        self.assertEqual(len(pie.usages), 16)
+
+        pie = Docpie(self.doc, maxexpansion=15)
+        self.assertEqual(len(pie.usages), 1)
+        self.assertTrue(isinstance(pie.usages[0], BranchedUsage))
+        self.assertEqual(pie.usages[0].expand_num(), 16)
+        self.assertEqual(
+            [str(x) for x in pie.usages[0].expansions()],
+            [str(x) for x in Docpie(self.doc).usages])
+
+    def test_same_result(self):
+        expanded = Docpie(self.doc)
+        branched = Docpie(self.doc, maxexpansion=1)
+        for argv in ('prog a c e x', 'prog b d f -v x',
+                     'prog a d e g g x', 'prog b c f h -v x'):
+            self.assertEqual(branched.docpie(argv), expanded.docpie(argv))
+        for argv in ('prog a c x', 'prog a c e', 'prog a c e g h x'):
+            self.assertRaises(DocpieExit, branched.docpie, argv)
+            self.assertRaises(DocpieExit, expanded.docpie, argv)
+
+    def test_dict_and_compile(self):
+        pie = Docpie(self.doc, maxexpansion=1)
+        new_pie = Docpie.from_dict(pie.to_dict())
+        self.assertEqual(new_pie.usages, pie.usages)
+        self.assertEqual(new_pie.docpie('prog b d f h x')['h'], 1)
+
+        namespace = {}
+        exec(compile(compile_docpie(pie), '<compiled>', 'exec'), namespace)
+        new_pie = namespace['load']()
+        self.assertEqual(new_pie.usages, pie.usages)
+        self.assertEqual(new_pie.docpie('prog b d f h x')['h'], 1)
+
+    def test_large(self):
+        doc = 'Usage: prog %s' % ' '.join(
+            '(a%d|b%d)' % (x, x) for x in range(30))
+        pie = Docpie(doc, maxexpansion=1000)
+        self.assertEqual(pie.usages[0].expand_num(), 2 ** 30)
+        argv = 'prog %s' % ' '.join('a%d' % x for x in range(30))
+        self.assertTrue(pie.docpie(argv)['a29'])
+        # no expansion can match or raise, they are not tried at all
+        for argv in ('prog', 'prog a0 b1', 'prog a0 -v'):
+            self.assertRaises(DocpieExit, pie.docpie, argv)
+
+    def test_rest_value(self):
+        # the keys and defaults of the expansions except the matched one
+        for doc, argv in (
+                ('Usage:\n  prog (-v | ls)\n  prog ([--verbose] | ls)...',
+                 'prog'),
+                ('Usage: prog (FILE | [[<c>] (go --name <n>)])', 'prog'),
+                ('Usage: prog (FILE | [[<c>] (go --name <n>)])', 'prog x'),
+                ('Usage: prog (-v | -v -v | go) [<x>]', 'prog go'),
+                ('Usage: prog (go | <x>... | <x>) [-v]', 'prog x y')):
+            for appeared_only in (False, True):
+                expanded = Docpie(doc, appearedonly=appeared_only)
+                branched = Docpie(doc, appearedonly=appeared_only,
+                                  maxexpansion=1)
+                self.assertEqual(branched.docpie(argv),
+                                 expanded.docpie(argv))
+
+    def test_same_error(self):
+        doc = 'Usage: prog (a | [-o <f>]... b) (c | d) [-v]'
+        for argv in ('prog -o', 'prog -v=1', 'prog a -o x'):
+            expanded = Docpie(doc)
+            branched = Docpie(doc, maxexpansion=1)
+            try:
+                expanded.docpie(argv)
+            except DocpieExit as e:
+                error = e
+            self.assertRaises(type(error), branched.docpie, argv)
+
+    def test_large_options(self):
+        doc = 'Usage: prog %s' % ' '.join(
+            '(--a%d=<v>|--b%d)' % (x, x) for x in range(30))
+        pie = Docpie(doc, maxexpansion=1000)
+        argv = ['prog'] + ['--a%d=1' % x for x in range(30)]
+        self.assertEqual(pie.docpie(argv)['--a29'], '1')
+        # only the expansions with the options in argv are tried
+        self.assertRaises(DocpieExit, pie.docpie, argv[:-1])
+        self.assertRaises(ExpectArgumentExit, pie.docpie,
+                          argv[:-1] + ['--a29'])
+        self.assertRaises(ExceptNoArgumentExit, pie.docpie,
+                          argv[:-1] + ['--b29=1'])
+
+    def test_options_same_error(self):
+        doc = 'Usage: prog (--a0=<v>|--b0) (-c <v>|-d) (-e|--f=<v>) [<x>]'
+        for argv in ('prog --a0=1 -c 2 -e', 'prog --b0 -d --f=3 x',
+                     'prog --a0 -d -e', 'prog --b0=1 -d -e', 'prog -dc',
+                     'prog -d -e --a0', 'prog x -c 1 -e --a0=', 'prog -de',
+                     'prog --b0 -d -ex', 'prog --b0 -c -e', 'prog -e -c'):
+            expanded = Docpie(doc)
+            branched = Docpie(doc, maxexpansion=1)
+            try:
+                result = expanded.docpie(argv)
+            except DocpieExit as e:
+                self.assertRaises(type(e), branched.docpie, argv)
+            else:
+                self.assertEqual(branched.docpie(argv), result)
+
+
+class CompileFileTest(unittest.TestCase):
+
+    source = '''"""
+Usage: tool [options] <file>...
+
+Options:
+    -o, --output=<file>  output [default: out.txt]
+"""
+VARIABLE = """Usage: tool run"""
+'''
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.source_file = os.path.join(self.path, 'tool.py')
+        with open(self.source_file, 'w') as f:
+            f.write(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def compile(self, *args):
+        target = os.path.join(self.path, 'tool_docpie.py')
+        compile_main(['prog', self.source_file, '-o', target] + list(args))
+        namespace = {}
+        with open(target) as f:
+            exec(compile(f.read(), target, 'exec'), namespace)
+        return namespace
+
+    def test_py2_syntax(self):
+        # a comma after `**kwargs` is a SyntaxError on py2 and py3.0~3.4
+        source = compile_docpie(Docpie('Usage: prog (a b)... [c d]...'))
+        lines = [x.strip() for x in source.splitlines()]
+        self.assertTrue([x for x in lines if x.startswith('**')])
+        self.assertFalse([x for x in lines
+                          if x.startswith('**') and x.endswith(',')])
+
+    def test_compile_file(self):
+        namespace = self.compile()
+        self.assertEqual(namespace['docpie']('tool a b -o c'),
+                         {'--': False, '-o': 'c', '--output': 'c',
+                          '<file>': ['a', 'b']})
+        self.assertEqual(namespace['docpie']('tool a'),
+                         {'--': False, '-o': 'out.txt',
+                          '--output': 'out.txt', '<file>': ['a']})
+        # parse config changed, fallback to parsing
+        self.assertRaises(ExpectArgumentExit,
+                          namespace['docpie'], 'tool a -oc',
+                          attachvalue=False)
+
+        namespace = self.compile('--variable', 'VARIABLE')
+        self.assertEqual(namespace['docpie']('tool run'),
+                         {'--': False, 'run': True})
+
+
+class LazyTest(unittest.TestCase):
+
+    doc = """
+    Usage:
+        prog [options] <file>...
+        prog dump [--output=<file>]
+
+    Options:
+        -h, -?, --help     print help
+        -V, --version      print version
+        -o, --output=<file>
+        -v, --verbose
+    """
+
+    class CountPie(Docpie):
+        parsed = 0
+
+        def _parse(self, since='sections'):
+            LazyTest.CountPie.parsed += 1
+            return super(LazyTest.CountPie, self)._parse(since)
+
+    def setUp(self):
+        self.CountPie.parsed = 0
+
+    def test_handler_without_parsing(self):
+        for argv in ('prog --version', 'prog -vV a', 'prog -o -V -V'):
+            pie = self.CountPie(self.doc, version='1.0', lazy=True)
+            with StdoutRedirect() as f:
+                self.assertRaises(SystemExit, pie.docpie, argv)
+            self.assertEqual(f.read(), '1.0\n')
+
+        for argv in ('prog --help', 'prog -?'):
+            pie = self.CountPie(self.doc, lazy=True)
+            with StdoutRedirect() as f:
+                self.assertRaises(SystemExit, pie.docpie, argv)
+            self.assertEqual(f.read(), Docpie.help_style_python(self.doc))
+
+        self.assertEqual(self.CountPie.parsed, 0)
+
+        # a prefix is only expanded after parsing
+        pie = self.CountPie(self.doc, version='1.0', lazy=True)
+        with StdoutRedirect() as f:
+            self.assertRaises(SystemExit, pie.docpie, 'prog --vers')
+        self.assertEqual(f.read(), '1.0\n')
+        self.assertEqual(self.CountPie.parsed, 1)
+
+    def test_prefix_of_usage_only_option(self):
+        doc = 'Usage: prog [--verbose] <x>\n'
+        for argv in ('prog --ver', 'prog --verb a', 'prog --vers'):
+            results = []
+            for lazy in (False, True):
+                pie = Docpie(doc, version='1.0', lazy=lazy)
+                with StdoutRedirect() as f:
+                    try:
+                        result = pie.docpie(argv)
+                    except SystemExit as e:
+                        result = (type(e), str(e))
+                results.append((result, f.read()))
+            self.assertEqual(results[0], results[1])
+
+    def test_same_as_eager(self):
+        for index, argv in enumerate(
+                ('prog a -v', 'prog dump --out x', 'prog -vo x a b')):
+            pie = self.CountPie(self.doc, lazy=True)
+            self.assertEqual(self.CountPie.parsed, index)
+            self.assertEqual(pie.docpie(argv), Docpie(self.doc).docpie(argv))
+        self.assertEqual(self.CountPie.parsed, 3)
+
+        pie = self.CountPie(self.doc, lazy=True)
+        self.assertEqual(len(pie.usages), 2)
+        self.assertEqual(self.CountPie.parsed, 4)
+        self.assertEqual(pie.to_dict(), Docpie(self.doc).to_dict())
+        self.assertEqual(
+            self.CountPie(self.doc, lazy=True).find_flag_alias('-V'),
+            set(['--version']))
+
+        self.assertRaises(DocpieExit, Docpie(self.doc, lazy=True).docpie,
+                          'prog')
+        self.assertRaises(UnknownOptionExit,
+                          Docpie(self.doc, lazy=True).docpie,
+                          'prog --no-such')
+
+    def test_handler_called_once(self):
+        called = []
+        pie = Docpie(self.doc, lazy=True, extra={
+            '--verbose': lambda pie, flag: called.append(flag)})
+        self.assertEqual(pie.docpie('prog --verb a')['--verbose'], True)
+        self.assertEqual(called, ['--verbose'])
+
+    def test_invalid_doc(self):
+        doc = '''
+        Usage: prog (a | b
+        '''
+        pie = self.CountPie(doc, lazy=True)
+        for _ in range(2):
+            self.assertRaises(DocpieError, pie.docpie, 'prog a')
+        self.assertRaises(DocpieError, getattr, pie, 'usages')
+        self.assertEqual(self.CountPie.parsed, 3)
+
+
 class Writer(StringIO):
     if sys.hexversion >= 0x03000000:
         def u(self, string):
@@ -2933,6 +3672,898 @@ class StderrRedirect(object):
         return False
 
 
+class ParseTest(unittest.TestCase):
+
+    doc = """
+    Usage:
+        prog clone [-q] [--depth=<n>] <repo> [<dir>]
+        prog add [-nv] [--force] <path>...
+        prog (push|pull) [-f] [<remote>]
+        prog [options] <file>...
+
+    Options:
+        -q, --quiet
+        -v, --verbose
+        -n, --dry-run
+        -f, --force
+        --depth=<n>  [default: 0]
+    """
+
+    argvs = (
+        'prog clone -q --depth 1 url dir',
+        'prog add -nv a b c',
+        'prog push -f origin',
+        'prog pull',
+        'prog -qv x y z',
+        'prog clone',
+        'prog --depth',
+    )
+
+    def expected(self, **config):
+        result = []
+        for argv in self.argvs:
+            try:
+                result.append(Docpie(self.doc, **config).docpie(argv))
+            except DocpieExit as e:
+                result.append(str(e))
+        return result
+
+    def test_parse(self):
+        pie = Docpie(self.doc)
+        expected = self.expected()
+        for _ in range(2):
+            for argv, value in zip(self.argvs, expected):
+                try:
+                    self.assertEqual(pie.parse(argv), value)
+                except DocpieExit as e:
+                    self.assertEqual(str(e), value)
+        # the instance itself is untouched
+        self.assertEqual(dict(pie), {})
+        self.assertEqual(len(pie._contexts), 1)
+
+        pie.set_config(appearedonly=True)
+        self.assertEqual(pie._contexts, None)
+        self.assertEqual(pie.parse(self.argvs[0]),
+                         self.expected(appearedonly=True)[0])
+
+        pie = Docpie(self.doc, lazy=True)
+        self.assertEqual(pie.parse(self.argvs[1]), expected[1])
+
+    def check_many(self, results, argvs):
+        results = list(results)
+        self.assertEqual(len(results), len(argvs))
+        for result, value in zip(results, self.expected() * 3):
+            if isinstance(result, DocpieExit):
+                result = str(result)
+            self.assertEqual(result, value)
+        # `extra` handlers are not called
+        self.assertIsInstance(results[-1], DocpieExit)
+
+    def test_parse_many(self):
+        pie = Docpie(self.doc)
+        argvs = list(self.argvs) * 3 + ['prog --help']
+        self.check_many(pie.parse_many(argvs), argvs)
+        self.check_many(pie.parse_many(iter(argvs)), argvs)
+        self.assertEqual(dict(pie), {})
+
+    @unittest.skipIf(ProcessPoolExecutor is None,
+                     'needs `concurrent.futures`')
+    def test_parse_many_workers(self):
+        pie = Docpie(self.doc)
+        argvs = list(self.argvs) * 3 + ['prog --help']
+        self.check_many(pie.parse_many(argvs, workers=2, chunksize=4), argvs)
+
+        # sent with each chunk, as before python 3.7
+        from docpie import pie as pie_module
+        initializer = pie_module._pool_initializer
+        pie_module._pool_initializer = False
+        try:
+            self.check_many(
+                pie.parse_many(argvs, workers=2, chunksize=4), argvs)
+        finally:
+            pie_module._pool_initializer = initializer
+
+    def test_threads(self):
+        # switch threads more often (py3 only)
+        interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if interval is not None:
+            sys.setswitchinterval(1e-5)
+        try:
+            self._test_threads()
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+
+    def _test_threads(self):
+        for config in ({}, {'maxexpansion': 0}):
+            pie = Docpie(self.doc, tokencache=4, **config)
+            expected = self.expected(**config)
+            errors = []
+
+            def run(offset):
+                try:
+                    for index in range(200):
+                        index = (index + offset) % len(self.argvs)
+                        try:
+                            result = pie.parse(self.argvs[index])
+                        except DocpieExit as e:
+                            result = str(e)
+                        if result != expected[index]:
+                            errors.append((self.argvs[index], result))
+                except BaseException as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=(x,))
+                       for x in range(16)]
+            for each in threads:
+                each.start()
+            for each in threads:
+                each.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(dict(pie), {})
+
+
+class ErrorRecordTest(unittest.TestCase):
+
+    doc = """
+    Usage:
+        prog [-v] [--out=<file>] <x>
+
+    Options:
+        -v, --verbose
+        --out=<file>
+    """
+
+    def raised(self, argv):
+        try:
+            Docpie(self.doc).docpie(argv)
+        except DocpieExit as e:
+            return e
+        self.fail('%s matched' % argv)
+
+    def test_record(self):
+        pie = Docpie(self.doc, errorrecord=True)
+        for argv, error_class, option, token, index in (
+                ('prog -x a', UnknownOptionExit, '-x', '-x', 1),
+                ('prog -vx a', UnknownOptionExit, '-x', '-vx', 1),
+                ('prog a --out', ExpectArgumentExit,
+                 set(['--out']), None, 2),
+                ('prog a --ou=b --ver=c', ExceptNoArgumentExit,
+                 set(['-v', '--verbose']), 'c', None),
+                ('prog', DocpieExit, None, None, None)):
+            record = pie.docpie(argv)
+            self.assertIsInstance(record, ErrorRecord)
+            self.assertFalse(record)
+            self.assertIs(record.error_class, error_class)
+            self.assertEqual(record.option, option)
+            self.assertEqual(record.token, token)
+            self.assertEqual(record.index, index)
+            # rendered on demand
+            self.assertIs(record._exception, None)
+            raised = self.raised(argv)
+            self.assertEqual(record.message, str(raised))
+            self.assertIs(record.exception.__class__, raised.__class__)
+            self.assertEqual(record.exception.usage_text, raised.usage_text)
+
+        self.assertEqual(pie.docpie('prog -v a')['<x>'], 'a')
+        self.assertEqual(pie.parse('prog -v a')['<x>'], 'a')
+        self.assertFalse(pie.parse('prog -x a'))
+        results = list(pie.parse_many(['prog a', 'prog --out']))
+        self.assertEqual(results[0]['<x>'], 'a')
+        self.assertIs(results[1].error_class, ExpectArgumentExit)
+        self.assertEqual(results[1].index, 1)
+
+        record = docpie(self.doc, 'prog -x a', errorrecord=True)
+        self.assertIs(record.error_class, UnknownOptionExit)
+        self.assertTrue(Docpie.from_dict(pie.to_dict()).error_record)
+
+    def test_pickle(self):
+        import pickle
+        record = Docpie(self.doc, errorrecord=True).docpie('prog -x a')
+        loaded = pickle.loads(pickle.dumps(record))
+        self.assertEqual(loaded.message, record.message)
+        self.assertEqual((loaded.option, loaded.index), ('-x', 1))
+
+
+class HelpTextTest(unittest.TestCase):
+
+    doc = """Example.
+
+    Usage:
+        prog [-v] <x>
+
+    Options:
+        -v, --verbose
+    """
+
+    def test_memoize(self):
+        pie = Docpie(self.doc)
+        self.assertRaises(DocpieExit, pie.docpie, 'prog')
+        self.assertEqual(list(pie._help_cache), ['error/python'])
+        text = pie._help_text('error')
+        self.assertIs(pie._help_text('error'), text)
+        self.assertTrue(pie._help_text('doc').startswith('Example.\n'))
+        self.assertTrue(pie._help_text('brief_notice').endswith(
+            'Use `--help` to see the full help messsage.\n'))
+
+        pie.helpstyle = 'raw'
+        self.assertEqual(pie._help_text('doc'), self.doc)
+        pie.set_config(help='short_brief')
+        self.assertEqual(pie._help_cache, None)
+
+    def test_to_dict(self):
+        pie = Docpie(self.doc)
+        data = pie.to_dict()
+        self.assertEqual(sorted(data['__help__']),
+                         ['brief/python', 'brief_notice/python',
+                          'doc/python', 'error/python'])
+
+        def render(kind):
+            raise AssertionError('%s rendered again' % kind)
+
+        new_pie = Docpie.from_dict(json.loads(json.dumps(data)))
+        new_pie._render_help = render
+        with self.assertRaises(DocpieExit) as cm:
+            new_pie.docpie('prog')
+        self.assertIn('prog [-v] <x>', str(cm.exception))
+        self.assertEqual(new_pie._help_text('doc'), pie._help_text('doc'))
+
+
+def count_elements(pie):
+    """Return the number of elements in `pie`, and how many of them are
+    distinct objects"""
+    objects = []
+    todo = list(pie.usages) + sum(pie.options.values(), [])
+    while todo:
+        each = todo.pop()
+        objects.append(each)
+        if isinstance(each, list):
+            todo.extend(each)
+        if getattr(each, 'ref', None) is not None:
+            todo.append(each.ref)
+        if isinstance(getattr(each, 'usage', None), list):
+            todo.append(each.usage)
+    return len(objects), len(set(map(id, objects)))
+
+
+class SerializeTest(unittest.TestCase):
+
+    doc = """
+    Usage:
+        prog [options] <x>
+        prog (go|stop) [--speed=<kn>] <y>...
+
+    Options:
+        -v, --verbose
+        --speed=<kn>  [default: 10]
+        -o <file>...
+    """
+
+    def test_round_trip(self):
+        from docpie.serialize import dumps, loads
+        for config in ({}, {'namedoptions': True, 'errorrecord': True},
+                       {'maxexpansion': 1}):
+            pie = Docpie(self.doc, **config)
+            new_pie = loads(dumps(pie))
+            self.assertEqual(new_pie.usages, pie.usages)
+            self.assertEqual(new_pie.options, pie.options)
+            for argv in ('prog -v -o a b x', 'prog go --speed 3 a b',
+                         'prog stop a', 'prog'):
+                try:
+                    expected = pie.docpie(argv)
+                except DocpieExit as e:
+                    expected = str(e)
+                try:
+                    result = new_pie.docpie(argv)
+                except DocpieExit as e:
+                    result = str(e)
+                if isinstance(expected, ErrorRecord):
+                    expected, result = expected.message, result.message
+                self.assertEqual(result, expected)
+
+    def test_shared(self):
+        from docpie.serialize import dumps, loads
+
+        pie = Docpie(self.doc)
+        total, distinct = count_elements(pie)
+        self.assertTrue(distinct < total)
+        new_pie = loads(dumps(pie))
+        self.assertEqual(count_elements(new_pie), (total, distinct))
+        self.assertEqual(new_pie._help_cache, pie.to_dict()['__help__'])
+
+    def test_file_and_errors(self):
+        from docpie.serialize import dumps, loads, dump, load
+        import marshal
+        data = dumps(Docpie(self.doc))
+        filename = os.path.join(tempfile.mkdtemp(), 'pie.bin')
+        try:
+            with open(filename, 'wb') as f:
+                dump(Docpie(self.doc), f)
+            with open(filename, 'rb') as f:
+                pie = load(f)
+        finally:
+            shutil.rmtree(os.path.dirname(filename))
+        self.assertEqual(pie.docpie('prog x')['<x>'], 'x')
+
+        self.assertRaises(ValueError, loads, data[:-10])
+        self.assertRaises(ValueError, loads, marshal.dumps(('x',)))
+        content = list(marshal.loads(data))
+        content[2] = '0.0.1'
+        self.assertRaises(ValueError, loads, marshal.dumps(tuple(content)))
+
+
+def pickle_handler(pie, flag):
+    """An `extra` handler for `PickleTest`"""
+    print(flag)
+
+
+class PickleTest(unittest.TestCase):
+
+    doc = SerializeTest.doc
+
+    def test_pickle(self):
+        import pickle
+        for config in ({}, {'namedoptions': True, 'errorrecord': True},
+                       {'maxexpansion': 1, 'help': 'short_brief',
+                        'version': '1.0'}):
+            pie = Docpie(self.doc, **config)
+            pie.set_auto_handler('--dump', pickle_handler)
+            pie.docpie('prog go --speed 3 a b')
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                new_pie = pickle.loads(pickle.dumps(pie, protocol))
+                self.assertEqual(dict(new_pie), {})
+                self.assertEqual(new_pie.usages, pie.usages)
+                self.assertEqual(count_elements(new_pie),
+                                 count_elements(pie))
+                self.assertEqual(new_pie.options, pie.options)
+                self.assertEqual(new_pie._help_cache, pie._help_cache)
+                # the match values are not kept
+                self.assertEqual(new_pie.options[''][1][0].value, None)
+                self.assertIs(new_pie.extra['--dump'], pickle_handler)
+                self.assertIs(new_pie.extra['--help'], Docpie.help_handler)
+                self.assertEqual(sorted(new_pie.extra), sorted(pie.extra))
+                self.assertEqual(new_pie.docpie('prog stop a')['<y>'], ['a'])
+                self.assertEqual(new_pie.parse('prog x')['<x>'], 'x')
+
+    def test_elements(self):
+        import pickle
+        pie = Docpie(self.doc, maxexpansion=1)
+        pie.docpie('prog go --speed 3 a b')
+        usage = pie.usages[1]
+        self.assertIsInstance(usage, BranchedUsage)
+        new_usage = pickle.loads(pickle.dumps(usage))
+        self.assertEqual(new_usage, usage)
+        self.assertEqual(new_usage.matched_usage, None)
+        either = usage.usage[0][0]
+        new_either = pickle.loads(pickle.dumps(either))
+        self.assertEqual(new_either, either)
+        self.assertEqual(new_either.matched_branch, -1)
+
+        # only the state to rebuild is kept, not the caches
+        pie = Docpie(self.doc)
+        pie.docpie('prog go --speed 3 a b')
+        pie.parse('prog go a')
+        self.assertIsNotNone(pie._contexts)
+        new_pie = pickle.loads(pickle.dumps(pie, 2))
+        self.assertEqual(new_pie.to_dict(), pie.to_dict())
+        for name in ('_contexts', '_known_flags_cache', '_dispatch_cache'):
+            self.assertIsNone(getattr(new_pie, name), name)
+
+
+class CompactElementTest(unittest.TestCase):
+
+    def test_names(self):
+        option = Option('-a', '--all')
+        copied = option.copy()
+        self.assertIs(copied.names, option.names)
+        self.assertIs(Option('--all', '-a').names, option.names)
+        self.assertIsInstance(option.names, frozenset)
+
+        copied.add_names('-A')
+        self.assertEqual(copied.names, set(['-a', '--all', '-A']))
+        self.assertEqual(option.names, set(['-a', '--all']))
+
+        # the expanded usages share the names
+        pie = Docpie('Usage: prog (a|b) (c|d) [--all]')
+        self.assertEqual(len(pie.usages), 4)
+        names = set(id(usage[0][0].names) for usage in pie.usages)
+        self.assertEqual(len(names), 1)
+
+        # the table is bounded
+        interned = Atom._interned_names
+        for index in range(interned.maxsize + 10):
+            Command('cmd%d' % index)
+        self.assertEqual(len(interned), interned.maxsize)
+        self.assertEqual(Option('--all', '-a').names, option.names)
+
+    def test_names_threads(self):
+        # made and evicted by many threads at the same time
+        interned = Atom._interned_names
+        errors = []
+
+        def make(start):
+            try:
+                for index in range(interned.maxsize):
+                    name = 'cmd%d' % ((start + index) % 5000)
+                    if Command(name).names != set([name]):
+                        errors.append(name)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=make, args=(x * 1000,))
+                   for x in range(4)]
+        for each in threads:
+            each.start()
+        for each in threads:
+            each.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(interned), interned.maxsize)
+
+    def test_slots(self):
+        for each in (Option('-a'), Command('go'), Argument('<x>'),
+                     Required(Argument('<x>')), Optional()):
+            self.assertFalse(hasattr(each, '__dict__'), each)
+
+
+class ArgBoundsTest(unittest.TestCase):
+
+    def test_bounds(self):
+        for unit in (
+                Required(),
+                Required(Argument('<a>')),
+                Required(Argument('<a>'), repeat=True),
+                Optional(Argument('<a>'), Argument('<b>')),
+                Required(Argument('<a>'),
+                         Optional(Argument('<b>'),
+                                  Optional(Argument('<c>'), repeat=True))),
+                Required(Either(Required(Argument('<a>')),
+                                Required(Argument('<b>'), Argument('<c>'))),
+                         Argument('<d>'))):
+            arg_range = unit.arg_range()
+            self.assertEqual(unit.arg_bounds(),
+                             (min(arg_range), max(arg_range)), unit)
+
+    def test_cache(self):
+        unit = Required(Argument('<a>'), Optional(Argument('<b>')))
+        bounds = unit.arg_bounds()
+        self.assertEqual(bounds, (1, 2))
+        self.assertIs(unit.arg_bounds(), bounds)
+
+        unit.append(Argument('<c>'))
+        self.assertEqual(unit.fix().arg_bounds(), (2, 3))
+
+    def test_option(self):
+        pie = Docpie("""
+        Usage: prog [options]
+
+        Options:
+            -f, --file=<a>...  files
+            -n <num>           number
+        """)
+        self.assertEqual(pie.opt_names_required_max_args,
+                         {'-f': float('inf'), '--file': float('inf'),
+                          '-n': 1})
+        self.assertEqual(pie.docpie('prog -f a b -n 1'),
+                         {'-f': ['a', 'b'], '--file': ['a', 'b'],
+                          '-n': '1', '--': False})
+
+
+class BenchSuiteTest(unittest.TestCase):
+
+    def test_sample_argv(self):
+        from docpie.bench.suite import sample_argv
+        pie = Docpie("""
+        Usage: prog (go|stop) [-v] [--speed=<kn>] <name>...
+
+        Options:
+            -v, --verbose
+            --speed=<kn>
+        """, help=False)
+        for usage in pie.usages:
+            argv = sample_argv(usage)
+            self.assertEqual(argv[0], 'prog')
+            self.assertEqual(pie.docpie(argv)['<name>'], ['x'])
+
+    def test_compare(self):
+        from docpie.bench.suite import compare
+        old = {'import_ms': 10.0,
+               'specs': {'a': {'match_us': 100.0, 'peak_kib': 20.0},
+                         'b': {'match_us': 100.0}}}
+        new = {'import_ms': 10.5,
+               'specs': {'a': {'match_us': 150.0, 'peak_kib': None},
+                         'c': {'match_us': 100.0}}}
+        self.assertEqual(compare(old, new, 10),
+                         [('a match_us', 100.0, 150.0, 50.0, True),
+                          ('import_ms', 10.0, 10.5, 5.0, False)])
+
+    def test_parse_importtime(self):
+        from docpie.bench.suite import parse_importtime
+        text = ('import time: self [us] | cumulative | imported package\n'
+                'import time:       100 |        100 |   docpie.log\n'
+                'import time:       300 |        400 | docpie\n')
+        self.assertEqual(parse_importtime(text),
+                         [('docpie.log', 100, 100, 1),
+                          ('docpie', 300, 400, 0)])
+
+
+class StatsTest(unittest.TestCase):
+    doc = """
+    Usage:
+        prog clone [-q] <repo> [<dir>]
+        prog add <path>... <to>
+    """
+
+    def test_off(self):
+        pie = Docpie(self.doc)
+        self.assertIsNone(pie.stats)
+        pie.docpie('prog clone url')
+        self.assertEqual(stats.active, 0)
+
+    def test_stats(self):
+        pie = Docpie(self.doc, stats=True)
+        times = pie.stats.times
+        self.assertTrue(times['usage'] > 0)
+        self.assertTrue(times['option'] > 0)
+        self.assertEqual(times['match'], 0)
+        self.assertEqual(pie.stats.counts['calls'], 0)
+
+        pie.docpie('prog add a b c')
+        counts = pie.stats.counts
+        self.assertTrue(pie.stats.times['match'] > 0)
+        self.assertEqual(counts['calls'], 1)
+        self.assertEqual(counts['usages'], 1)
+        self.assertEqual(counts['balances'], 1)
+        self.assertTrue(counts['matches'] > 0)
+        self.assertTrue(counts['clones'] > 0)
+        self.assertTrue(counts['resets'] > 0)
+
+        pie = docpie(self.doc, 'prog add a b', stats=True)
+        self.assertEqual(pie.stats.counts['calls'], 1)
+        self.assertIsNone(docpie(self.doc, 'prog add a b').stats)
+
+        self.assertRaises(DocpieExit, pie.docpie, 'prog add')
+        self.assertEqual(pie.stats.counts['calls'], 2)
+        self.assertEqual(stats.active, 0)
+
+        pie.stats.reset()
+        self.assertEqual(pie.stats.to_dict(), stats.Stats().to_dict())
+
+    def test_aggregate(self):
+        pie = Docpie(self.doc, stats=True)
+        pie.stats.reset()
+        pie.parse('prog clone url')
+        list(pie.parse_many(['prog clone url', 'prog add a b']))
+        other = Docpie(self.doc, stats=True)
+        other.stats.reset()
+        other.docpie('prog clone url')
+
+        self.assertEqual(pie.stats.counts['calls'], 3)
+        total = pie.stats + other.stats
+        self.assertEqual(total.counts['calls'], 4)
+        self.assertEqual(total.counts['usages'],
+                         pie.stats.counts['usages'] +
+                         other.stats.counts['usages'])
+
+    def test_config(self):
+        pie = Docpie(self.doc, stats=True)
+        self.assertTrue(pie.to_dict()['__config__']['stats'])
+        self.assertIsNotNone(Docpie.from_dict(pie.to_dict()).stats)
+        pie.set_config(stats=False)
+        self.assertIsNone(pie.stats)
+        self.assertIsNone(Docpie.from_dict(pie.to_dict()).stats)
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def run_python(self, code):
+        env = dict(os.environ)
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = path
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env)
+        return json.loads(output.decode('utf-8'))
+
+    def test_import(self):
+        if sys.version_info < (3, 7):
+            return
+        code = (
+            'import sys, json, docpie\n'
+            'before = [x for x in sys.modules if x.startswith("docpie")]\n'
+            'docpie.Docpie("Usage: prog [-v]").docpie("prog -v")\n'
+            'after = [x for x in sys.modules if x.startswith("docpie")]\n'
+            'print(json.dumps([before, after]))\n')
+        before, after = self.run_python(code)
+        self.assertEqual(before, ['docpie'])
+        self.assertIn('docpie.pie', after)
+        self.assertNotIn('docpie.cache', after)
+
+        # the submodules are still attributes after `import docpie`
+        code = (
+            'import json, docpie\n'
+            'print(json.dumps([docpie.error.DocpieExit.__name__,\n'
+            '                  docpie.element.Option.__name__,\n'
+            '                  hasattr(docpie, "not_exists")]))\n')
+        self.assertEqual(self.run_python(code),
+                         ['DocpieExit', 'Option', False])
+
+    def test_attrs(self):
+        import docpie as module
+        from docpie.pie import Docpie as PieDocpie
+        self.assertIs(module.Docpie, PieDocpie)
+        self.assertIs(module.ErrorRecord, ErrorRecord)
+        self.assertIs(module.logger, logging.getLogger('docpie'))
+        self.assertEqual(module.__version__, Docpie._version)
+        self.assertIn('Docpie', dir(module))
+        self.assertRaises(AttributeError, getattr, module, 'not_exists')
+
+    def test_pattern(self):
+
+        class Sample(object):
+            number_re = LazyPattern(r'\d+')
+
+        class Child(Sample):
+            pass
+
+        self.assertIsInstance(Sample.__dict__['number_re'], LazyPattern)
+        self.assertEqual(Child().number_re.findall('a1b22'), ['1', '22'])
+        self.assertIs(Sample.__dict__['number_re'], Child.number_re)
+        self.assertEqual(Sample.number_re.pattern, r'\d+')
+
+
+class IncrementalConfigTest(unittest.TestCase):
+    doc = """
+    Usage:
+        prog [options] <file>...
+        prog -a -b -c <file>
+        prog --long=<value> [-o <out>]
+
+    Options:
+        -a, --all           All
+        -b                  B
+        -c                  C
+        -o <out>            Output [default: out.txt]
+        --long=<value>      Long
+    """
+
+    argvs = (['prog', '-ab', 'x'],
+             ['prog', '-abc', 'x'],
+             ['prog', '--long=v', '-oy'],
+             ['prog', '--all', 'x', 'y'])
+
+    changes = (
+        {'stdopt': False},
+        {'attachopt': False},
+        {'attachvalue': False},
+        {'namedoptions': True},
+        {'maxexpansion': 1},
+        {'name': 'prog'},
+        {'stdopt': False, 'name': 'prog'},
+    )
+
+    def assert_same_as_new(self, pie, config):
+        config = dict(config, errorrecord=True)
+        fresh = Docpie(self.doc, **config)
+        self.assertEqual(pie.to_dict(), fresh.to_dict())
+        self.assertEqual(pie.opt_names, fresh.opt_names)
+        for argv in self.argvs:
+            result = pie.docpie(argv)
+            expected = fresh.docpie(argv)
+            self.assertEqual(type(result), type(expected))
+            if isinstance(result, ErrorRecord):
+                self.assertEqual(result.message, expected.message)
+            else:
+                self.assertEqual(dict(result), dict(expected))
+
+    def test_same_as_new(self):
+        for config in self.changes:
+            pie = Docpie(self.doc, errorrecord=True)
+            pie.set_config(**config)
+            self.assert_same_as_new(pie, config)
+
+    def test_change_back(self):
+        pie = Docpie(self.doc, errorrecord=True)
+        for config in self.changes:
+            pie.set_config(**config)
+            self.assert_same_as_new(pie, config)
+            pie.set_config(**dict((key, getattr(Docpie, key))
+                                  for key in config))
+            self.assert_same_as_new(pie, {})
+
+    def test_reuse(self):
+        pie = Docpie(self.doc, errorrecord=True)
+        source, sections, lines = pie._parsed_stages
+
+        pie.set_config(stdopt=False, namedoptions=True)
+        self.assertIs(pie._parsed_stages[1], sections)
+        self.assertIs(pie._parsed_stages[2], lines)
+
+        pie.set_config(name='prog')
+        self.assertIs(pie._parsed_stages[1], sections)
+        self.assertIsNot(pie._parsed_stages[2], lines)
+
+        pie.set_config(case_sensitive=True)
+        self.assertIsNot(pie._parsed_stages[1], sections)
+
+    def test_not_parsed(self):
+        pie = Docpie(self.doc, errorrecord=True)
+        usages = pie.usages
+        pie.set_config(stdopt=True, auto2dashes=False)
+        self.assertIs(pie.usages, usages)
+        pie.set_config(maxexpansion=2)
+        self.assertIsNot(pie.usages, usages)
+
+
+# imported by `SubcommandTest` by its path
+SHIP_DOC = """
+Usage:
+  naval_fate.py ship new <name>...
+  naval_fate.py ship <name> move <x> <y> [--speed=<kn>]
+  naval_fate.py ship shoot <x> <y>
+
+Options:
+  --speed=<kn>  Speed in knots [default: 10].
+"""
+
+
+class SubcommandTest(unittest.TestCase):
+    doc = """
+    Usage:
+        prog [-v] <command> [<args>...]
+
+    Options:
+        -v, --verbose
+    """
+
+    remote_doc = """
+    Usage:
+        prog remote <command> [<args>...]
+    """
+
+    rename_doc = """
+    Usage:
+        prog rename [-f] <old> <new>
+    """
+
+    def make_pie(self, **config):
+        pie = Docpie(self.doc, optionsfirst=True, **config)
+        pie.add_command('ship', path='docpie.test:SHIP_DOC')
+        # never imported unless dispatched
+        pie.add_command('broken', path='docpie.not_exists')
+        return pie
+
+    def test_dispatch(self):
+        pie = self.make_pie()
+        sub = pie.dispatch('prog -v ship new a b')
+        self.assertTrue(pie['-v'])
+        self.assertEqual(pie['<args>'], ['new', 'a', 'b'])
+        self.assertTrue(sub['ship'])
+        self.assertTrue(sub['new'])
+        self.assertEqual(sub['<name>'], ['a', 'b'])
+
+        self.assertIsNone(pie.commands['broken'].pie)
+        self.assertIs(pie.dispatch('prog ship shoot 1 2'), sub)
+        self.assertEqual((sub['<x>'], sub['<y>']), ('1', '2'))
+
+    def test_handler(self):
+        pie = Docpie(self.doc, optionsfirst=True)
+        calls = []
+
+        def handler(parent, sub):
+            calls.append((parent['-v'], sub['<name>']))
+            return 'done'
+
+        pie.add_command('ship', path='docpie.test:SHIP_DOC',
+                        handler=handler)
+        self.assertEqual(pie.dispatch('prog -v ship new a'), 'done')
+        self.assertEqual(calls, [(True, ['a'])])
+
+    def test_nested(self):
+        pie = Docpie(self.doc, optionsfirst=True)
+        remote = pie.add_command('remote', self.remote_doc,
+                                 optionsfirst=True)
+        remote.add_command('rename', self.rename_doc)
+        sub = pie.dispatch('prog remote rename -f a b')
+        self.assertEqual(remote.pie['<args>'], ['-f', 'a', 'b'])
+        self.assertIs(sub, remote.commands['rename'].pie)
+        self.assertTrue(sub['-f'])
+        self.assertEqual((sub['<old>'], sub['<new>']), ('a', 'b'))
+
+    def test_global_option(self):
+        pie = Docpie(self.doc, optionsfirst=True)
+        remote = pie.add_command('remote', self.remote_doc,
+                                 optionsfirst=True)
+        remote.add_command('rename', self.rename_doc)
+        pie.add_command('ship', path='docpie.test:SHIP_DOC')
+
+        sub = pie.dispatch('prog -v ship new a')
+        self.assertTrue(sub['-v'])
+        self.assertTrue(sub['--verbose'])
+        self.assertEqual(sub['<name>'], ['a'])
+        sub = pie.dispatch('prog ship new a')
+        self.assertFalse(sub['-v'])
+
+        sub = pie.dispatch('prog --verbose remote rename -f a b')
+        self.assertTrue(sub['-v'])
+        self.assertTrue(sub['-f'])
+
+        # the subcommand's own value is kept
+        pie.add_command('level', '''
+        Usage: prog level [--verbose=<n>]
+
+        Options:
+            --verbose=<n>   [default: 2]
+        ''')
+        sub = pie.dispatch('prog -v level')
+        self.assertTrue(sub['-v'])
+        self.assertEqual(sub['--verbose'], '2')
+        sub = pie.dispatch('prog level --verbose=3')
+        self.assertFalse(sub['-v'])
+        self.assertEqual(sub['--verbose'], '3')
+
+    def test_copy_and_pickle(self):
+        import copy
+        import pickle
+
+        pie = Docpie(self.doc, optionsfirst=True)
+        pie.add_command('ship', path='docpie.test:SHIP_DOC')
+        for each in (copy.copy(pie), pie._new_context(),
+                     pickle.loads(pickle.dumps(pie))):
+            self.assertEqual(list(each.commands), ['ship'])
+            sub = each.dispatch('prog -v ship new a')
+            self.assertTrue(sub['-v'])
+            self.assertEqual(sub['<name>'], ['a'])
+        self.assertEqual(pie.parse('prog ship new a')['<args>'],
+                         ['new', 'a'])
+        for context in pie._contexts:
+            self.assertIs(context.commands, pie.commands)
+
+    def test_unknown(self):
+        pie = self.make_pie()
+        self.assertRaises(UnknownCommandExit, pie.dispatch, 'prog -v nope')
+        pie.set_config(errorrecord=True)
+        record = pie.dispatch('prog -v nope x')
+        self.assertIsInstance(record, ErrorRecord)
+        self.assertIs(record.error_class, UnknownCommandExit)
+        self.assertEqual((record.token, record.index), ('nope', 2))
+        self.assertIn('Unknown command: nope.', record.message)
+
+        # the error of the subcommand
+        record = pie.dispatch('prog ship new')
+        self.assertIsInstance(record, ErrorRecord)
+        self.assertIn('naval_fate.py ship new', record.message)
+
+    def test_no_command(self):
+        doc = """
+        Usage: prog [<command> [<args>...]]
+        """
+        pie = Docpie(doc, optionsfirst=True)
+        self.assertIsNone(pie.dispatch('prog'))
+
+    def test_config(self):
+        pie = self.make_pie(stdopt=False, appearedonly=True, stats=True)
+        ship = pie.commands['ship']
+        sub = pie.dispatch('prog ship new a')
+        self.assertFalse(sub.stdopt)
+        self.assertTrue(sub.appeared_only)
+        self.assertFalse(sub.options_first)
+        self.assertIs(sub.stats, pie.stats)
+        self.assertEqual(pie.stats.counts['calls'], 2)
+        self.assertIs(ship.pie, sub)
+
+        pie.add_command('other', 'Usage: prog other <x>',
+                        stdopt=True, help=False)
+        other = pie.dispatch('prog other a')
+        self.assertTrue(other.stdopt)
+        self.assertFalse(other.help)
+
+    def test_register(self):
+        pie = Docpie(self.doc)
+        self.assertRaises(ValueError, pie.add_command, 'ship')
+        self.assertRaises(ValueError, pie.add_command, 'ship',
+                          self.rename_doc, 'docpie.not_exists')
+        self.assertIsNone(Docpie.commands)
+
+
 def case():
     return (
         unittest.TestLoader().loadTestsFromTestCase(BasicTest),
@@ -2940,6 +4571,27 @@ def case():
         unittest.TestLoader().loadTestsFromTestCase(APITest),
         unittest.TestLoader().loadTestsFromTestCase(NewErrorTest),
         unittest.TestLoader().loadTestsFromTestCase(IssueTest),
+        unittest.TestLoader().loadTestsFromTestCase(CacheTest),
+        unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase,
+                               compiled_tests)),
+        unittest.TestLoader().loadTestsFromTestCase(CompileFileTest),
+        unittest.TestLoader().loadTestsFromTestCase(LazyTest),
+        unittest.TestSuite(map(unittest.TestLoader().loadTestsFromTestCase,
+                               branched_tests)),
+        unittest.TestLoader().loadTestsFromTestCase(MaxExpansionTest),
+        unittest.TestLoader().loadTestsFromTestCase(TokenCacheTest),
+        unittest.TestLoader().loadTestsFromTestCase(ParseTest),
+        unittest.TestLoader().loadTestsFromTestCase(ErrorRecordTest),
+        unittest.TestLoader().loadTestsFromTestCase(HelpTextTest),
+        unittest.TestLoader().loadTestsFromTestCase(SerializeTest),
+        unittest.TestLoader().loadTestsFromTestCase(PickleTest),
+        unittest.TestLoader().loadTestsFromTestCase(CompactElementTest),
+        unittest.TestLoader().loadTestsFromTestCase(ArgBoundsTest),
+        unittest.TestLoader().loadTestsFromTestCase(BenchSuiteTest),
+        unittest.TestLoader().loadTestsFromTestCase(StatsTest),
+        unittest.TestLoader().loadTestsFromTestCase(LazyImportTest),
+        unittest.TestLoader().loadTestsFromTestCase(IncrementalConfigTest),
+        unittest.TestLoader().loadTestsFromTestCase(SubcommandTest),
     )
 
 
@@ -1,8 +1,85 @@
 import logging
+from bisect import bisect_left
+from itertools import count
+from docpie import log, stats
 from docpie.error import DocpieError, UnknownOptionExit, AmbiguousPrefixExit
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6, evicts in arbitrary order
+    OrderedDict = dict
+
 logger = logging.getLogger('docpie.tokens')
 
+# every change of an `Argv` gets a new version, so the same version always
+# means the same content, even across the clones
+_versions = count()
+
+
+class TokenCache(object):
+    """A bounded cache of `func(token)`, the least recently used tokens
+    are evicted when full.
+
+    `maxsize` None means unbounded, 0 means no caching. `hits`, `misses`
+    and `evictions` count the calls of `get`. It can be shared by threads,
+    but the counters are not exact then."""
+
+    _missing = object()
+
+    def __init__(self, func, maxsize=1024):
+        self.func = func
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, token):
+        data = self._data
+        result = data.get(token, self._missing)
+        if result is not self._missing:
+            self.hits += 1
+            # mark as recently used. Another thread may have removed it,
+            # and the counters may lose some counts: it's only a cache
+            try:
+                del data[token]
+            except KeyError:
+                pass
+            data[token] = result
+            return result
+
+        self.misses += 1
+        result = self.func(token)
+        maxsize = self.maxsize
+        if maxsize is not None:
+            if maxsize <= 0:
+                return result
+            while len(data) >= maxsize:
+                try:
+                    del data[next(iter(data))]
+                except (KeyError, StopIteration):
+                    continue
+                self.evictions += 1
+        data[token] = result
+        return result
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '%s(hits=%d, misses=%d, evictions=%d, size=%d, maxsize=%r)' % (
+            self.__class__.__name__, self.hits, self.misses,
+            self.evictions, len(self._data), self.maxsize)
+
 
 class Token(list):
     _brackets = {'(': ')', '[': ']'}  # , '{': '}', '<': '>'}
@@ -40,11 +117,19 @@ class Token(list):
 
 
 class Argv(list):
+    """The argv to match.
+
+    Every change is recorded in an undo journal, so `dump_value` is a
+    snapshot of `(version, journal length)` and `load_value` only undoes
+    the changes since then. `status` returns the version, which is enough
+    to tell if argv changed."""
 
     def __init__(self, argv, auto2dashes,
-                 stdopt, attachopt, attachvalue, known={}):
+                 stdopt, attachopt, attachvalue, known={}, long_names=None):
 
         super(Argv, self).__init__(argv)
+        self.version = next(_versions)
+        self._journal = []
         self.auto_dashes = auto2dashes
         self.dashes = False
         # when this is on, only --option can try to match.
@@ -54,6 +139,13 @@ class Argv(list):
         self.attachvalue = attachvalue
         self.error = None
         self.known = known
+        # sorted long flags of `known`, for prefix matching
+        self.long_names = long_names
+        # a superset of the option names that can be found in this argv.
+        # None means unknown
+        self.flags = None
+        # the `TokenCache` of `Atom.get_class`, None for the default one
+        self.class_cache = None
 
     def formal(self, options_first):
         names = self.known
@@ -115,8 +207,7 @@ class Argv(list):
                     else:
                         expect_args = names[option]
                 else:
-                    possible = list(
-                        filter(lambda x: x.startswith(option), names))
+                    possible = self.find_long_prefix(option)
                     if not possible:
                         self.error = UnknownOptionExit(
                             'Unknown option: %s.' % option,
@@ -132,7 +223,8 @@ class Argv(list):
                         # result.append(each)
                     elif len(possible) == 1:
                         replace = ''.join((possible[0], equal, value))
-                        logger.debug('expand %s -> %s', each, replace)
+                        if log.enabled:
+                            logger.debug('expand %s -> %s', each, replace)
                         result.append(replace)
                     else:
                         self.error = AmbiguousPrefixExit(
@@ -154,10 +246,50 @@ class Argv(list):
                 skip = len(to_append)
                 result.extend(to_append)
 
-        logger.debug('%s -> %s', self, result)
-        self[:] = result
+        if log.enabled:
+            logger.debug('%s -> %s', self, result)
+        # nothing to undo before formal
+        list.__setitem__(self, slice(None), result)
+        self.version = next(_versions)
+        self.flags = self.scan_flags()
         return None
 
+    def find_long_prefix(self, prefix):
+        """Return the known long flags starting with `prefix`, sorted"""
+        names = self.long_names
+        if names is None:
+            names = self.long_names = sorted(
+                x for x in self.known if x.startswith('--'))
+
+        result = []
+        index = bisect_left(names, prefix)
+        while index < len(names) and names[index].startswith(prefix):
+            result.append(names[index])
+            index += 1
+        return result
+
+    def scan_flags(self):
+        """Return the set of names that `break_for_option` may find.
+
+        As the elements only get consumed, split (`-abc` -> `-a`, `-bc`)
+        or moved later, it's still a superset after matching."""
+        flags = set()
+        stacked = self.stdopt and self.attachopt
+        for each in self:
+            if not each.startswith('-') or each in ('-', '--'):
+                continue
+            key = each.partition('=')[0]
+            if stacked and not key.startswith('--'):
+                flags.update('-' + char for char in each[1:])
+            else:
+                flags.update(key[:end] for end in range(2, len(key) + 1))
+        return flags
+
+    def may_have(self, names):
+        """Return False if none of `names` can be in this argv"""
+        flags = self.flags
+        return flags is None or not flags.isdisjoint(names)
+
     def current(self, offset=0):
         return self[offset] if len(self) > offset else None
 
@@ -176,15 +308,19 @@ class Argv(list):
             else:
                 flag = object
             fine = (flag in self.known)
-            logger.debug('%s has flag %s, is known: %s', object, flag, fine)
+            if log.enabled:
+                logger.debug('%s has flag %s, is known: %s',
+                             object, flag, fine)
 
         if (index <= dashes_index and fine or
                 index > dashes_index or
                 fine):
-            logger.debug('insert %s into %s at %s', object, self, index)
-            return super(Argv, self).insert(index, object)
+            if log.enabled:
+                logger.debug('insert %s into %s at %s', object, self, index)
+            return self._insert(index, object)
 
-        logger.debug('%s not in %s', flag, self.known)
+        if log.enabled:
+            logger.debug('%s not in %s', flag, self.known)
         # self.error = 'Unknown option: %s.' % flag
         raise UnknownOptionExit('Unknown option: %s.' % flag,
                                 option=flag,
@@ -197,6 +333,8 @@ class Argv(list):
         for index, option in enumerate(self):
             if option == '--' and auto_dashes:
                 return None, None, 0, option
+            if not option.startswith('-'):
+                continue
             for name in names:
                 if option.startswith(name):
                     value = None
@@ -225,8 +363,9 @@ class Argv(list):
                         elif not value:
                             value = None
 
-                    logger.debug('find %s, attached %s, index %s of %s',
-                                 name, value, index, self)
+                    if log.enabled:
+                        logger.debug('find %s, attached %s, index %s of %s',
+                                     name, value, index, self)
                     return name, value, index, option
 
         return None, None, 0, None
@@ -234,33 +373,112 @@ class Argv(list):
     def next(self, offset=0):
         return self.pop(offset) if len(self) > offset else None
 
+    def _changed(self, undo):
+        self._journal.append(undo)
+        self.version = next(_versions)
+
+    def pop(self, index=-1):
+        if index < 0:
+            index += len(self)
+        result = super(Argv, self).pop(index)
+        self._changed((list.insert, index, result))
+        return result
+
+    def _insert(self, index, object):
+        length = len(self)
+        if index < 0:
+            index = max(0, index + length)
+        index = min(index, length)
+        super(Argv, self).insert(index, object)
+        self._changed((list.pop, index))
+
+    def append(self, object):
+        self._insert(len(self), object)
+
+    def extend(self, iterable):
+        start = len(self)
+        super(Argv, self).extend(iterable)
+        self._changed((list.__delitem__, slice(start, None)))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice) and index.step is None:
+            start, stop, _ = index.indices(len(self))
+            stop = max(start, stop)
+            removed = self[start:stop]
+            super(Argv, self).__delitem__(slice(start, stop))
+            self._changed((list.__setitem__, slice(start, start), removed))
+        else:
+            self._changed((list.__setitem__, slice(None), list(self)))
+            super(Argv, self).__delitem__(index)
+
+    def __setitem__(self, index, value):
+        self._changed((list.__setitem__, slice(None), list(self)))
+        super(Argv, self).__setitem__(index, value)
+
+    # Python 2 calls `__delslice__`/`__setslice__` for `argv[i:j]`
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, j))
+
+    def __setslice__(self, i, j, sequence):
+        self.__setitem__(slice(i, j), sequence)
+
+    def _rollback(self, length):
+        journal = self._journal
+        while len(journal) > length:
+            undo = journal.pop()
+            undo[0](self, *undo[1:])
+
+    def all_consumed(self):
+        """Return True if nothing left, or only `--` left"""
+        return not self or (self.auto_dashes and list(self) == ['--'])
+
     def check_dash(self):
         if not self:
             return
         if self[0] == '--':
             self.dashes = True
 
-    def clone(self):
-        result = Argv(self, self.auto_dashes,
-                      self.stdopt, self.attachopt, self.attachvalue)
+    def clone(self, argv=None):
+        """Return a new Argv with the same config. The content is
+        `argv` if given, otherwise the same as this one"""
+        if stats.active:
+            stats.count('clones')
+        if argv is None:
+            result = Argv(self, self.auto_dashes,
+                          self.stdopt, self.attachopt, self.attachvalue)
+            result.version = self.version
+        else:
+            result = Argv(argv, self.auto_dashes,
+                          self.stdopt, self.attachopt, self.attachvalue)
         result.dashes = self.dashes
         result.option_only = self.option_only
         result.error = self.error
         result.known = self.known
+        result.long_names = self.long_names
+        result.flags = self.flags
+        result.class_cache = self.class_cache
         return result
 
     def restore(self, ins):
-        self[:] = ins
+        if ins.version != self.version:
+            self[:] = ins
+            self.version = ins.version
         self.dashes = ins.dashes
         self.option_only = ins.option_only
         self.error = ins.error
 
     def status(self):
-        # return len(self)
-        return list(self)
+        return self.version
 
     def dump_value(self):
-        return list(self), self.dashes, self.option_only
+        if stats.active:
+            stats.count('dumps')
+        return (self.version, len(self._journal),
+                self.dashes, self.option_only)
 
     def load_value(self, value):
-        self[:], self.dashes, self.option_only = value
+        if stats.active:
+            stats.count('loads')
+        version, length, self.dashes, self.option_only = value
+        self._rollback(length)
+        self.version = version
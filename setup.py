@@ -6,7 +6,7 @@ from docpie import __version__
 
 setup(
     name="docpie",
-    packages=["docpie"],
+    packages=["docpie", "docpie.bench"],
     package_data={
         '': [
             'README.rst',